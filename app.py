@@ -4,10 +4,12 @@ CVD Expert System - Flask Backend API
 Provides diagnosis endpoints and serves frontend.
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 import os
 from services.sparql_service import SparqlService
-import uuid
+import hmac
+import threading
+import time
 from datetime import datetime
 from azure.cosmos import CosmosClient
 import json
@@ -17,6 +19,20 @@ import json
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from services.knowledge_service import KnowledgeService
+from services.warmup import Warmup
+from services.resource_governor import ReasonerBusy
+from services.priority import classify_priority
+from services.idempotency import IdempotencyStore, IdempotencyConflict
+from services.hot_reload import OntologyReloader
+from services.shadow import ShadowEvaluator
+from services.response_format import shape_result, encode, description_ref, wants_trace
+from services.static_assets import StaticAssets
+from services.memory_supervisor import MemorySupervisor
+from services.memory_profile import world_report, allocation_sites, save_report, ProfileBusy
+from services.history_record import build_record, expand_record, summary_of
+from services.history_export import (
+    FORMATS, ExportUnavailable, cosmos_rows, sparql_rows, export_chunks, parse_bound
+)
 
 app = Flask(__name__, static_folder='static')
 
@@ -37,22 +53,114 @@ COSMOS_CONN_STR = os.environ.get('COSMOS_DB_CONNECTION_STRING')
 COSMOS_DB_NAME = os.environ.get('COSMOS_DB_DATABASE_NAME', 'CVDExpertSystem')
 COSMOS_CONTAINER_NAME = os.environ.get('COSMOS_DB_CONTAINER_NAME', 'DiagnosisHistory')
 
+# Seconds between SSE keep-alive comments while the reasoner runs
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '2'))
+
 
 # Initialize knowledge service (lazily)
 knowledge_service = None
+_ks_lock = threading.Lock()
+
+PROCESS_STARTED = time.time()
 
 
 def get_knowledge_service():
-    """Get or create knowledge service instance."""
+    """Get or create knowledge service instance (pinned for the rest of the request)."""
     global knowledge_service
-    if knowledge_service is None:
-        if not os.path.exists(OWL_FILE):
-            raise FileNotFoundError(
-                f"Ontology file not found: {OWL_FILE}. "
-                "Please run build_ontology.py first."
-            )
-        knowledge_service = KnowledgeService(OWL_FILE)
-    return knowledge_service
+    if has_request_context() and "knowledge_service" in g:
+        return g.knowledge_service
+    with _ks_lock:
+        if knowledge_service is None:
+            if not os.path.exists(OWL_FILE):
+                raise FileNotFoundError(
+                    f"Ontology file not found: {OWL_FILE}. "
+                    "Please run build_ontology.py first."
+                )
+            knowledge_service = KnowledgeService(OWL_FILE)
+        ks = knowledge_service
+        if has_request_context():
+            # Pinned under the lock, so a swap never retires an instance a request is about to use
+            ks.acquire()
+            g.knowledge_service = ks
+    return ks
+
+
+@app.teardown_request
+def release_knowledge_service(exc=None):
+    """Unpin the request's instance (for a stream, after its last chunk)."""
+    ks = g.pop("knowledge_service", None)
+    if ks is not None:
+        ks.release()
+
+
+def hand_over_sessions(old_service, new_service):
+    """Follow-up visits of recent patients diagnosed on the old instance keep working."""
+    return new_service.adopt_sessions(memory_supervisor.sessions_to_keep(old_service.incremental.export()))
+
+
+def replace_knowledge_service(new_service):
+    """
+    Atomic swap: requests already running keep the instance they fetched. The old
+    instance closes its world once they finish, handing over the sessions they added.
+    """
+    global knowledge_service
+    with _ks_lock:
+        old_service = knowledge_service
+        if old_service is not None:
+            hand_over_sessions(old_service, new_service)
+        knowledge_service = new_service
+    if old_service is not None:
+        old_service.retire(lambda old: hand_over_sessions(old, new_service))
+
+
+def build_knowledge_service():
+    """Fresh instance from the current ontology file, sharing the reasoner governor."""
+    return KnowledgeService(OWL_FILE, governor=get_knowledge_service().governor)
+
+
+# Background warm-up (ontology, indexes, synthetic diagnoses) gating /api/ready
+warmup = Warmup(get_knowledge_service)
+
+# Ontology hot reload (admin endpoint or ONTOLOGY_WATCH_S file watcher)
+reloader = OntologyReloader(OWL_FILE, get_knowledge_service, build_knowledge_service, replace_knowledge_service)
+
+# Rebuilds the service from the ontology file when the world or RSS grows past MEMORY_MAX_* limits
+memory_supervisor = MemorySupervisor(get_knowledge_service, lambda reason: reloader.trigger(reason, force=True))
+
+
+def build_shadow_candidate(path: str):
+    """
+    Candidate ontology for shadow runs: reasons through the live governor as background
+    work (shed unless a slot is free, never queued ahead of patients), no shared result cache.
+    """
+    return KnowledgeService(path, governor=get_knowledge_service().governor, use_result_cache=False, background=True)
+
+
+# Shadow evaluation of a candidate ontology (SHADOW_ONTOLOGY) on sampled live diagnoses
+shadow = ShadowEvaluator(build_shadow_candidate)
+
+# Retried submissions (Idempotency-Key header / identical payload) replay the first result
+submissions = IdempotencyStore()
+
+# Minified, fingerprinted, precompressed frontend (built on the first page load)
+static_assets = StaticAssets(app.static_folder)
+
+
+@app.before_request
+def ensure_warmup_started():
+    """Under a WSGI server there is no __main__; start warm-up with the first request (e.g. a probe)."""
+    warmup.start()
+    reloader.start_watching()
+    memory_supervisor.start()
+
+
+@app.after_request
+def add_ontology_version(response):
+    """Every response names the ontology version that produced it."""
+    ks = g.get("knowledge_service", knowledge_service)
+    if ks is not None:
+        response.headers["X-Ontology-Version"] = ks.ontology_version[:16]
+    return response
 
 
 def init_cosmos_container():
@@ -81,15 +189,9 @@ def save_to_history(result: dict, patient_data: dict):
     container = init_cosmos_container()
     if container:
         try:
-            # Prepare item for Cosmos DB
-            item = {
-                "id": str(uuid.uuid4()),  # Unique ID for the record
-                "patient_id": result.get('patient_id', 'unknown'),
-                "timestamp": result.get('timestamp', datetime.now().isoformat()),
-                "demographics": patient_data.get('demographics', {}),
-                "diagnosis_result": result,
-                "input_data": patient_data
-            }
+            # Compact item: entity ids instead of display text, no trace, precomputed summary row
+            ks = get_knowledge_service()
+            item = build_record(result, patient_data, ks.history_catalog, ks.ontology_version)
             container.create_item(body=item)
             print("Saved to Cosmos DB")
             saved_successfully = True
@@ -209,32 +311,54 @@ def generate_lifestyle_recommendations(diagnoses: list, patient_data: dict) -> l
 
 @app.route('/')
 def index():
-    """Serve the main frontend page."""
-    return send_from_directory(app.static_folder, 'index.html')
+    """Serve the main frontend page (points at the fingerprinted assets)."""
+    return static_assets.serve('index.html', request)
 
 
 @app.route('/<path:path>')
 def static_files(path):
-    """Serve static files."""
-    return send_from_directory(app.static_folder, path)
+    """Serve static files (minified and precompressed; fingerprinted names are immutable)."""
+    return static_assets.serve(path, request)
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
-    try:
-        get_knowledge_service()
-        return jsonify({
-            "status": "healthy",
-            "ontology_loaded": True,
-            "timestamp": datetime.now().isoformat()
-        })
-    except Exception as e:
+    """Health check endpoint (never blocks on ontology loading; see /api/ready)."""
+    if warmup.state["status"] == "failed":
         return jsonify({
             "status": "unhealthy",
-            "error": str(e),
+            "error": warmup.state["error"],
             "timestamp": datetime.now().isoformat()
         }), 500
+    return jsonify({
+        "status": "healthy",
+        "ontology_loaded": knowledge_service is not None,
+        "ready": warmup.ready,
+        "reasoner": knowledge_service.governor.snapshot() if knowledge_service else None,
+        "ontology_version": knowledge_service.ontology_version[:16] if knowledge_service else None,
+        "reload": reloader.state,
+        "memory": memory_supervisor.snapshot(),
+        "submissions": submissions.snapshot(),
+        "result_cache": knowledge_service.result_cache.snapshot() if knowledge_service and knowledge_service.result_cache else None,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/api/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is up and serving HTTP."""
+    return jsonify({
+        "status": "alive",
+        "uptime_s": round(time.time() - PROCESS_STARTED, 1),
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 only after warm-up has run diagnoses through the reasoner."""
+    body = dict(warmup.state, timestamp=datetime.now().isoformat())
+    return jsonify(body), (200 if warmup.ready else 503)
 
 
 @app.route('/api/diagnose', methods=['POST'])
@@ -259,15 +383,35 @@ def diagnose():
         
         # Get knowledge service
         ks = get_knowledge_service()
+        # reasoning_trace is only built when the response keeps it
+        trace = wants_trace(request.args)
         
-        # Run diagnosis (includes lifestyle_recommendations from ontology)
-        result = ks.diagnose(data)
+        def run_diagnosis():
+            # Run diagnosis (includes lifestyle_recommendations from ontology)
+            start = time.perf_counter()
+            result = ks.diagnose(data, trace=trace)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            
+            # Save to History
+            save_to_history(result, data)
+            
+            # Sampled replay against the candidate ontology, off the response path
+            shadow.submit(data, result, elapsed_ms, ks.ontology_version)
+            return result
         
-        # Save to History
-        save_to_history(result, data)
+        # Duplicates within the window get the stored result (no reasoning, no second record)
+        result, replayed = submissions.run(
+            data, run_diagnosis,
+            idempotency_key=request.headers.get('Idempotency-Key'),
+            timeout=ks.governor.queue_timeout + ks.governor.deadline
+        )
         
-        return jsonify(result)
+        return diagnosis_response(ks, result, data, {"Idempotent-Replayed": "true" if replayed else "false"})
         
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except ReasonerBusy as e:
+        return reasoner_busy_response(e)
     except FileNotFoundError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -278,6 +422,218 @@ def diagnose():
         }), 500
 
 
+def diagnosis_response(ks, result: dict, data: dict, headers: dict = None) -> Response:
+    """
+    Diagnosis result shaped by the query arguments (view=compact, trace, fields, exclude)
+    and encoded as the client accepts (MessagePack / gzip, see services/response_format.py).
+    trace=events adds the structured rule trace of the payload.
+    """
+    if request.args.get('trace') == 'events':
+        result = dict(result, trace_events=ks.explain(data, result.get("patient_id")))
+    body, encoding_headers = encode(
+        shape_result(result, request.args, ks.description_index),
+        request.accept_mimetypes, request.accept_encodings
+    )
+    response = Response(body, 200, encoding_headers)
+    response.headers.update(headers or {})
+    return response
+
+
+def reasoner_busy_response(e: ReasonerBusy):
+    """503 with Retry-After when the resource governor sheds a request."""
+    body = {"error": str(e), "retry_after": e.retry_after}
+    if getattr(e, "triage", None):
+        body["triage"] = e.triage
+    return jsonify(body), 503, {"Retry-After": str(e.retry_after)}
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.route('/api/diagnose/stream', methods=['POST'])
+def diagnose_stream():
+    """
+    Streaming diagnosis endpoint (Server-Sent Events).
+    
+    Takes the same JSON body as /api/diagnose and emits one event per stage:
+    accepted, reasoning, diagnoses, medications, contraindications, risk,
+    severity, recommendations and finally complete (the full result).
+    Disconnecting cancels the request and stops the reasoner.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    
+    try:
+        ks = get_knowledge_service()
+        idempotency_key = request.headers.get('Idempotency-Key')
+        stored = submissions.lookup(data, idempotency_key)
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    if stored is not None:
+        # Retried submission: replay the stored result as the final stage
+        return Response(
+            sse_event("complete", stored),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'Idempotent-Replayed': 'true'}
+        )
+    
+    # Shed load before the stream (and its 200) starts
+    if ks.governor.saturated(classify_priority(data, ks.triage(data))):
+        return reasoner_busy_response(ReasonerBusy("Reasoner queue is full", ks.governor.retry_after()))
+    
+    def generate():
+        start = time.perf_counter()
+        stages = ks.diagnose_stages(data, heartbeat=SSE_HEARTBEAT_SECONDS)
+        try:
+            for stage, payload in stages:
+                if stage == "heartbeat":
+                    # SSE comment: keeps proxies from timing out and detects disconnects
+                    yield ": keep-alive\n\n"
+                    continue
+                if stage == "complete":
+                    save_to_history(payload, data)
+                    submissions.remember(data, payload, idempotency_key)
+                    shadow.submit(data, payload, (time.perf_counter() - start) * 1000, ks.ontology_version)
+                yield sse_event(stage, payload)
+        except ReasonerBusy as e:
+            yield sse_event("error", {"error": str(e), "retry_after": e.retry_after, "triage": getattr(e, "triage", None)})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            stages.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/diagnose/sweep', methods=['POST'])
+def diagnose_sweep():
+    """
+    What-if parameter sweep.
+    
+    Expects JSON body with:
+    - base: an /api/diagnose payload
+    - parameters: 1-2 of {field: "vitals.sbp", from: 120, to: 200, step: 1}
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get("base"):
+            return jsonify({"error": "No base payload provided"}), 400
+        
+        ks = get_knowledge_service()
+        return jsonify(ks.what_if(data["base"], data.get("parameters") or []))
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/triage', methods=['POST'])
+def triage():
+    """
+    Emergency triage fast path.
+    
+    Takes the same JSON body as /api/diagnose and evaluates only the ontology
+    rules that lead to a Kritis conclusion, without running the reasoner.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        ks = get_knowledge_service()
+        return jsonify(ks.triage(data))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/contraindications/check', methods=['POST'])
+def check_contraindications():
+    """
+    Fast contraindication check without reasoning.
+    
+    Expects JSON body with:
+    - medications: ["Bisoprolol", "Statin", ...] (drug or drug class names)
+    - comorbid: {asthma, pregnancy, liver_disease}
+    - labs: {gfr, potassium}
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('medications'):
+            return jsonify({"error": "No medications provided"}), 400
+        
+        ks = get_knowledge_service()
+        return jsonify(ks.check_contraindications(data))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/patients/<patient_id>/observations', methods=['PUT'])
+def update_observations(patient_id):
+    """
+    Record follow-up observations for a patient diagnosed earlier.
+    
+    Body is a partial /api/diagnose payload, e.g. {"labs": {"gfr": 25}};
+    null removes a value and "symptoms" replaces the list.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        ks = get_knowledge_service()
+        return jsonify(ks.update_observations(patient_id, data))
+        
+    except KeyError:
+        return jsonify({"error": f"Unknown patient: {patient_id}"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/patients/<patient_id>/diagnose', methods=['POST'])
+def rediagnose(patient_id):
+    """Incremental re-diagnosis after observation updates, with a diff against the previous result."""
+    try:
+        ks = get_knowledge_service()
+        result = ks.rediagnose(patient_id)
+        
+        # Save to History
+        payload = ks.incremental.get(patient_id).payload
+        save_to_history(result, payload)
+        
+        return diagnosis_response(ks, result, payload)
+        
+    except ReasonerBusy as e:
+        return reasoner_busy_response(e)
+    except KeyError:
+        return jsonify({"error": f"Unknown patient: {patient_id}"}), 404
+    except Exception as e:
+        import traceback
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     """Get diagnosis history."""
@@ -311,41 +667,79 @@ def get_history_from_cosmos():
         return None
         
     try:
-        # Query latest 50 items
-        query = "SELECT * FROM c ORDER BY c.timestamp DESC OFFSET 0 LIMIT 50"
-        items = list(container.query_items(
+        # Latest 50 items; compact records only carry their precomputed summary row,
+        # older items still need the full result to be flattened
+        query = (
+            "SELECT c.format, c.summary, c.demographics, c.diagnosis_result "
+            "FROM c ORDER BY c.timestamp DESC OFFSET 0 LIMIT 50"
+        )
+        items = container.query_items(
             query=query,
             enable_cross_partition_query=True
-        ))
-        
-        # Transform to flat format for frontend compatibility
-        history = []
-        for item in items:
-            res = item.get('diagnosis_result', {})
-            demo = item.get('demographics', {})
-            
-            flat = {
-                'timestamp': res.get('timestamp'),
-                'patient_name': demo.get('name', 'Unknown'),
-                'age': demo.get('age', ''),
-                'gender': demo.get('gender', ''),
-                'diagnoses': '; '.join([d['name'] for d in res.get('diagnoses', [])]),
-                'medications': '; '.join([m['name'] for m in res.get('medications', [])]),
-                'contraindications': '; '.join([c['drug'] for c in res.get('contraindications', [])]),
-                'risk_category': res.get('risk_category', ''),
-                'ascvd_score': res.get('ascvd_score', ''),
-                'severity': res.get('severity', ''),
-                'rules_fired': res.get('rules_fired', 0),
-                'emergency': res.get('emergency', False)
-            }
-            history.append(flat)
-            
-        return history
+        )
+        return [summary_of(item) for item in items]
     except Exception as e:
         print(f"Error querying Cosmos: {e}")
         return None
 
 
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """
+    Full history as a streamed download: ?format=ndjson|csv|parquet, optional ?from= / ?to=
+    (ISO date or datetime; a date-only `to` includes that day). Read page by page from Cosmos DB
+    or, without it, the SPARQL store.
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        start = parse_bound(request.args.get('from'))
+        end = parse_bound(request.args.get('to'), end=True)
+        
+        container = init_cosmos_container() if COSMOS_CONN_STR else None
+        sparql_endpoint = os.environ.get("SPARQL_ENDPOINT")
+        if container is not None:
+            rows = cosmos_rows(container, start, end)
+        elif sparql_endpoint:
+            rows = sparql_rows(SparqlService(sparql_endpoint), start, end)
+        else:
+            return jsonify({"error": "No history backend configured"}), 503
+        
+        chunks = export_chunks(rows, fmt)
+        filename = f"history-{datetime.now().strftime('%Y%m%dT%H%M%S')}.{fmt}"
+        return Response(stream_with_context(chunks), mimetype=FORMATS[fmt], headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store"
+        })
+        
+    except ExportUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/history/<patient_id>', methods=['GET'])
+def get_patient_history(patient_id):
+    """Full history records of one patient (Cosmos DB), display text resolved from the ontology."""
+    try:
+        container = init_cosmos_container()
+        if container is None:
+            return jsonify({"error": "Cosmos DB not available"}), 503
+        
+        items = container.query_items(
+            query="SELECT * FROM c WHERE c.patient_id = @patient_id ORDER BY c.timestamp DESC",
+            parameters=[{"name": "@patient_id", "value": patient_id}],
+            partition_key=patient_id
+        )
+        catalog = get_knowledge_service().history_catalog
+        history = [expand_record(item, catalog) for item in items]
+        return jsonify({"patient_id": patient_id, "count": len(history), "history": history})
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/ontology/stats', methods=['GET'])
 def ontology_stats():
     """Get ontology statistics."""
@@ -376,6 +770,139 @@ def get_descriptions():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/descriptions/texts', methods=['GET'])
+def get_description_texts():
+    """
+    Description texts referenced by compact diagnosis responses (description_ref -> text).
+    ?ref=a,b limits the answer to those refs; constant per ontology version (ETag).
+    """
+    try:
+        ks = get_knowledge_service()
+        refs = request.args.get('ref')
+        texts = ks.get_description_texts(refs.split(',') if refs else None)
+        body, headers = encode(texts, request.accept_mimetypes, request.accept_encodings)
+        response = Response(body, 200, headers)
+        response.set_etag(f"{ks.ontology_version[:16]}-{description_ref(refs or '')}")
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def admin_auth_error():
+    """Error response unless the X-Admin-Token header matches ADMIN_TOKEN (None when allowed)."""
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({"error": "Invalid admin token"}), 401
+    return None
+
+
+@app.route('/api/admin/reload', methods=['GET', 'POST'])
+def reload_ontology():
+    """
+    Ontology hot reload (requires the X-Admin-Token header to match ADMIN_TOKEN).
+    POST starts a background build + smoke check + swap (?force=1 reloads an unchanged file);
+    GET reports the last reload.
+    """
+    denied = admin_auth_error()
+    if denied:
+        return denied
+    
+    if request.method == 'GET':
+        return jsonify(reloader.state)
+    
+    started = reloader.trigger("admin", force=request.args.get('force') == '1')
+    return jsonify(dict(reloader.state, started=started)), 202 if started else 409
+
+
+@app.route('/api/admin/shadow', methods=['GET'])
+def shadow_summary():
+    """
+    Shadow evaluation summary for the candidate ontology (requires X-Admin-Token):
+    sample counts, latency delta live vs candidate, and which outputs changed.
+    """
+    denied = admin_auth_error()
+    if denied:
+        return denied
+    try:
+        return jsonify(shadow.summary())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/admin/rules', methods=['GET', 'DELETE'])
+def rule_profile():
+    """
+    Per-rule firing counters and rule engine time of this worker (requires X-Admin-Token).
+    ?sort=time_us|firings|evaluations|facts, ?limit=N; DELETE resets the counters.
+    """
+    denied = admin_auth_error()
+    if denied:
+        return denied
+    try:
+        ks = get_knowledge_service()
+        if request.method == 'DELETE':
+            ks.rule_profile.reset()
+        limit = request.args.get('limit')
+        return jsonify(ks.get_rule_profile(request.args.get('sort', 'time_us'), int(limit) if limit else None))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/admin/memory', methods=['GET'])
+def memory_profile():
+    """
+    What this worker's memory is made of (requires X-Admin-Token): owlready2 world statistics
+    and cache sizes; ?seconds=N (max 60) also traces allocations for N seconds and returns the
+    top sites (?limit=25, ?group=lineno|filename|traceback, ?frames=1); ?save=1 writes the
+    report and the tracemalloc snapshot to disk for offline diffing.
+    """
+    denied = admin_auth_error()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', 0))
+        report = world_report(get_knowledge_service(), {"submissions": submissions.snapshot()})
+        snapshot = None
+        if seconds > 0:
+            report["allocations"], snapshot = allocation_sites(
+                seconds,
+                limit=int(request.args.get('limit', 25)),
+                group=request.args.get('group', 'lineno'),
+                frames=int(request.args.get('frames', 1))
+            )
+        if request.args.get('save') == '1':
+            report["saved"] = save_report(report, snapshot)
+        return jsonify(report)
+    except ProfileBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/thresholds', methods=['GET'])
+def get_thresholds():
+    """
+    Decision-boundary map of the numeric inputs (constant per ontology version).
+    Cached by clients; revalidated with the ETag (304 when unchanged).
+    """
+    try:
+        ks = get_knowledge_service()
+        thresholds = ks.get_thresholds()
+        response = jsonify(thresholds)
+        response.set_etag(thresholds["version"])
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # ============================================================
 # ERROR HANDLERS
 # ============================================================
@@ -415,15 +942,11 @@ if __name__ == '__main__':
     print(f"  Frontend: http://localhost:5000")
     print("=" * 60)
     
-    # Pre-load ontology
-    try:
-        print("\n⏳ Loading ontology...")
-        get_knowledge_service()
-        print("✅ Ontology loaded successfully!\n")
-    except FileNotFoundError:
-        print("⚠️  Ontology not found. Please run build_ontology.py first.\n")
-    except Exception as e:
-        print(f"⚠️  Warning: {e}\n")
+    # Warm up in the background (ontology, indexes, synthetic diagnoses); see /api/ready
+    print("\n⏳ Warming up in background...\n")
+    warmup.start()
+    reloader.start_watching()
+    memory_supervisor.start()
     
     import sys
     port = int(sys.argv[sys.argv.index('--port') + 1]) if '--port' in sys.argv else 5000
@@ -5,11 +5,25 @@ With Pellet Reasoner for SWRL rules
 Saves inference results to Azure Cosmos DB
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
+import gc
+import hmac
 import os
 import threading
+import time
 from datetime import datetime
 
+from services.process_stats import memory_stats
+from services.warmup import Warmup
+from services.resource_governor import ReasonerBusy
+from services.hot_reload import OntologyReloader
+from services.response_format import shape_result, encode, description_ref, wants_trace
+from services.static_assets import StaticAssets
+from services.memory_supervisor import MemorySupervisor
+from services.memory_profile import world_report, allocation_sites, save_report, ProfileBusy
+from services.history_record import build_record, expand_record, HISTORY_FORMAT
+from services.history_export import FORMATS, ExportUnavailable, cosmos_rows, export_chunks, parse_bound
+
 app = Flask(__name__, static_folder='static')
 
 # Configuration
@@ -32,6 +46,13 @@ _ks_lock = threading.Lock()
 _cosmos_container = None
 _cosmos_lock = threading.Lock()
 
+# Startup bookkeeping, reported by /api/health
+_startup = {
+    "preloaded": False,
+    "master_pid": None,
+    "ontology_load_s": None
+}
+
 
 def get_cosmos_container():
     """Get or create Cosmos DB container client (lazy load)."""
@@ -61,21 +82,16 @@ def save_to_cosmos(patient_id: str, input_data: dict, output_data: dict):
         return None
     
     try:
-        timestamp = datetime.now().isoformat()
+        timestamp = output_data.get('timestamp') or datetime.now().isoformat()
         doc_id = f"{patient_id}_{timestamp.replace(':', '-').replace('.', '-')}"
         
-        # Remove reasoning_trace from output (not needed in DB)
-        output_clean = {k: v for k, v in output_data.items() if k != 'reasoning_trace'}
-        
-        document = {
-            "id": doc_id,
-            "patient_id": patient_id,
-            "timestamp": timestamp,
-            "input": input_data,
-            "output": output_clean,
-            "source": "Azure Web App",
-            "reasoner": "Pellet"
-        }
+        # Compact document: entity ids instead of display text, no trace, precomputed summary row
+        ks = get_knowledge_service()
+        document = build_record(
+            dict(output_data, patient_id=patient_id, timestamp=timestamp), input_data,
+            ks.history_catalog, ks.ontology_version,
+            id=doc_id, source="Azure Web App", reasoner="Pellet"
+        )
         
         container.create_item(body=document)
         print(f"Saved to Cosmos DB: {doc_id}")
@@ -86,42 +102,191 @@ def save_to_cosmos(patient_id: str, input_data: dict, output_data: dict):
 
 
 def get_knowledge_service():
-    """Get or create knowledge service (lazy load)."""
+    """Get or create knowledge service (lazy load, pinned for the rest of the request)."""
     global _knowledge_service
-    if _knowledge_service is not None:
-        return _knowledge_service
+    if has_request_context() and "knowledge_service" in g:
+        return g.knowledge_service
     
     with _ks_lock:
         if _knowledge_service is None:
             from services.knowledge_service import KnowledgeService
             print(f"Loading ontology from {OWL_FILE}...")
+            start = time.perf_counter()
             _knowledge_service = KnowledgeService(OWL_FILE)
-            print("Ontology loaded!")
-        return _knowledge_service
+            _startup["ontology_load_s"] = round(time.perf_counter() - start, 3)
+            print(f"Ontology loaded in {_startup['ontology_load_s']}s")
+        ks = _knowledge_service
+        if has_request_context():
+            # Pinned under the lock, so a swap never retires an instance a request is about to use
+            ks.acquire()
+            g.knowledge_service = ks
+    return ks
+
+
+@app.teardown_request
+def release_knowledge_service(exc=None):
+    """Unpin the request's instance (for a stream, after its last chunk)."""
+    ks = g.pop("knowledge_service", None)
+    if ks is not None:
+        ks.release()
+
+
+def replace_knowledge_service(new_service):
+    """
+    Atomic swap: requests already running keep the instance they fetched. The old
+    instance closes its world once they finish.
+    """
+    global _knowledge_service
+    with _ks_lock:
+        old_service = _knowledge_service
+        _knowledge_service = new_service
+    if old_service is not None:
+        old_service.retire()
+
+
+def build_knowledge_service():
+    """Fresh instance from the current ontology file, sharing the reasoner governor."""
+    from services.knowledge_service import KnowledgeService
+    return KnowledgeService(OWL_FILE, governor=get_knowledge_service().governor)
+
+
+# Background warm-up per worker (never in the gunicorn master: no threads may cross the fork)
+warmup = Warmup(get_knowledge_service)
+
+# Ontology hot reload per worker, triggered by the ONTOLOGY_WATCH_S file watcher
+reloader = OntologyReloader(OWL_FILE, get_knowledge_service, build_knowledge_service, replace_knowledge_service)
+
+# Per worker: rebuild past the MEMORY_MAX_* limits; under gunicorn, recycle if RSS stays high
+memory_supervisor = MemorySupervisor(get_knowledge_service, lambda reason: reloader.trigger(reason, force=True))
+
+# Minified, fingerprinted, precompressed frontend (built in the image, checked at preload)
+static_assets = StaticAssets(app.static_folder)
+
+
+def preload_knowledge_service():
+    """
+    Load the ontology once in the gunicorn master before workers fork.
+    
+    Workers then inherit the parsed ontology (entities, rules, indexes)
+    copy-on-write instead of each building their own on the first request.
+    Preloading is only fork-safe if:
+    - the owlready2 quadstore is in-memory SQLite; no SQLite connection may be
+      used across a fork, so each worker copies it into its own connection in
+      on_worker_fork (KnowledgeService.reopen_quadstore),
+    - no reasoner JVM is running (Pellet is started per call, never kept open),
+    - the master has no other threads and no Cosmos DB client.
+    """
+    ks = get_knowledge_service()
+    
+    graph = ks.onto.world.graph
+    if getattr(graph, "filename", ":memory:") != ":memory:":
+        raise RuntimeError(f"Quadstore is file-backed ({graph.filename}); preloading is not fork-safe")
+    if threading.active_count() > 1:
+        raise RuntimeError("Background threads are running in the master; preloading is not fork-safe")
+    if _cosmos_container is not None:
+        raise RuntimeError("Cosmos DB client already open in the master; preloading is not fork-safe")
+    
+    # No open transaction may cross the fork
+    graph.commit()
+    
+    # Workers inherit the asset manifest instead of each hashing the files again
+    try:
+        static_assets.build()
+    except OSError as e:
+        print(f"Static asset build skipped: {e}")
+    
+    # Keep the GC from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    
+    _startup["preloaded"] = True
+    _startup["master_pid"] = os.getpid()
+    print(f"Preloaded ontology in master (pid {os.getpid()}): {memory_stats()}")
+    return ks
+
+
+def on_worker_fork(worker=None):
+    """Per-worker reset after fork: connections must never be shared with the master."""
+    global _cosmos_container
+    _cosmos_container = None
+    if _startup["preloaded"] and _knowledge_service is not None:
+        # The master's quadstore connection stays with the master
+        _knowledge_service.reopen_quadstore()
+    print(f"Worker {os.getpid()} started (preloaded={_startup['preloaded']}): {memory_stats()}")
+    if worker is not None:
+        # Same exit as max_requests: finish the requests in flight, then the master forks a fresh worker
+        memory_supervisor.recycle = lambda reason: setattr(worker, "alive", False)
+    warmup.start()
+    reloader.start_watching()
+    memory_supervisor.start()
+
+
+@app.before_request
+def ensure_warmup_started():
+    """Fallback for hosts without post_fork (Azure Functions, flask run)."""
+    warmup.start()
+    reloader.start_watching()
+    memory_supervisor.start()
+
+
+@app.after_request
+def add_ontology_version(response):
+    """Every response names the ontology version that produced it."""
+    ks = g.get("knowledge_service", _knowledge_service)
+    if ks is not None:
+        response.headers["X-Ontology-Version"] = ks.ontology_version[:16]
+    return response
 
 
 @app.route('/')
 def index():
-    """Serve the main frontend page."""
-    return send_from_directory(app.static_folder, 'index.html')
+    """Serve the main frontend page (points at the fingerprinted assets)."""
+    return static_assets.serve('index.html', request)
 
 
 @app.route('/<path:path>')
 def static_files(path):
-    """Serve static files."""
-    return send_from_directory(app.static_folder, path)
+    """Serve static files (minified and precompressed; fingerprinted names are immutable)."""
+    return static_assets.serve(path, request)
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check - lightweight."""
+    failed = warmup.state["status"] == "failed"
     return jsonify({
-        "status": "healthy",
+        "status": "unhealthy" if failed else "healthy",
         "ontology_exists": os.path.exists(OWL_FILE),
+        "ontology_loaded": _knowledge_service is not None,
+        "ready": warmup.ready,
+        "reasoner": _knowledge_service.governor.snapshot() if _knowledge_service else None,
+        "ontology_version": _knowledge_service.ontology_version[:16] if _knowledge_service else None,
+        "reload": reloader.state,
+        "result_cache": _knowledge_service.result_cache.snapshot() if _knowledge_service and _knowledge_service.result_cache else None,
+        "startup": _startup,
+        "worker": memory_stats(),
+        "memory": memory_supervisor.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }), (500 if failed else 200)
+
+
+@app.route('/api/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the worker is up and serving HTTP."""
+    return jsonify({
+        "status": "alive",
+        "pid": os.getpid(),
         "timestamp": datetime.now().isoformat()
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 only after the warm-up diagnoses have run."""
+    body = dict(warmup.state, pid=os.getpid(), timestamp=datetime.now().isoformat())
+    return jsonify(body), (200 if warmup.ready else 503)
+
+
 @app.route('/api/diagnose', methods=['POST'])
 def diagnose():
     """Main diagnosis endpoint with Pellet reasoner."""
@@ -134,7 +299,7 @@ def diagnose():
         ks = get_knowledge_service()
         
         # Run diagnosis
-        result = ks.diagnose(data)
+        result = ks.diagnose(data, trace=wants_trace(request.args))
         result['timestamp'] = datetime.now().isoformat()
         
         # Save to Cosmos DB (async-like, don't block response)
@@ -143,8 +308,21 @@ def diagnose():
         if cosmos_id:
             result['cosmos_doc_id'] = cosmos_id
         
-        return jsonify(result)
+        # view=compact / trace / fields / exclude, MessagePack or gzip as the client accepts
+        if request.args.get('trace') == 'events':
+            result['trace_events'] = ks.explain(data, patient_id)
+        body, headers = encode(
+            shape_result(result, request.args, ks.description_index),
+            request.accept_mimetypes, request.accept_encodings
+        )
+        return Response(body, 200, headers)
         
+    except ReasonerBusy as e:
+        return jsonify({
+            "error": str(e),
+            "retry_after": e.retry_after,
+            "timestamp": datetime.now().isoformat()
+        }), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({
             "error": str(e),
@@ -178,15 +356,73 @@ def get_history():
                 enable_cross_partition_query=True
             ))
         
+        # Compact documents are returned in the original input/output shape
+        catalog = get_knowledge_service().history_catalog
+        history = []
+        for item in items:
+            if item.get('format') == HISTORY_FORMAT:
+                item = expand_record(item, catalog)
+                item['input'] = item.pop('input_data')
+                item['output'] = item.pop('diagnosis_result')
+                del item['demographics']
+            history.append(item)
+        
         return jsonify({
-            "count": len(items),
-            "history": items
+            "count": len(history),
+            "history": history
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """
+    Full history from Cosmos DB as a streamed download: ?format=ndjson|csv|parquet, optional
+    ?from= / ?to= (ISO date or datetime; a date-only `to` includes that day).
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        start = parse_bound(request.args.get('from'))
+        end = parse_bound(request.args.get('to'), end=True)
+        
+        container = get_cosmos_container()
+        if container is None:
+            return jsonify({"error": "Cosmos DB not available"}), 503
+        
+        chunks = export_chunks(cosmos_rows(container, start, end), fmt)
+        filename = f"history-{datetime.now().strftime('%Y%m%dT%H%M%S')}.{fmt}"
+        return Response(stream_with_context(chunks), mimetype=FORMATS[fmt], headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store"
+        })
+        
+    except ExportUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/descriptions/texts', methods=['GET'])
+def get_description_texts():
+    """Description texts referenced by compact diagnosis responses (?ref=a,b to limit)."""
+    try:
+        ks = get_knowledge_service()
+        refs = request.args.get('ref')
+        texts = ks.get_description_texts(refs.split(',') if refs else None)
+        body, headers = encode(texts, request.accept_mimetypes, request.accept_encodings)
+        response = Response(body, 200, headers)
+        response.set_etag(f"{ks.ontology_version[:16]}-{description_ref(refs or '')}")
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/descriptions', methods=['GET'])
 def get_descriptions():
     """Get parameter descriptions for tooltips."""
@@ -264,5 +500,48 @@ def get_descriptions():
     return jsonify(descriptions)
 
 
+
+def admin_auth_error():
+    """Error response unless the X-Admin-Token header matches ADMIN_TOKEN (None when allowed)."""
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({"error": "Invalid admin token"}), 401
+    return None
+
+
+@app.route('/api/admin/memory', methods=['GET'])
+def memory_profile():
+    """
+    What the worker that answers is made of (requires X-Admin-Token; see the pid): owlready2
+    world statistics and cache sizes; ?seconds=N (max 60) also traces allocations for N seconds
+    (?limit=25, ?group=lineno|filename|traceback, ?frames=1); ?save=1 writes the report and the
+    tracemalloc snapshot to disk for offline diffing.
+    """
+    denied = admin_auth_error()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', 0))
+        report = world_report(get_knowledge_service())
+        snapshot = None
+        if seconds > 0:
+            report["allocations"], snapshot = allocation_sites(
+                seconds,
+                limit=int(request.args.get('limit', 25)),
+                group=request.args.get('group', 'lineno'),
+                frames=int(request.args.get('frames', 1))
+            )
+        if request.args.get('save') == '1':
+            report["saved"] = save_report(report, snapshot)
+        return jsonify(report)
+    except ProfileBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration - CVD Expert System (Azure Web App)
+
+Set PRELOAD_ONTOLOGY=0 to go back to one lazy ontology load per worker.
+"""
+
+import os
+import time
+
+bind = "0.0.0.0:8000"
+timeout = 300
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+
+# Load the ontology once in the master and share it copy-on-write with the workers
+preload_app = os.environ.get("PRELOAD_ONTOLOGY", "1") == "1"
+
+_boot_started = time.perf_counter()
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported and before any worker is forked."""
+    if preload_app:
+        import app_deploy
+        try:
+            app_deploy.preload_knowledge_service()
+        except Exception as e:
+            server.log.warning(f"Ontology preload skipped: {e}")
+    server.log.info(f"Master ready in {time.perf_counter() - _boot_started:.2f}s (preload={preload_app})")
+
+
+def post_fork(server, worker):
+    import app_deploy
+    app_deploy.on_worker_fork(worker)
@@ -0,0 +1,247 @@
+"""
+History Export - CVD Expert System
+Full diagnosis history as NDJSON, CSV or Parquet, streamed page by page.
+
+Rows come from the active backend (Cosmos DB or the SPARQL store) one page
+at a time and are encoded as they arrive, so an export holds one page in
+memory whatever its size and goes out with chunked transfer encoding.
+Parquet (needs the pyarrow package) is written one row group per page with
+typed columns: timestamp, integers, float ASCVD score, boolean emergency and
+list<string> diagnoses / medications / contraindications.
+"""
+
+import csv
+import io
+import itertools
+import json
+import os
+from datetime import datetime, timedelta
+
+from services.history_record import summary_of
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; Parquet exports are refused without it
+    pa = pq = None
+
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet"
+}
+COLUMNS = ("timestamp", "patient_id", "patient_name", "age", "gender", "diagnoses", "medications",
+           "contraindications", "risk_category", "ascvd_score", "severity", "rules_fired", "emergency")
+LIST_COLUMNS = ("diagnoses", "medications", "contraindications")
+DEFAULT_PAGE_SIZE = 500
+# Text formats are sent in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+
+class ExportUnavailable(Exception):
+    """The requested export cannot be produced here (format or backend missing)."""
+
+
+def page_size() -> int:
+    return int(os.environ.get("HISTORY_EXPORT_PAGE_SIZE", DEFAULT_PAGE_SIZE))
+
+
+def parse_bound(value: str, end: bool = False) -> str:
+    """
+    ISO date or datetime -> ISO datetime string for timestamp comparisons.
+    A date-only upper bound includes that whole day (the bound is exclusive).
+    """
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.isoformat()
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_row(row: dict) -> dict:
+    """A history row (Cosmos summary or SPARQL binding) with typed values."""
+    emergency = row.get("emergency")
+    if isinstance(emergency, str):
+        emergency = emergency.strip().lower() == "true"
+    normalized = {
+        "timestamp": row.get("timestamp") or None,
+        "patient_id": row.get("patient_id"),
+        "patient_name": row.get("patient_name"),
+        "age": _to_int(row.get("age")),
+        "gender": row.get("gender") or None,
+        "risk_category": row.get("risk_category") or None,
+        "ascvd_score": _to_float(row.get("ascvd_score")),
+        "severity": row.get("severity") or None,
+        "rules_fired": _to_int(row.get("rules_fired")),
+        "emergency": None if emergency is None else bool(emergency)
+    }
+    for name in LIST_COLUMNS:
+        value = row.get(name) or []
+        normalized[name] = [v.strip() for v in value.split(";") if v.strip()] if isinstance(value, str) else list(value)
+    return {name: normalized[name] for name in COLUMNS}
+
+
+def cosmos_rows(container, start: str = None, end: str = None, size: int = None):
+    """History rows from Cosmos DB in timestamp order, fetched one page at a time."""
+    conditions, parameters = [], []
+    if start:
+        conditions.append("c.timestamp >= @start")
+        parameters.append({"name": "@start", "value": start})
+    if end:
+        conditions.append("c.timestamp < @end")
+        parameters.append({"name": "@end", "value": end})
+    query = "SELECT c.patient_id, c.format, c.summary, c.demographics, c.diagnosis_result FROM c"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY c.timestamp"
+
+    pages = container.query_items(
+        query=query,
+        parameters=parameters,
+        enable_cross_partition_query=True,
+        max_item_count=size or page_size()
+    ).by_page()
+    for page in pages:
+        for item in page:
+            yield normalize_row(dict(summary_of(item), patient_id=item.get("patient_id")))
+
+
+def sparql_rows(sparql_service, start: str = None, end: str = None, size: int = None):
+    """History rows from the SPARQL store in timestamp order, one page per query."""
+    for row in sparql_service.iter_history(start, end, size or page_size()):
+        yield normalize_row(row)
+
+
+def _batched(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ndjson_chunks(rows):
+    buffer, length = [], 0
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n"
+        buffer.append(line)
+        length += len(line)
+        if length >= CHUNK_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def csv_chunks(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow([
+            "; ".join(row[name]) if name in LIST_COLUMNS else ("" if row[name] is None else row[name])
+            for name in COLUMNS
+        ])
+        if out.tell() >= CHUNK_BYTES:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+
+def parquet_schema():
+    strings = pa.list_(pa.string())
+    return pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("patient_id", pa.string()),
+        ("patient_name", pa.string()),
+        ("age", pa.int32()),
+        ("gender", pa.string()),
+        ("diagnoses", strings),
+        ("medications", strings),
+        ("contraindications", strings),
+        ("risk_category", pa.string()),
+        ("ascvd_score", pa.float64()),
+        ("severity", pa.string()),
+        ("rules_fired", pa.int32()),
+        ("emergency", pa.bool_())
+    ])
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are taken out after every row group."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def parquet_chunks(rows, size: int = None):
+    """One row group per page of rows."""
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in _batched(rows, size or page_size()):
+            for row in batch:
+                timestamp = row["timestamp"]
+                row["timestamp"] = datetime.fromisoformat(timestamp.replace("Z", "+00:00")) if timestamp else None
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(rows, fmt: str):
+    """Encoded chunks of the rows in `fmt` (ndjson, csv or parquet); the first one is already read."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "parquet":
+        if pa is None:
+            raise ExportUnavailable("Parquet export needs the pyarrow package")
+        chunks = parquet_chunks(rows)
+    else:
+        chunks = ndjson_chunks(rows) if fmt == "ndjson" else csv_chunks(rows)
+    # First page read now: a backend that fails up front gets an error status, not a cut-off download
+    first = next(chunks, None)
+    return itertools.chain([] if first is None else [first], chunks)
@@ -0,0 +1,193 @@
+"""
+History Record - CVD Expert System
+Compact, versioned format of a diagnosis history item (Cosmos DB).
+
+A format 2 record stores:
+- summary: the flat row the history list shows, precomputed at write time so
+  a list read projects only this field;
+- result: the diagnosis without reasoning_trace / trace_events, each
+  diagnosis, medication and lifestyle recommendation reduced to its ontology
+  entity id plus the fields that differ from the ontology catalog;
+- input: the submitted payload.
+result and input are stored zlib-compressed (base64, `*_z`) when their JSON
+is larger than HISTORY_COMPRESS_MIN_BYTES (default 1024; HISTORY_COMPRESS=0
+turns compression off). Reads resolve the display text from the catalog of
+the ontology in use. Items without `format` are the original layout and are
+read as they are.
+"""
+
+import base64
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+
+
+HISTORY_FORMAT = 2
+COMPRESS_MIN_BYTES = 1024
+CATALOG_LISTS = ("diagnoses", "medications", "lifestyle_recommendations")
+DROPPED_FIELDS = ("reasoning_trace", "trace_events")
+
+
+def _first(entity, prop: str):
+    values = getattr(entity, prop, None)
+    if isinstance(values, list):
+        return values[0] if values else None
+    return values
+
+
+def history_catalog(onto) -> dict:
+    """
+    Display fields per ontology entity, keyed like the diagnosis result lists:
+    {"diagnoses": {class name: fields}, "medications": {individual: fields},
+    "lifestyle_recommendations": {individual: fields}}
+    """
+    source = "SWRL Inference (from Ontology)"
+    catalog = {name: {} for name in CATALOG_LISTS}
+    for cls in onto.classes():
+        if _first(cls, "hasDisplayName") is None:
+            continue
+        entry = {"name": _first(cls, "hasDisplayName"), "class": cls.name,
+                 "severity": _first(cls, "hasSeverityLevel") or "Unknown", "source": source}
+        for key, prop in (("icd10", "hasICD10Code"), ("description", "hasDescription")):
+            if _first(cls, prop) is not None:
+                entry[key] = _first(cls, prop)
+        catalog["diagnoses"][cls.name] = entry
+
+    for ind in onto.individuals():
+        display_name = _first(ind, "hasDisplayName") or ind.name
+        if _first(ind, "hasDose") is not None or _first(ind, "hasDrugClass") is not None:
+            entry = {"name": display_name, "class": _first(ind, "hasDrugClass") or "Unknown",
+                     "dose": _first(ind, "hasDose") or "As prescribed",
+                     "frequency": _first(ind, "hasFrequency") or "As directed", "source": source}
+            kind = "medications"
+        elif _first(ind, "hasCategory") is not None or _first(ind, "hasPriority") is not None:
+            priority = _first(ind, "hasPriority")
+            entry = {"name": display_name, "category": _first(ind, "hasCategory"),
+                     "priority": 99 if priority is None else priority, "source": source}
+            kind = "lifestyle_recommendations"
+        else:
+            continue
+        if _first(ind, "hasDescription") is not None:
+            entry["description"] = _first(ind, "hasDescription")
+        catalog[kind][ind.name] = entry
+    return catalog
+
+
+def _by_name(entries: dict) -> dict:
+    return {entry["name"]: entity_id for entity_id, entry in entries.items()}
+
+
+def _join(items, key: str) -> str:
+    return "; ".join(item.get(key, "") for item in items or [] if isinstance(item, dict))
+
+
+def flat_summary(result: dict, demographics: dict) -> dict:
+    """The flat history row of a diagnosis (list views)."""
+    return {
+        "timestamp": result.get("timestamp"),
+        "patient_name": demographics.get("name", "Unknown"),
+        "age": demographics.get("age", ""),
+        "gender": demographics.get("gender", ""),
+        "diagnoses": _join(result.get("diagnoses"), "name"),
+        "medications": _join(result.get("medications"), "name"),
+        "contraindications": _join(result.get("contraindications"), "drug"),
+        "risk_category": result.get("risk_category", ""),
+        "ascvd_score": result.get("ascvd_score", ""),
+        "severity": result.get("severity", ""),
+        "rules_fired": result.get("rules_fired", 0),
+        "emergency": result.get("emergency", False)
+    }
+
+
+def compact_result(result: dict, catalog: dict) -> dict:
+    """Result without traces; catalog entities as {"id", fields that differ from the catalog}."""
+    compact = {k: v for k, v in result.items() if k not in DROPPED_FIELDS}
+    for name in CATALOG_LISTS:
+        entries = catalog.get(name, {})
+        names = _by_name(entries)
+        items = []
+        for item in compact.get(name) or []:
+            if isinstance(item, dict):
+                entity_id = item.get("class") if name == "diagnoses" else names.get(item.get("name"))
+                entry = entries.get(entity_id)
+                if entry is not None:
+                    item = dict({k: v for k, v in item.items() if entry.get(k) != v}, id=entity_id)
+            items.append(item)
+        if name in compact:
+            compact[name] = items
+    return compact
+
+
+def expand_result(compact: dict, catalog: dict) -> dict:
+    """Inverse of compact_result, with the display text of the given catalog."""
+    result = dict(compact)
+    for name in CATALOG_LISTS:
+        if not isinstance(result.get(name), list):
+            continue
+        entries = catalog.get(name, {})
+        items = []
+        for item in result[name]:
+            if isinstance(item, dict) and "id" in item:
+                fields = {k: v for k, v in item.items() if k != "id"}
+                # An entity the catalog no longer has keeps at least its id (a diagnosis's class)
+                fallback = {"name": item["id"], "class": item["id"]} if name == "diagnoses" else {"name": item["id"]}
+                item = dict(entries.get(item["id"], fallback), **fields)
+            items.append(item)
+        result[name] = items
+    return result
+
+
+def _pack(value):
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    min_bytes = int(os.environ.get("HISTORY_COMPRESS_MIN_BYTES", COMPRESS_MIN_BYTES))
+    if os.environ.get("HISTORY_COMPRESS", "1") == "0" or len(data) < min_bytes:
+        return value, False
+    return base64.b64encode(zlib.compress(data, 6)).decode("ascii"), True
+
+
+def _unpack(item: dict, field: str):
+    if f"{field}_z" in item:
+        return json.loads(zlib.decompress(base64.b64decode(item[f"{field}_z"])))
+    return item.get(field)
+
+
+def build_record(result: dict, patient_data: dict, catalog: dict, ontology_version: str = None,
+                 **extra) -> dict:
+    """Format 2 Cosmos item of a diagnosis (extra: additional top-level fields)."""
+    timestamp = result.get("timestamp") or datetime.now().isoformat()
+    record = {
+        "id": str(uuid.uuid4()),
+        "patient_id": result.get("patient_id", "unknown"),
+        "timestamp": timestamp,
+        "format": HISTORY_FORMAT,
+        "ontology_version": (ontology_version or "")[:16] or None,
+        "summary": flat_summary(dict(result, timestamp=timestamp), patient_data.get("demographics", {}))
+    }
+    record.update(extra)
+    for field, value in (("result", compact_result(result, catalog)), ("input", patient_data)):
+        packed, compressed = _pack(value)
+        record[f"{field}_z" if compressed else field] = packed
+    return record
+
+
+def summary_of(item: dict) -> dict:
+    """Flat history row of an item in either format."""
+    if item.get("format") == HISTORY_FORMAT:
+        return item["summary"]
+    return flat_summary(item.get("diagnosis_result", {}), item.get("demographics", {}))
+
+
+def expand_record(item: dict, catalog: dict) -> dict:
+    """
+    Full item: a format 2 record gets back `diagnosis_result` (display text from
+    the catalog), `input_data` and `demographics`; older items are returned as they are.
+    """
+    if item.get("format") != HISTORY_FORMAT:
+        return item
+    expanded = {k: v for k, v in item.items() if k not in ("result", "result_z", "input", "input_z")}
+    expanded["diagnosis_result"] = expand_result(_unpack(item, "result") or {}, catalog)
+    expanded["input_data"] = _unpack(item, "input") or {}
+    expanded["demographics"] = expanded["input_data"].get("demographics", {})
+    return expanded
@@ -0,0 +1,190 @@
+"""
+Idempotent Submissions - CVD Expert System
+Deduplicates diagnosis submissions retried by flaky clinic networks. A
+submission is identified by its Idempotency-Key header (when sent) and by a
+content hash of the normalized payload. Within the window a duplicate gets the
+stored result back without reasoning or persisting again; a duplicate that
+arrives while the first one is still running waits for that computation.
+
+Environment: IDEMPOTENCY_WINDOW_S (600), IDEMPOTENCY_MAX_ENTRIES (1000).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services.resource_governor import ReasonerBusy
+
+
+class IdempotencyConflict(Exception):
+    """The Idempotency-Key was already used for a different payload."""
+
+
+def normalize_payload(value):
+    """
+    Canonical form of a payload: empty values dropped, strings stripped,
+    numbers (and numeric strings) as floats, lists sorted.
+    """
+    if isinstance(value, dict):
+        normalized = {}
+        for key in sorted(value):
+            item = normalize_payload(value[key])
+            if item not in (None, "", [], {}):
+                normalized[str(key)] = item
+        return normalized
+    if isinstance(value, (list, tuple)):
+        items = [normalize_payload(v) for v in value]
+        return sorted((v for v in items if v not in (None, "", [], {})), key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return str(value)
+
+
+def content_hash(data: dict) -> str:
+    """sha256 of the normalized payload."""
+    canonical = json.dumps(normalize_payload(data), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("digest", "done", "result", "expires")
+
+    def __init__(self, digest: str):
+        self.digest = digest
+        self.done = threading.Event()
+        self.result = None
+        self.expires = None
+
+
+class IdempotencyStore:
+    """In-process record of recent submissions, keyed by Idempotency-Key and by content hash."""
+
+    def __init__(self, window: float = None, max_entries: int = None):
+        env = os.environ.get
+        self.window = float(env("IDEMPOTENCY_WINDOW_S", "600")) if window is None else window
+        self.max_entries = max_entries or int(env("IDEMPOTENCY_MAX_ENTRIES", "1000"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"computed": 0, "replayed": 0, "waited": 0, "conflicts": 0}
+
+    def _keys(self, digest: str, idempotency_key: str = None) -> list:
+        keys = [f"sha256:{digest}"]
+        if idempotency_key:
+            keys.insert(0, f"key:{idempotency_key}")
+        return keys
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires is not None and e.expires <= now]:
+            del self._entries[key]
+        # Oldest finished entries go first; running ones are never evicted
+        while len(self._entries) > self.max_entries:
+            key = next((k for k, e in self._entries.items() if e.done.is_set()), None)
+            if key is None:
+                break
+            del self._entries[key]
+
+    def _find(self, keys: list, digest: str, idempotency_key: str = None):
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if idempotency_key and key == keys[0] and entry.digest != digest:
+                self.stats["conflicts"] += 1
+                raise IdempotencyConflict(f"Idempotency-Key '{idempotency_key}' was already used for a different payload")
+            return entry
+        return None
+
+    def _release(self, entry: _Entry):
+        # Failed computation: forget it so the next duplicate computes again
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e is entry]:
+                del self._entries[key]
+        entry.done.set()
+
+    def lookup(self, data: dict, idempotency_key: str = None):
+        """Stored result of a finished duplicate submission, or None."""
+        digest = content_hash(data)
+        with self._lock:
+            self._purge()
+            entry = self._find(self._keys(digest, idempotency_key), digest, idempotency_key)
+            if entry is None or not entry.done.is_set() or entry.result is None:
+                return None
+            self.stats["replayed"] += 1
+            return entry.result
+
+    def remember(self, data: dict, result: dict, idempotency_key: str = None):
+        """Record a result computed outside run() (e.g. by the streaming endpoint)."""
+        digest = content_hash(data)
+        entry = _Entry(digest)
+        entry.result = result
+        entry.expires = time.monotonic() + self.window
+        entry.done.set()
+        with self._lock:
+            for key in self._keys(digest, idempotency_key):
+                current = self._entries.get(key)
+                if current is None or current.done.is_set():
+                    self._entries[key] = entry
+            self._purge()
+
+    def run(self, data: dict, fn, idempotency_key: str = None, timeout: float = None):
+        """
+        fn() once per submission within the window.
+
+        Returns:
+            (result, replayed): replayed is True when the result came from an earlier submission
+
+        Raises:
+            IdempotencyConflict: the key belongs to a different payload
+            ReasonerBusy: the first submission is still running after `timeout` seconds
+        """
+        digest = content_hash(data)
+        keys = self._keys(digest, idempotency_key)
+        waited = False
+        while True:
+            with self._lock:
+                self._purge()
+                entry = self._find(keys, digest, idempotency_key)
+                leader = entry is None
+                if leader:
+                    entry = _Entry(digest)
+                for key in keys:
+                    self._entries.setdefault(key, entry)
+
+            if leader:
+                try:
+                    result = fn()
+                except BaseException:
+                    self._release(entry)
+                    raise
+                with self._lock:
+                    entry.result = result
+                    entry.expires = time.monotonic() + self.window
+                    self.stats["computed"] += 1
+                entry.done.set()
+                return result, False
+
+            if not entry.done.is_set():
+                waited = True
+                if not entry.done.wait(timeout):
+                    raise ReasonerBusy("An identical submission is still being diagnosed", 1)
+            if entry.result is not None:
+                with self._lock:
+                    self.stats["waited" if waited else "replayed"] += 1
+                return entry.result, True
+            # The first submission failed; try again (possibly as the new leader)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), window_s=self.window)
@@ -0,0 +1,168 @@
+"""
+JVM Class-Data Sharing - CVD Expert System
+AppCDS archive for the Pellet classpath bundled with owlready2.
+
+Every sync_reasoner_pellet call starts a fresh JVM that loads Pellet's, OWLAPI's
+and Jena's classes from the jars again. The archive is dumped once at image
+build time and then mapped by every reasoner JVM. owlready2 builds the java
+command line itself, so the archive is passed through JAVA_TOOL_OPTIONS, which
+the child JVM picks up from the inherited environment.
+
+Usage:
+    python -m services.jvm_cds build --ontology cvd_sroiq_complete.owl
+    python -m services.jvm_cds status
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ARCHIVE = os.path.join(BASE_DIR, "jvm", "pellet-cds.jsa")
+DEFAULT_ONTOLOGY = os.path.join(BASE_DIR, "cvd_sroiq_complete.owl")
+
+
+def archive_path() -> str:
+    return os.environ.get("PELLET_CDS_ARCHIVE", DEFAULT_ARCHIVE)
+
+
+def pellet_classpath() -> str:
+    from owlready2 import reasoning
+    return reasoning._PELLET_CLASSPATH
+
+
+def pellet_command(input_file: str, jvm_args: list = None) -> list:
+    """The java command sync_reasoner_pellet runs, with optional extra JVM flags."""
+    import owlready2
+    from owlready2 import reasoning
+    return (
+        [owlready2.JAVA_EXE, "-Xmx%sM" % reasoning.JAVA_MEMORY]
+        + list(jvm_args or [])
+        + ["-cp", pellet_classpath(), "pellet.Pellet", "realize", "--loader", "Jena",
+           "--input-format", "N-Triples", "--infer-prop-values", "--infer-data-prop-values",
+           "--ignore-imports", input_file]
+    )
+
+
+def export_ntriples(ontology_path: str, output_file: str):
+    """Write the ontology as N-Triples, the format owlready2 hands to Pellet."""
+    import owlready2
+    world = owlready2.World()
+    onto = world.get_ontology(f"file://{os.path.abspath(ontology_path)}").load()
+    onto.save(file=output_file, format="ntriples")
+    world.close()
+
+
+def _metadata_file(archive: str) -> str:
+    return archive + ".json"
+
+
+def read_metadata(archive: str = None):
+    archive = archive or archive_path()
+    if not os.path.exists(archive) or not os.path.exists(_metadata_file(archive)):
+        return None
+    try:
+        with open(_metadata_file(archive), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def enable_pellet_cds(archive: str = None):
+    """
+    Point reasoner JVMs at the CDS archive if one was built for this classpath.
+    Returns the archive path in use, or None. PELLET_CDS=0 disables it.
+    """
+    if os.environ.get("PELLET_CDS", "1") == "0":
+        return None
+    archive = archive or archive_path()
+    meta = read_metadata(archive)
+    if meta is None:
+        return None
+    # The JVM only maps an archive whose classpath is a prefix of the runtime one
+    if meta.get("classpath") != pellet_classpath():
+        print(f"⚠️  CDS archive {archive} was built for a different Pellet classpath, ignoring it")
+        return None
+
+    flag = f"-XX:SharedArchiveFile={archive}"
+    options = os.environ.get("JAVA_TOOL_OPTIONS", "")
+    if flag not in options:
+        os.environ["JAVA_TOOL_OPTIONS"] = f"{options} -Xshare:auto {flag}".strip()
+    return archive
+
+
+def build_archive(ontology_path: str = DEFAULT_ONTOLOGY, archive: str = None) -> dict:
+    """
+    Dump an AppCDS archive (JDK 11: class list from a training run, then -Xshare:dump).
+    The training run reasons over the real ontology so the rule and realization
+    classes are included, not just the ones needed to print usage.
+    """
+    import owlready2
+
+    archive = os.path.abspath(archive or archive_path())
+    os.makedirs(os.path.dirname(archive), exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nt_file = os.path.join(tmp, "ontology.nt")
+        class_list = os.path.join(tmp, "pellet.classlist")
+        export_ntriples(ontology_path, nt_file)
+
+        print("⏳ Training run (collecting loaded classes)...")
+        subprocess.run(
+            pellet_command(nt_file, ["-Xshare:off", f"-XX:DumpLoadedClassList={class_list}"]),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+        )
+        with open(class_list, encoding="utf-8") as f:
+            classes = sum(1 for line in f if line.strip() and not line.startswith("#"))
+
+        print(f"⏳ Dumping archive for {classes} classes...")
+        subprocess.run(
+            [owlready2.JAVA_EXE, "-Xshare:dump", f"-XX:SharedClassListFile={class_list}",
+             f"-XX:SharedArchiveFile={archive}", "-cp", pellet_classpath()],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+        )
+
+    meta = {
+        "classpath": pellet_classpath(),
+        "java": owlready2.JAVA_EXE,
+        "classes": classes,
+        "size_mb": round(os.path.getsize(archive) / (1024 * 1024), 1),
+        "created": datetime.now().isoformat(timespec="seconds")
+    }
+    with open(_metadata_file(archive), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ CDS archive written to {archive} ({meta['size_mb']} MB)")
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the Pellet AppCDS archive.")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("--ontology", default=DEFAULT_ONTOLOGY, help="Ontology used for the training run")
+    parser.add_argument("--archive", default=None, help=f"Archive path (default: $PELLET_CDS_ARCHIVE or {DEFAULT_ARCHIVE})")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        try:
+            build_archive(args.ontology, args.archive)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ {' '.join(e.cmd[:3])}... failed:\n{(e.stderr or b'').decode(errors='replace')}")
+            sys.exit(1)
+        return
+
+    archive = args.archive or archive_path()
+    meta = read_metadata(archive)
+    if meta is None:
+        print(f"No CDS archive at {archive}")
+        sys.exit(1)
+    usable = meta.get("classpath") == pellet_classpath()
+    print(json.dumps(dict(meta, archive=archive, usable=usable), indent=2))
+
+
+if __name__ == "__main__":
+    main()
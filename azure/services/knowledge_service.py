@@ -2,13 +2,26 @@
 Knowledge Service - CVD Expert System
 Handles ontology loading, patient instance creation, and Pellet reasoning.
 
-OPTIMIZED: Reduced Java memory for faster JVM startup.
+OPTIMIZED: JVM heap sized per run from available memory (see resource_governor.py).
 """
 
+import hashlib
+import io
 import os
+import threading
 import uuid
 from datetime import datetime
 
+from services.priority import PRIORITY_NAMES, PRIORITY_ROUTINE, classify_priority
+from services.resource_governor import ResourceGovernor, ReasonerBusy, ReasonerTimeout
+from services.result_cache import ResultCache
+from services.response_format import description_index
+from services.history_record import history_catalog
+from services.rule_compiler import compile_rules, class_members
+from services.rule_engine import RuleEngine
+from services.patient_facts import facts_from_individual
+from services.rule_profile import reconcile, replay, rules_fired, trace_events
+
 # Lazy import owlready2 - don't load until actually needed
 _owlready2 = None
 
@@ -18,21 +31,55 @@ def _get_owlready2():
     global _owlready2
     if _owlready2 is None:
         import owlready2
-        # Set low Java memory for faster startup (256MB is enough for small ontology)
+        # Small ontology: start low, the resource governor resizes the heap per run
         owlready2.reasoning.JAVA_MEMORY = 256
         _owlready2 = owlready2
+        # Map the Pellet class-data-sharing archive built in the Dockerfile, if present
+        from services.jvm_cds import enable_pellet_cds
+        enable_pellet_cds()
     return _owlready2
 
 
+class _NoTrace(list):
+    """reasoning_trace of a diagnosis whose caller did not ask for it: lines are dropped."""
+
+    def append(self, line):
+        pass
+
+
 class KnowledgeService:
     """Service for interacting with the CVD ontology."""
     
-    def __init__(self, ontology_path: str):
-        """Initialize the knowledge service with ontology."""
+    def __init__(self, ontology_path: str, governor: ResourceGovernor = None, use_result_cache: bool = True):
+        """
+        Initialize the knowledge service with ontology (optionally sharing a governor).
+        use_result_cache=False keeps side instances (benchmarks) off the node's result cache.
+        """
         self.ontology_path = ontology_path
         self.onto = None
         self.reasoning_trace = []
+        self.governor = governor or ResourceGovernor(ontology_path)
+        self.ontology_version = None
+        self.result_cache = None
+        # Requests pinned to this instance; a retired instance closes its world at zero
+        self._pins = 0
+        self._pin_lock = threading.Lock()
+        self.retired = False
+        self.closed = False
         self._load_ontology()
+        self.description_index = description_index(self.onto)
+        self.history_catalog = history_catalog(self.onto)
+        # SWRL rule layer in-process: exact rules_fired and the structured trace
+        self.rules = compile_rules(self.onto)
+        self.rule_engine = RuleEngine(self.rules, class_members(self.onto, self.rules))
+        # (data, object) properties the rules read or write: the individual's rule-layer facts
+        self.rule_properties = (
+            {pred for rule in self.rules for kind, pred, _ in rule.body + rule.head if kind == "data"},
+            {pred for rule in self.rules for kind, pred, _ in rule.body + rule.head if kind == "object"}
+        )
+        # Shared by the gunicorn workers of this node; results are per ontology version
+        if use_result_cache:
+            self.result_cache = ResultCache.from_env(self.ontology_version, "pellet")
     
     def _load_ontology(self):
         """Load the ontology from file."""
@@ -41,28 +88,38 @@ class KnowledgeService:
         
         owlready2 = _get_owlready2()
         
+        # Hash and parse the same bytes, so the version always matches what was loaded
+        with open(self.ontology_path, "rb") as f:
+            content = f.read()
+        self.ontology_version = hashlib.sha256(content).hexdigest()
+        
+        # Own world per service, so a reloaded ontology never mixes with the one it replaces
         # Use file:// protocol for owlready2
         onto_path = "file://" + self.ontology_path.replace(" ", "%20")
-        self.onto = owlready2.get_ontology(onto_path).load()
+        self.onto = owlready2.World().get_ontology(onto_path).load(fileobj=io.BytesIO(content))
     
-    def create_patient(self, data: dict) -> str:
+    def _new_patient_id(self, data: dict) -> str:
+        patient_name = data.get("demographics", {}).get("name", "Unknown")
+        return f"Pasien_{patient_name.replace(' ', '_')}_{uuid.uuid4().hex[:8]}"
+    
+    def create_patient(self, data: dict, trace: bool = True) -> str:
         """
         Create a patient individual in the ontology.
         
         Args:
             data: Patient data dictionary with demographics, vitals, labs, etc.
+            trace: False to skip the reasoning_trace display strings
             
         Returns:
             Patient ID (individual name)
         """
-        self.reasoning_trace = []
+        self.reasoning_trace = [] if trace else _NoTrace()
         
         owlready2 = _get_owlready2()
         
         with self.onto:
             # Generate unique patient ID
-            patient_name = data.get("demographics", {}).get("name", "Unknown")
-            patient_id = f"Pasien_{patient_name.replace(' ', '_')}_{uuid.uuid4().hex[:8]}"
+            patient_id = self._new_patient_id(data)
             
             # Create patient individual
             Pasien = self.onto.Pasien
@@ -191,17 +248,25 @@ class KnowledgeService:
         
         return patient_id
     
-    def run_inference(self):
-        """Run Pellet reasoner to infer new facts."""
+    def run_inference(self, priority: int = PRIORITY_ROUTINE):
+        """Run Pellet reasoner to infer new facts (queued by priority class)."""
         self.reasoning_trace.append("\n🧠 Menjalankan Pellet Reasoner...")
         
         owlready2 = _get_owlready2()
         
-        try:
+        def reason():
             with self.onto:
-                owlready2.sync_reasoner_pellet(infer_property_values=True, infer_data_property_values=True)
+                owlready2.sync_reasoner_pellet(self.onto.world, infer_property_values=True, infer_data_property_values=True)
+        
+        try:
+            self.governor.run(reason, jvm=True, priority=priority)
             self.reasoning_trace.append("✅ Reasoning selesai")
             return True
+        except ReasonerBusy:
+            raise
+        except ReasonerTimeout as e:
+            self.reasoning_trace.append(f"⏱️ {str(e)}")
+            return False
         except Exception as e:
             self.reasoning_trace.append(f"❌ Error: {str(e)}")
             return False
@@ -479,46 +544,54 @@ class KnowledgeService:
         return descriptions
     
     def get_inferred_recommendations(self, patient_id: str) -> list:
-        """Get recommendations inferred via SWRL rules from memerlukanRekomendasi property."""
+        """Get lifestyle recommendations from SWRL inference via memerlukanRekomendasi property."""
         patient = self.onto[patient_id]
         if not patient:
             return []
         
         recommendations = []
+        seen_recs = set()  # Track seen recommendations to avoid duplicates
         
-        # Check if patient has memerlukanRekomendasi property
-        if hasattr(patient, 'memerlukanRekomendasi'):
-            inferred_recs = list(patient.memerlukanRekomendasi)
+        # Get recommendations from inferred memerlukanRekomendasi property
+        patient_recs = list(patient.memerlukanRekomendasi) if hasattr(patient, 'memerlukanRekomendasi') else []
+        
+        for rec in patient_recs:
+            rec_name = rec.name if hasattr(rec, 'name') else str(rec)
             
-            for rec in inferred_recs:
-                rec_name = rec.name if hasattr(rec, 'name') else str(rec)
-                
-                # Read annotations from recommendation individual
-                display_name = rec_name
-                description = None
-                category = "Umum"
-                priority = 1
-                
-                if hasattr(rec, 'hasDisplayName') and rec.hasDisplayName:
-                    display_name = rec.hasDisplayName[0] if isinstance(rec.hasDisplayName, list) else rec.hasDisplayName
-                if hasattr(rec, 'hasDescription') and rec.hasDescription:
-                    description = rec.hasDescription[0] if isinstance(rec.hasDescription, list) else rec.hasDescription
-                if hasattr(rec, 'hasCategory') and rec.hasCategory:
-                    category = rec.hasCategory[0] if isinstance(rec.hasCategory, list) else rec.hasCategory
-                if hasattr(rec, 'hasPriority') and rec.hasPriority:
-                    priority = rec.hasPriority[0] if isinstance(rec.hasPriority, list) else rec.hasPriority
-                
-                rec_entry = {
-                    "recommendation": display_name,
-                    "category": category,
-                    "priority": priority,
-                    "source": "SWRL Inference (from Ontology)"
-                }
-                if description:
-                    rec_entry["description"] = description
-                
-                recommendations.append(rec_entry)
-                self.reasoning_trace.append(f"🎯 Inferred Recommendation: {display_name} ({category})")
+            # Skip if already seen
+            if rec_name in seen_recs:
+                continue
+            seen_recs.add(rec_name)
+            
+            display_name = rec_name
+            description = None
+            priority = 99
+            cat_name = "Umum"
+            
+            # Read annotations from the recommendation individual
+            if hasattr(rec, 'hasDisplayName') and rec.hasDisplayName:
+                display_name = rec.hasDisplayName[0] if isinstance(rec.hasDisplayName, list) else rec.hasDisplayName
+            if hasattr(rec, 'hasDescription') and rec.hasDescription:
+                description = rec.hasDescription[0] if isinstance(rec.hasDescription, list) else rec.hasDescription
+            if hasattr(rec, 'hasCategory') and rec.hasCategory:
+                cat_name = rec.hasCategory[0] if isinstance(rec.hasCategory, list) else rec.hasCategory
+            if hasattr(rec, 'hasPriority') and rec.hasPriority:
+                priority = rec.hasPriority[0] if isinstance(rec.hasPriority, list) else rec.hasPriority
+            
+            rec_entry = {
+                "name": display_name,
+                "category": cat_name,
+                "priority": priority,
+                "source": "SWRL Inference (from Ontology)"
+            }
+            if description:
+                rec_entry["description"] = description
+            
+            recommendations.append(rec_entry)
+            self.reasoning_trace.append(f"💡 Rekomendasi: {display_name} ({cat_name})")
+        
+        # Sort by category and priority
+        recommendations.sort(key=lambda x: (x["category"], x["priority"]))
         
         return recommendations
     
@@ -600,21 +673,94 @@ class KnowledgeService:
             with self.onto:
                 owlready2.destroy_entity(patient)
     
-    def diagnose(self, data: dict) -> dict:
+    def reopen_quadstore(self):
+        """
+        Give this process its own quadstore connection (in a worker forked from a
+        preloading master): the in-memory SQLite database is copied into a fresh
+        connection and the inherited one is closed. Loaded entities are kept.
+        """
+        owlready2 = _get_owlready2()
+        world = self.onto.world
+        inherited = world.graph
+        world.set_backend(filename=":memory:")
+        inherited.db.close()
+        owlready2.World._prepare_sparql.cache_clear()
+    
+    def acquire(self):
+        """Pin this instance for a request (released with release())."""
+        with self._pin_lock:
+            self._pins += 1
+    
+    def release(self):
+        """Unpin; the last request of a retired instance closes it."""
+        with self._pin_lock:
+            self._pins -= 1
+            drained = self.retired and self._pins == 0
+        if drained:
+            self.close()
+    
+    def retire(self):
+        """Stop serving new requests; the world is closed once the pinned requests finish."""
+        with self._pin_lock:
+            self.retired = True
+            drained = self._pins == 0
+        if drained:
+            self.close()
+    
+    def close(self):
+        """
+        Release the owlready2 world: close its quadstore and drop the module-level
+        references that would otherwise keep it alive (prepared SPARQL queries and the
+        last query translator of this thread).
+        """
+        if self.closed:
+            return
+        self.closed = True
+        owlready2 = _get_owlready2()
+        from owlready2.sparql.parser import CURRENT_TRANSLATOR
+        self.onto.world.close()
+        owlready2.World._prepare_sparql.cache_clear()
+        CURRENT_TRANSLATOR.set(None)
+    
+    def diagnose(self, data: dict, use_cache: bool = True, trace: bool = True) -> dict:
         """
         Complete diagnosis workflow.
         
         Args:
             data: Patient data dictionary
+            use_cache: False to always run the reasoner (warm-up, smoke checks);
+                the fresh result still refreshes the result cache
+            trace: False to leave out reasoning_trace (its strings are then never built)
             
         Returns:
             Complete diagnosis result
         """
+        # Cheap priority class from the raw payload, orders the reasoner queue
+        priority = classify_priority(data)
+        
+        # Same payload already diagnosed on this node with this ontology version
+        cached = self.result_cache.get(data) if self.result_cache and use_cache else None
+        if cached is not None:
+            result = dict(
+                cached,
+                patient_id=self._new_patient_id(data),
+                timestamp=datetime.now().isoformat(),
+                priority=PRIORITY_NAMES[priority],
+                cached=True
+            )
+            if not trace:
+                result.pop("reasoning_trace", None)
+            return result
+        
         # Create patient
-        patient_id = self.create_patient(data)
+        patient_id = self.create_patient(data, trace=trace)
         
-        # Run inference
-        self.run_inference()
+        # Run inference (sheds load with ReasonerBusy when the queue is full)
+        try:
+            success = self.run_inference(priority)
+        except ReasonerBusy:
+            self.cleanup_patient(patient_id)
+            raise
         
         # Get results
         diagnoses = self.get_inferred_diagnoses(patient_id)
@@ -622,26 +768,30 @@ class KnowledgeService:
         contraindications = self.get_contraindications(patient_id)
         risk = self.get_risk_category(patient_id)
         severity = self.get_severity(patient_id)
-        reasoning = self.get_reasoning_trace()
         
-        # Get lifestyle recommendations - try SWRL inference first, fallback to hardcoded
+        # Get lifestyle recommendations from SWRL inference (primary)
         lifestyle_recommendations = self.get_inferred_recommendations(patient_id)
         
-        # Fallback to hardcoded method if inference returns empty
+        # Fallback to hardcoded method if SWRL didn't produce recommendations
         if not lifestyle_recommendations:
             has_smoking = data.get('history', {}).get('smoking', False)
             lifestyle_recommendations = self.get_lifestyle_recommendations(diagnoses, has_smoking)
         
+        # Rule layer replay, counted only for the facts the reasoned individual holds
+        inputs, fired, _ = replay(self.rule_engine, data)
+        fired, _ = reconcile(inputs, fired, self.asserted_facts(patient_id))
+        
         # Check for emergency
         emergency = any(d.get("severity") == "Kritis" for d in diagnoses)
         
         # Cleanup (optional - keep for history)
         # self.cleanup_patient(patient_id)
         
-        return {
+        result = {
             "patient_id": patient_id,
             "timestamp": datetime.now().isoformat(),
             "emergency": emergency,
+            "priority": PRIORITY_NAMES[priority],
             "diagnoses": diagnoses,
             "medications": medications,
             "contraindications": contraindications,
@@ -649,6 +799,33 @@ class KnowledgeService:
             "ascvd_score": risk["score"],
             "severity": severity,
             "lifestyle_recommendations": lifestyle_recommendations,
-            "reasoning_trace": reasoning,
-            "rules_fired": len([r for r in reasoning if "Inferred" in r or "Medication" in r])
+            "rules_fired": rules_fired(fired)
         }
+        if trace:
+            result["reasoning_trace"] = self.get_reasoning_trace()
+        # Only complete results (with their trace) are cached
+        if success and trace and self.result_cache:
+            self.result_cache.put(data, result)
+        return result
+    
+    def get_description_texts(self, refs: list = None) -> dict:
+        """Ontology description texts by description_ref (all of them when refs is None)."""
+        if refs is None:
+            return dict(self.description_index)
+        return {ref: self.description_index[ref] for ref in refs if ref in self.description_index}
+    
+    def asserted_facts(self, patient_id: str):
+        """Rule-layer facts (see rule_properties) the patient individual holds after reasoning."""
+        patient = self.onto[patient_id] if patient_id else None
+        if patient is None:
+            return None
+        return facts_from_individual(patient, *self.rule_properties)
+    
+    def explain(self, data: dict, patient_id: str = None) -> list:
+        """
+        Structured trace of a payload: input facts, then every SWRL rule firing and its
+        facts; given the diagnosed patient, checked against its individual (see reconcile).
+        """
+        inputs, fired, timings = replay(self.rule_engine, data)
+        fired, inferred = reconcile(inputs, fired, self.asserted_facts(patient_id))
+        return trace_events(inputs, fired, timings, inferred)
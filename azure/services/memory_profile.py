@@ -0,0 +1,177 @@
+"""
+Memory Profile - CVD Expert System
+What a worker's memory is made of, for the admin memory endpoint.
+
+- world_report(): owlready2 world statistics from SQL counts (entity counts
+  by class, Pasien individuals, rows per quadstore table, SQLite size) and the
+  sizes of the service's in-memory caches and indexes.
+- allocation_sites(): top Python allocation sites over an interval.
+  tracemalloc runs only during that window (started and stopped on demand),
+  so an idle worker pays nothing for it.
+- save_report(): writes the report as JSON and the tracemalloc snapshot for
+  offline diffing:
+
+    python -m services.memory_profile diff before.tracemalloc after.tracemalloc
+"""
+
+import argparse
+import gc
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from services.memory_supervisor import world_stats
+from services.process_stats import memory_stats
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PROFILE_DIR = os.path.join(BASE_DIR, "cache", "memory")
+MAX_SECONDS = 60
+GROUPS = ("lineno", "filename", "traceback")
+RDF_TYPE = 6  # owlready2.rdf_type storid
+QUADSTORE_TABLES = ("resources", "objs", "datas", "ontologies")
+
+_profile_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Another allocation profile is running in this process."""
+
+
+def _short_name(world, storid: int) -> str:
+    iri = world._unabbreviate(storid)
+    return iri.rsplit("#", 1)[-1].rsplit("/", 1)[-1]
+
+
+def entity_counts(onto) -> dict:
+    """{class name: individuals asserted or inferred of that class}, largest first."""
+    rows = onto.world.graph.execute(
+        "SELECT o, COUNT(*) FROM objs WHERE p = ? AND o > 0 GROUP BY o ORDER BY 2 DESC", (RDF_TYPE,)
+    ).fetchall()
+    return {_short_name(onto.world, storid): count for storid, count in rows}
+
+
+def quadstore_stats(onto) -> dict:
+    """Row counts per quadstore table and the SQLite database size."""
+    graph = onto.world.graph
+    stats = {table: graph.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in QUADSTORE_TABLES}
+    page_count = graph.execute("PRAGMA page_count").fetchone()[0]
+    page_size = graph.execute("PRAGMA page_size").fetchone()[0]
+    stats["sqlite_mb"] = round(page_count * page_size / 1024 / 1024, 2)
+    return stats
+
+
+def service_caches(ks) -> dict:
+    """Entry counts of the KnowledgeService's in-memory caches and indexes."""
+    world = ks.onto.world
+    incremental = getattr(ks, "incremental", None)
+    return {
+        "loaded_entities": len(world._entities),
+        "properties": len(world._props),
+        "rules": len(ks.rules),
+        "description_index": len(ks.description_index),
+        "patient_sessions": len(incremental.sessions) if incremental else 0,
+        "result_cache": ks.result_cache.snapshot() if ks.result_cache else None
+    }
+
+
+def world_report(ks, extra_caches: dict = None) -> dict:
+    """World statistics and cache sizes of a service, plus this process's memory."""
+    caches = service_caches(ks)
+    caches.update(extra_caches or {})
+    return {
+        "pid": os.getpid(),
+        "at": datetime.now().isoformat(),
+        "ontology_version": ks.ontology_version[:16],
+        "process": memory_stats(),
+        "python_objects": len(gc.get_objects()),
+        "world": dict(world_stats(ks.onto), quadstore=quadstore_stats(ks.onto)),
+        "entities_by_class": entity_counts(ks.onto),
+        "caches": caches
+    }
+
+
+def _site(stat, group: str) -> dict:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    return {
+        "site": frames[0] if group != "traceback" else frames,
+        "size_kb": round(stat.size / 1024, 1),
+        "size_diff_kb": round(stat.size_diff / 1024, 1),
+        "count": stat.count,
+        "count_diff": stat.count_diff
+    }
+
+
+def allocation_sites(seconds: float, limit: int = 25, group: str = "lineno", frames: int = 1) -> tuple:
+    """
+    Trace allocations for `seconds` and return the sites that grew the most.
+
+    Returns:
+        (report, snapshot): the top sites, and the tracemalloc snapshot taken at the end
+    """
+    if group not in GROUPS:
+        raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+    seconds = max(0.0, min(float(seconds), MAX_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileBusy("An allocation profile is already running in this worker")
+    # Someone else (PYTHONTRACEMALLOC) may already be tracing: leave it running then
+    started = not tracemalloc.is_tracing()
+    try:
+        if started:
+            tracemalloc.start(max(1, frames))
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        traced_kb, peak_kb = (round(v / 1024, 1) for v in tracemalloc.get_traced_memory())
+    finally:
+        if started:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), group)
+    report = {
+        "seconds": seconds,
+        "group": group,
+        "traced_kb": traced_kb,
+        "peak_kb": peak_kb,
+        "growth_kb": round(sum(s.size_diff for s in stats) / 1024, 1),
+        "top": [_site(stat, group) for stat in stats[:limit]]
+    }
+    return report, after
+
+
+def save_report(report: dict, snapshot=None, directory: str = None) -> dict:
+    """Write the report (and the tracemalloc snapshot) to disk; returns the paths."""
+    directory = directory or os.environ.get("MEMORY_PROFILE_DIR") or DEFAULT_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+    paths = {"report": stem + ".json"}
+    with open(paths["report"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    if snapshot is not None:
+        paths["snapshot"] = stem + ".tracemalloc"
+        snapshot.dump(paths["snapshot"])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two saved tracemalloc snapshots.")
+    parser.add_argument("command", choices=["diff"])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--group", choices=GROUPS, default="lineno")
+    parser.add_argument("--limit", type=int, default=25)
+    args = parser.parse_args()
+
+    before = tracemalloc.Snapshot.load(args.before)
+    after = tracemalloc.Snapshot.load(args.after)
+    for stat in after.compare_to(before, args.group)[:args.limit]:
+        print(stat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Memory Supervisor - CVD Expert System
+Keeps a long-running worker's memory bounded.
+
+Every diagnosis leaves its Pasien_* individual, and the facts the reasoner
+inferred for it, in the service's owlready2 world, so a worker grows until the
+container is killed. The supervisor samples the patient count, quadstore rows
+and RSS every MEMORY_CHECK_S seconds. When a limit is crossed it rebuilds the
+KnowledgeService from the ontology file in the background (the hot-reload
+path: build, smoke check, atomic swap; running requests finish on the old
+one, whose world is then closed). If RSS is still over its limit after a rebuild, and the server can
+recycle the worker gracefully (gunicorn), the worker is retired instead and
+the master forks a fresh one from the preloaded base.
+
+A rebuilt service adopts the most recent follow-up sessions, at most half the
+patient limit, so it starts well below it. Rebuilds are at least
+MEMORY_REBUILD_COOLDOWN_S apart.
+
+Environment: MEMORY_CHECK_S (30; 0 = off), MEMORY_MAX_RSS_MB,
+MEMORY_MAX_PATIENTS, MEMORY_MAX_QUADS (0 or unset = no limit),
+MEMORY_REBUILD_COOLDOWN_S (300).
+"""
+
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from datetime import datetime
+
+from services.process_stats import memory_stats
+
+
+RECENT_EVENTS = 20
+
+
+def world_stats(onto) -> dict:
+    """Patient individuals and quadstore rows of a service's world (SQL counts, no object loading)."""
+    graph = onto.world.graph
+    rdf_type = 6  # owlready2.rdf_type storid
+    pasien = onto.Pasien
+    return {
+        "patients": graph.execute(
+            "SELECT COUNT(*) FROM objs WHERE p = ? AND o = ?", (rdf_type, pasien.storid)
+        ).fetchone()[0] if pasien is not None else 0,
+        "quads": graph.execute("SELECT COUNT(*) FROM quads").fetchone()[0]
+    }
+
+
+class MemorySupervisor:
+    """Samples world size and RSS; rebuilds the service or recycles the worker past the limits."""
+
+    def __init__(self, get_current, rebuild, recycle=None, interval: float = None,
+                 max_rss_mb: float = None, max_patients: int = None, max_quads: int = None,
+                 cooldown: float = None):
+        """
+        Args:
+            get_current: () -> the service in use
+            rebuild: (reason) -> starts a background rebuild, False if one is already running
+            recycle: (reason) -> retires this worker gracefully (None: not possible here)
+        """
+        env = os.environ.get
+        self._get_current = get_current
+        self._rebuild = rebuild
+        self.recycle = recycle
+        self.interval = float(env("MEMORY_CHECK_S", "30")) if interval is None else interval
+        self.limits = {
+            "rss_mb": float(env("MEMORY_MAX_RSS_MB", "0")) if max_rss_mb is None else max_rss_mb,
+            "patients": int(env("MEMORY_MAX_PATIENTS", "0")) if max_patients is None else max_patients,
+            "quads": int(env("MEMORY_MAX_QUADS", "0")) if max_quads is None else max_quads
+        }
+        self.cooldown = float(env("MEMORY_REBUILD_COOLDOWN_S", "300")) if cooldown is None else cooldown
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_rebuild = None
+        # Weak reference to the service the last rebuild replaced (it must be freed)
+        self._replaced = None
+        self.events = deque(maxlen=RECENT_EVENTS)
+        self.metrics = {"checks": 0, "rebuilds": 0, "recycles": 0, "skipped": 0, "cooling_down": 0, "last": None}
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and any(v > 0 for v in self.limits.values())
+
+    def sessions_to_keep(self, sessions: list) -> list:
+        """The most recent sessions a rebuilt service adopts (at most half the patient limit)."""
+        limit = self.limits["patients"]
+        if limit <= 0:
+            return sessions
+        keep = limit // 2
+        return sessions[-keep:] if keep else []
+
+    def measure(self, ks=None) -> dict:
+        ks = ks or self._get_current()
+        sample = dict(world_stats(ks.onto), rss_mb=memory_stats().get("rss_mb"))
+        sample["ontology_version"] = ks.ontology_version[:16]
+        return sample
+
+    def _exceeded(self, sample: dict) -> dict:
+        return {
+            name: f"{name} {sample[name]} > {limit}"
+            for name, limit in self.limits.items()
+            if limit > 0 and sample.get(name) is not None and sample[name] > limit
+        }
+
+    def check(self) -> str:
+        """One sample and, past a limit, the action taken: rebuild, recycle, cooling_down, skipped or None."""
+        ks = self._get_current()
+        sample = self.measure(ks)
+        self.metrics["checks"] += 1
+        self.metrics["last"] = dict(sample, at=datetime.now().isoformat())
+
+        exceeded = self._exceeded(sample)
+        if not exceeded:
+            return None
+        reason = ", ".join(exceeded.values())
+
+        # Only RSS is still over on a service that already replaced a grown one: the memory
+        # is not in the world (fragmented heap), and only a new process gives it back
+        rebuilt = self._replaced is not None and self._replaced() is not ks
+        if rebuilt and set(exceeded) == {"rss_mb"} and self.recycle is not None:
+            self._record("recycle", reason, sample)
+            self.metrics["recycles"] += 1
+            print(f"♻️ Recycling worker {os.getpid()}: {reason}")
+            self.recycle(reason)
+            return "recycle"
+
+        if self._last_rebuild is not None and time.monotonic() - self._last_rebuild < self.cooldown:
+            self.metrics["cooling_down"] += 1
+            return "cooling_down"
+        if self._rebuild(f"memory: {reason}"):
+            self._last_rebuild = time.monotonic()
+            self._replaced = weakref.ref(ks)
+            self._record("rebuild", reason, sample)
+            self.metrics["rebuilds"] += 1
+            print(f"🧹 Rebuilding knowledge service: {reason}")
+            return "rebuild"
+        # A reload is already running; its result is sampled next time
+        self.metrics["skipped"] += 1
+        return "skipped"
+
+    def _record(self, action: str, reason: str, sample: dict):
+        self.events.append({"action": action, "reason": reason, "at": datetime.now().isoformat(), "sample": sample})
+
+    def start(self) -> bool:
+        """Start the sampling thread (idempotent; no-op without limits or with MEMORY_CHECK_S=0)."""
+        if not self.enabled or self._thread is not None:
+            return False
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run, name="memory-supervisor", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ Memory check failed: {e}")
+
+    def snapshot(self) -> dict:
+        return dict(self.metrics, enabled=self.enabled, interval_s=self.interval, limits=self.limits,
+                    cooldown_s=self.cooldown, recycle_available=self.recycle is not None,
+                    events=list(self.events))
@@ -0,0 +1,133 @@
+"""
+Patient Facts - CVD Expert System
+Maps the raw diagnosis payload onto ontology property/individual names,
+mirroring KnowledgeService.create_patient, without touching the ontology.
+"""
+
+
+# (payload section, payload key, ontology data property, cast)
+DATA_FIELDS = [
+    ("demographics", "age", "memilikiUsia", int),
+    ("demographics", "gender", "memilikiJenisKelamin", str),
+    ("vitals", "sbp", "memilikiTekananSistolik", int),
+    ("vitals", "dbp", "memilikiTekananDiastolik", int),
+    ("vitals", "hr", "memilikiDenyutJantung", int),
+    ("vitals", "bmi", "memilikiIMT", float),
+    ("vitals", "weight", "memilikiBeratBadan", float),
+    ("vitals", "height", "memilikiTinggiBadan", float),
+    ("labs", "fbg", "memilikiGulaDarahPuasa", float),
+    ("labs", "hba1c", "memilikiHbA1c", float),
+    ("labs", "ldl", "memilikiKolesterolLDL", float),
+    ("labs", "hdl", "memilikiKolesterolHDL", float),
+    ("labs", "total_chol", "memilikiKolesterolTotal", float),
+    ("labs", "triglycerides", "memilikiTrigliserida", float),
+    ("labs", "ef", "memilikiEjectionFraction", float),
+    ("labs", "troponin", "memilikiTroponinI", float),
+    ("labs", "gfr", "memilikiGFR", float),
+    ("labs", "creatinine", "memilikiKreatinin", float),
+    ("labs", "potassium", "memilikiKalium", float),
+    ("labs", "bnp", "memilikiBNP", float),
+    ("labs", "nt_probnp", "memilikiNTproBNP", float),
+    ("scores", "ascvd", "memilikiASCVDScore", float),
+    ("scores", "cha2ds2vasc", "memilikiCHA2DS2VASc", int),
+    ("scores", "hasbled", "memilikiHASBLED", int),
+]
+
+# Symptom checkbox value -> symptom individual
+SYMPTOM_INSTANCES = {
+    "nyeri_dada": "NyeriDada_Instance",
+    "sesak_napas": "SesakNapas_Instance",
+    "edema": "EdemaPerifer_Instance",
+    "kelelahan": "Kelelahan_Instance",
+    "pusing": "Pusing_Instance",
+    "orthopnea": "Orthopnea_Instance",
+    "palpitasi": "Palpitasi_Instance"
+}
+
+# Comorbidity flag -> condition individual (linked via memiliki)
+COMORBID_INSTANCES = {
+    "asthma": "Asma_Instance",
+    "pregnancy": "Kehamilan_Instance",
+    "liver_disease": "PenyakitHatiAktif_Instance"
+}
+
+# History flag -> (object property, individual)
+HISTORY_FACTS = {
+    "cad": ("memilikiRiwayat", "PJK_Instance"),
+    "smoking": ("memiliki", "Merokok_Instance")
+}
+
+
+class PatientFacts:
+    """Data values and object links of a single patient, keyed by property name."""
+
+    __slots__ = ("values", "objects")
+
+    def __init__(self, values: dict = None, objects: dict = None):
+        self.values = values or {}
+        self.objects = objects or {}
+
+    def add(self, prop: str, obj: str) -> bool:
+        """Add an object link; returns True if it is new."""
+        targets = self.objects.setdefault(prop, set())
+        if obj in targets:
+            return False
+        targets.add(obj)
+        return True
+
+    def has(self, prop: str, obj: str) -> bool:
+        return obj in self.objects.get(prop, ())
+
+    def copy(self) -> "PatientFacts":
+        return PatientFacts(dict(self.values), {p: set(o) for p, o in self.objects.items()})
+
+
+def facts_from_payload(data: dict) -> PatientFacts:
+    """
+    Build PatientFacts from a /api/diagnose payload.
+    Values that cannot be cast are skipped (create_patient would reject them anyway).
+    """
+    facts = PatientFacts()
+
+    for section, key, prop, cast in DATA_FIELDS:
+        raw = (data.get(section) or {}).get(key)
+        if raw is None or raw == "":
+            continue
+        try:
+            facts.values[prop] = cast(raw)
+        except (TypeError, ValueError):
+            continue
+
+    for symptom in data.get("symptoms") or []:
+        if symptom in SYMPTOM_INSTANCES:
+            facts.add("memilikiGejala", SYMPTOM_INSTANCES[symptom])
+
+    comorbid = data.get("comorbid") or {}
+    for flag, instance in COMORBID_INSTANCES.items():
+        if comorbid.get(flag):
+            facts.add("memiliki", instance)
+
+    history = data.get("history") or {}
+    for flag, (prop, instance) in HISTORY_FACTS.items():
+        if history.get(flag):
+            facts.add(prop, instance)
+
+    return facts
+
+
+def facts_from_individual(patient, data_properties, object_properties) -> PatientFacts:
+    """Read PatientFacts back from a (reasoned) patient individual."""
+    facts = PatientFacts()
+    for prop in data_properties:
+        value = getattr(patient, prop, None)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is not None:
+            facts.values[prop] = value
+    for prop in object_properties:
+        value = getattr(patient, prop, None)
+        if value is None:
+            continue
+        for obj in (value if isinstance(value, list) else [value]):
+            facts.add(prop, obj.name if hasattr(obj, "name") else str(obj))
+    return facts
@@ -0,0 +1,158 @@
+"""
+Response Format - CVD Expert System
+Smaller diagnosis responses for batch and mobile clients.
+
+- trace=1 keeps the display strings (reasoning_trace), trace=0 drops them and
+  trace=events returns the structured rule trace instead (trace_events,
+  added by the endpoint from KnowledgeService.explain).
+- view=compact: no reasoning_trace (unless trace=1), and every ontology
+  description replaced by a `description_ref` that is resolved once via
+  /api/descriptions/texts (refs are content hashes, stable across workers).
+- fields= / exclude=: comma-separated dotted paths kept or dropped; a path
+  goes through lists, e.g. `diagnoses.name`.
+- Encoding follows the request headers: MessagePack for
+  `Accept: application/msgpack` (when the msgpack package is installed, JSON
+  otherwise), gzip for `Accept-Encoding: gzip` above GZIP_MIN_BYTES.
+"""
+
+import gzip
+import hashlib
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional; clients asking for it get JSON
+    msgpack = None
+
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# Below this gzip costs more CPU than it saves on the wire
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+DESCRIPTION_LISTS = ("diagnoses", "medications", "lifestyle_recommendations")
+
+
+def description_ref(text: str) -> str:
+    """Content-addressed id of a description text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def description_index(onto) -> dict:
+    """{ref: text} of every hasDescription in the ontology (classes and individuals)."""
+    index = {}
+    for entity in list(onto.classes()) + list(onto.individuals()):
+        for text in getattr(entity, "hasDescription", None) or []:
+            index[description_ref(text)] = text
+    return index
+
+
+def parse_paths(value: str) -> list:
+    """'a,b.c' -> [['a'], ['b', 'c']]"""
+    if not value:
+        return []
+    return [part.strip().split(".") for part in value.split(",") if part.strip()]
+
+
+def _select(value, paths: list):
+    if isinstance(value, list):
+        return [_select(item, paths) for item in value]
+    if not isinstance(value, dict):
+        return value
+    selected = {}
+    for key in dict.fromkeys(path[0] for path in paths):
+        if key not in value:
+            continue
+        rest = [path[1:] for path in paths if path[0] == key]
+        # A bare key keeps the whole value
+        selected[key] = value[key] if [] in rest else _select(value[key], rest)
+    return selected
+
+
+def _drop(value, path: list):
+    if isinstance(value, list):
+        for item in value:
+            _drop(item, path)
+    elif isinstance(value, dict) and path[0] in value:
+        if len(path) == 1:
+            del value[path[0]]
+        else:
+            _drop(value[path[0]], path[1:])
+
+
+def project(result: dict, fields: list = None, exclude: list = None) -> dict:
+    """Copy of result with only `fields` (if given) and without `exclude` (parsed paths)."""
+    projected = _select(result, fields) if fields else json.loads(json.dumps(result, default=str))
+    for path in exclude or []:
+        _drop(projected, path)
+    return projected
+
+
+def compact_result(result: dict, descriptions: dict, trace: bool = False) -> dict:
+    """
+    Compact view of a diagnosis result.
+
+    Args:
+        descriptions: the service's description index; texts not in it stay inline
+    """
+    compact = {k: v for k, v in result.items() if trace or k != "reasoning_trace"}
+    for name in DESCRIPTION_LISTS:
+        items = compact.get(name)
+        if not isinstance(items, list):
+            continue
+        entries = []
+        for item in items:
+            text = item.get("description") if isinstance(item, dict) else None
+            if text and description_ref(text) in descriptions:
+                item = {k: v for k, v in item.items() if k != "description"}
+                item["description_ref"] = description_ref(text)
+            entries.append(item)
+        compact[name] = entries
+    return compact
+
+
+def wants_trace(args) -> bool:
+    """Whether the response keeps reasoning_trace (trace=1, the default outside view=compact)."""
+    return args.get("trace", "0" if args.get("view") == "compact" else "1") == "1"
+
+
+def shape_result(result: dict, args, descriptions: dict) -> dict:
+    """Apply the view / trace / fields / exclude query arguments to a diagnosis result."""
+    compact = args.get("view") == "compact"
+    trace = wants_trace(args)
+    if compact:
+        result = compact_result(result, descriptions, trace)
+    elif not trace:
+        result = {k: v for k, v in result.items() if k != "reasoning_trace"}
+    fields, exclude = parse_paths(args.get("fields")), parse_paths(args.get("exclude"))
+    if fields or exclude:
+        result = project(result, fields, exclude)
+    return result
+
+
+def wants_msgpack(accept) -> bool:
+    """accept: werkzeug MIMEAccept of the request"""
+    if msgpack is None:
+        return False
+    # JSON first, so a wildcard Accept keeps getting JSON
+    best = accept.best_match(("application/json",) + MSGPACK_TYPES, default="application/json")
+    return best in MSGPACK_TYPES
+
+
+def encode(body, accept, accept_encodings) -> tuple:
+    """
+    Serialize a response body as negotiated.
+
+    Returns:
+        (bytes, headers)
+    """
+    if wants_msgpack(accept):
+        data = msgpack.packb(body, use_bin_type=True, default=str)
+        headers = {"Content-Type": "application/msgpack"}
+    else:
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if len(data) >= GZIP_MIN_BYTES and accept_encodings["gzip"]:
+        data = gzip.compress(data, GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return data, headers
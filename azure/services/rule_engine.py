@@ -0,0 +1,194 @@
+"""
+Rule Engine - CVD Expert System
+Small in-process forward chainer over compiled SWRL rules.
+Evaluates a single patient's facts without the ontology or the JVM, which makes
+it usable for fast paths (triage, contraindication checks) that must answer
+before Pellet finishes.
+"""
+
+import time
+
+from services.rule_compiler import BUILTIN_OPS, PATIENT_CLASS, is_variable
+
+
+_PATIENT = object()
+
+# Body atoms are matched in this order so that variables are bound before they are tested
+_ATOM_ORDER = {"data": 0, "object": 1, "class": 2, "builtin": 3}
+
+
+class RuleEngine:
+    """Forward chaining with a property-indexed agenda (only affected rules are re-run)."""
+
+    def __init__(self, rules: list, class_members: dict):
+        self.rules = list(rules)
+        self.class_members = class_members
+        self._bodies = {
+            rule.id: sorted(rule.body, key=lambda a: _ATOM_ORDER.get(a[0], 9))
+            for rule in self.rules
+        }
+        # property name -> rules whose body reads it
+        self.dependents = {}
+        for rule in self.rules:
+            for kind, pred, _ in rule.body:
+                if kind in ("data", "object"):
+                    self.dependents.setdefault(pred, []).append(rule)
+        self._downstream = {}
+
+    def subset(self, rule_ids) -> "RuleEngine":
+        """Engine restricted to the given rule ids."""
+        wanted = set(rule_ids)
+        return RuleEngine([r for r in self.rules if r.id in wanted], self.class_members)
+
+    def downstream(self, properties) -> list:
+        """Rules reading any of the properties, closed over what those rules derive, in rule order."""
+        affected = {}
+        for prop in properties:
+            if prop not in self._downstream:
+                self._downstream[prop] = self._closure(prop)
+            affected.update(self._downstream[prop])
+        return sorted(affected.values(), key=lambda r: r.index)
+
+    def _closure(self, prop: str) -> dict:
+        rules = {}
+        frontier = [prop]
+        seen = set()
+        while frontier:
+            current = frontier.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            for rule in self.dependents.get(current, ()):
+                if rule.id not in rules:
+                    rules[rule.id] = rule
+                    frontier.extend(pred for kind, pred, _ in rule.head)
+        return rules
+
+    def _resolve(self, term, binding):
+        if is_variable(term):
+            return binding.get(term)
+        return term
+
+    def _match(self, atoms, i, binding, facts):
+        if i == len(atoms):
+            yield binding
+            return
+
+        kind, pred, args = atoms[i]
+
+        if kind == "class":
+            term = args[0]
+            if pred == PATIENT_CLASS:
+                if is_variable(term) and term not in binding:
+                    binding = dict(binding, **{term: _PATIENT})
+                yield from self._match(atoms, i + 1, binding, facts)
+                return
+            value = self._resolve(term, binding)
+            if value is not None and value in self.class_members.get(pred, ()):
+                yield from self._match(atoms, i + 1, binding, facts)
+            return
+
+        if kind == "data":
+            value = facts.values.get(pred)
+            if value is None:
+                return
+            subject, obj = args
+            binding = dict(binding, **{subject: _PATIENT}) if is_variable(subject) else binding
+            if is_variable(obj):
+                bound = binding.get(obj)
+                if bound is None:
+                    binding = dict(binding, **{obj: value})
+                elif bound != value:
+                    return
+            elif obj != value:
+                return
+            yield from self._match(atoms, i + 1, binding, facts)
+            return
+
+        if kind == "object":
+            subject, obj = args
+            binding = dict(binding, **{subject: _PATIENT}) if is_variable(subject) else binding
+            targets = facts.objects.get(pred, ())
+            value = self._resolve(obj, binding)
+            if value is not None:
+                if value in targets:
+                    yield from self._match(atoms, i + 1, binding, facts)
+                return
+            for target in list(targets):
+                yield from self._match(atoms, i + 1, dict(binding, **{obj: target}), facts)
+            return
+
+        if kind == "builtin":
+            op = BUILTIN_OPS.get(pred)
+            values = [self._resolve(a, binding) for a in args]
+            if op is None or any(v is None for v in values):
+                return
+            try:
+                if op(*values):
+                    yield from self._match(atoms, i + 1, binding, facts)
+            except TypeError:
+                return
+            return
+
+    def _fire(self, rule, binding, facts, derived: set = None) -> list:
+        """Assert the head atoms; returns the (property, value) facts that were new."""
+        produced = []
+        for kind, pred, args in rule.head:
+            value = self._resolve(args[-1], binding)
+            if value is None:
+                continue
+            if derived is not None:
+                derived.add((pred, value))
+            if kind == "object":
+                if facts.add(pred, value):
+                    produced.append((pred, value))
+            elif kind == "data":
+                if facts.values.get(pred) != value:
+                    facts.values[pred] = value
+                    produced.append((pred, value))
+        return produced
+
+    def run(self, facts, agenda=None, support: dict = None, timings: list = None) -> list:
+        """
+        Run rules to a fixpoint, mutating facts in place.
+
+        Args:
+            facts: PatientFacts of one patient
+            agenda: rules to evaluate first (default: all rules)
+            support: if given, filled with rule id -> every (property, value) the
+                rule derived on its last evaluation, new or not (for retraction)
+            timings: if given, appended (rule id, elapsed ns, new facts, head facts
+                derived, new or not) per rule evaluation
+
+        Returns:
+            List of (rule, [(property, value), ...]) for every rule that produced new facts
+        """
+        fired = []
+        queue = list(self.rules if agenda is None else agenda)
+        queued = {r.id for r in queue}
+
+        while queue:
+            rule = queue.pop(0)
+            queued.discard(rule.id)
+
+            produced = []
+            derived = set() if support is not None or timings is not None else None
+            start = time.perf_counter_ns() if timings is not None else 0
+            for binding in list(self._match(self._bodies[rule.id], 0, {}, facts)):
+                produced.extend(self._fire(rule, binding, facts, derived))
+            if timings is not None:
+                timings.append((rule.id, time.perf_counter_ns() - start, len(produced), len(derived)))
+            if support is not None:
+                support[rule.id] = derived
+
+            if not produced:
+                continue
+            fired.append((rule, produced))
+
+            for prop in {p for p, _ in produced}:
+                for dependent in self.dependents.get(prop, ()):
+                    if dependent.id not in queued and dependent.id in self._bodies:
+                        queue.append(dependent)
+                        queued.add(dependent.id)
+
+        return fired
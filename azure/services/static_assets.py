@@ -0,0 +1,208 @@
+"""
+Static Assets - CVD Expert System
+Build and serve the frontend (index.html, style.css, script.js) as
+minified, content-hashed and precompressed files.
+
+The build writes `style.<hash>.css` / `script.<hash>.js` plus .gz (and .br
+when the brotli package is installed) next to them, and an index.html that
+points at the fingerprinted names. Fingerprinted files are served as
+immutable for a year; index.html and the plain names are revalidated with
+their ETag (304). Files are sent from disk in the encoding the client
+accepts, so a page load costs the worker almost nothing.
+
+The build runs at startup (skipped when the output already exists, e.g. from
+the image build) and again when a source file changes.
+
+Usage:
+    python -m services.static_assets build [--static static]
+"""
+
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import send_file, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUILD_DIR = os.path.join(BASE_DIR, "cache", "static")
+ENTRY = "index.html"
+FINGERPRINTED = (".css", ".js")
+IMMUTABLE_MAX_AGE = 365 * 86400
+# Plain (non-fingerprinted) names, for pages loaded before a deploy
+PLAIN_MAX_AGE = 300
+HASH_CHARS = 10
+
+
+def minify_css(text: str) -> str:
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text: str) -> str:
+    """
+    Line-level: indentation, blank lines and whole-line // comments go; line
+    breaks stay (no ASI changes) and multi-line template literals are kept as is.
+    """
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        if not in_template:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+        lines.append(line)
+        if len(re.findall(r"(?<!\\)`", line)) % 2:
+            in_template = not in_template
+    return "\n".join(lines) + "\n"
+
+
+def minify_html(text: str) -> str:
+    text = re.sub(r"<!--(?!\[).*?-->", "", text, flags=re.S)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js, ".html": minify_html}
+
+
+def _write(path: str, data: bytes):
+    # Content-addressed names: a concurrent build by another worker writes the same bytes
+    if os.path.exists(path):
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class StaticAssets:
+    """Minified, fingerprinted and precompressed copies of the static folder's frontend files."""
+
+    def __init__(self, source_dir: str, build_dir: str = None):
+        self.source_dir = source_dir
+        self.build_dir = build_dir or os.environ.get("STATIC_BUILD_DIR") or DEFAULT_BUILD_DIR
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._fingerprints = {}
+        self._sources = None
+        self.error = None
+
+    def _source_state(self) -> dict:
+        state = {}
+        for name in os.listdir(self.source_dir):
+            if name == ENTRY or name.endswith(FINGERPRINTED):
+                st = os.stat(os.path.join(self.source_dir, name))
+                state[name] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def _emit(self, name: str, data: bytes, fingerprinted: bool) -> dict:
+        digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(self.build_dir, f"{stem}.{digest}{ext}")
+        variants = {"identity": path, "gzip": path + ".gz"}
+        _write(path, data)
+        _write(path + ".gz", gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            variants["br"] = path + ".br"
+            _write(path + ".br", brotli.compress(data))
+        return {
+            "name": os.path.basename(path) if fingerprinted else name,
+            "etag": digest,
+            "mimetype": mimetypes.guess_type(name)[0] or "application/octet-stream",
+            "variants": variants,
+            "size": len(data)
+        }
+
+    def build(self) -> dict:
+        """Minify, fingerprint and compress the sources; returns {source name: served name}."""
+        with self._lock:
+            os.makedirs(self.build_dir, exist_ok=True)
+            sources = self._source_state()
+            assets = {}
+            for name in sorted(sources):
+                if name == ENTRY:
+                    continue
+                with open(os.path.join(self.source_dir, name), encoding="utf-8") as f:
+                    text = MINIFIERS[os.path.splitext(name)[1]](f.read())
+                assets[name] = self._emit(name, text.encode("utf-8"), True)
+
+            if ENTRY in sources:
+                with open(os.path.join(self.source_dir, ENTRY), encoding="utf-8") as f:
+                    html = f.read()
+                for name, asset in assets.items():
+                    html = re.sub(rf'((?:href|src)=["\']){re.escape(name)}(["\'])', rf"\g<1>{asset['name']}\g<2>", html)
+                assets[ENTRY] = self._emit(ENTRY, minify_html(html).encode("utf-8"), False)
+
+            self._assets = assets
+            # Earlier fingerprints stay servable for pages that still reference them
+            self._fingerprints.update({a["name"]: a for a in assets.values()})
+            self._sources = sources
+            print(f"📦 Static assets built: {', '.join(a['name'] for a in assets.values())}")
+            return {name: asset["name"] for name, asset in assets.items()}
+
+    def _current(self):
+        # Sources edited in place (development): rebuild on the next page load
+        if self._sources is None or self._source_state() != self._sources:
+            self.build()
+
+    def manifest(self) -> dict:
+        return {name: {"name": a["name"], "size": a["size"], "encodings": sorted(a["variants"])}
+                for name, a in self._assets.items()}
+
+    def serve(self, path: str, request):
+        """Response for a static path; unknown files fall back to the static folder."""
+        if (path == ENTRY or not self._assets) and self.error is None:
+            try:
+                self._current()
+            except OSError as e:
+                # e.g. read-only filesystem: serve the sources as they are
+                self.error = str(e)
+                print(f"⚠️ Static asset build failed, serving unprocessed files: {e}")
+        asset = self._fingerprints.get(path)
+        immutable = asset is not None and path != ENTRY
+        if asset is None:
+            asset = self._assets.get(path)
+        if asset is None:
+            return send_from_directory(self.source_dir, path)
+
+        encoding = next((e for e in ("br", "gzip") if e in asset["variants"] and request.accept_encodings[e]),
+                        "identity")
+        response = send_file(
+            asset["variants"][encoding],
+            mimetype=asset["mimetype"],
+            etag=f"{asset['etag']}-{encoding}",
+            max_age=IMMUTABLE_MAX_AGE if immutable else (0 if path == ENTRY else PLAIN_MAX_AGE),
+            conditional=True
+        )
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        if immutable:
+            response.cache_control.immutable = True
+        elif path == ENTRY:
+            response.cache_control.no_cache = True
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the minified, fingerprinted and compressed frontend assets.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--static", default=os.path.join(BASE_DIR, "static"), help="Source folder")
+    parser.add_argument("--out", default=None, help=f"Output folder (default: $STATIC_BUILD_DIR or {DEFAULT_BUILD_DIR})")
+    args = parser.parse_args()
+    StaticAssets(args.static, args.out).build()
+
+
+if __name__ == "__main__":
+    main()
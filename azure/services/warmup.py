@@ -0,0 +1,110 @@
+"""
+Warm-up - CVD Expert System
+Background warm-up at boot: loads the ontology, builds the indexes and runs a
+few synthetic diagnoses through the reasoner (JVM start, class loading, JIT)
+so the instance only reports ready once it serves at steady-state latency.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from services.resource_governor import ReasonerBusy
+
+
+# Synthetic patients: one quiet case, one that fires most rule groups
+WARMUP_PAYLOADS = [
+    {
+        "demographics": {"name": "Warmup Normal", "age": 40, "gender": "Laki-laki"},
+        "vitals": {"sbp": 118, "dbp": 76, "bmi": 23.0},
+        "labs": {"fbg": 92, "hba1c": 5.3, "ldl": 100, "gfr": 95},
+        "scores": {"ascvd": 3.0},
+        "symptoms": [],
+        "comorbid": {},
+        "history": {}
+    },
+    {
+        "demographics": {"name": "Warmup Kompleks", "age": 65, "gender": "Perempuan"},
+        "vitals": {"sbp": 150, "dbp": 95, "bmi": 31.0},
+        "labs": {"fbg": 150, "hba1c": 7.5, "ldl": 190, "ef": 35, "gfr": 25, "potassium": 5.8},
+        "scores": {"ascvd": 22.0},
+        "symptoms": ["sesak_napas", "edema", "kelelahan"],
+        "comorbid": {"asthma": True},
+        "history": {"smoking": True}
+    },
+]
+
+
+class Warmup:
+    """Runs the warm-up once in a daemon thread and tracks readiness."""
+
+    def __init__(self, get_knowledge_service, payloads: list = None, rounds: int = 1):
+        self._get_ks = get_knowledge_service
+        self._payloads = WARMUP_PAYLOADS if payloads is None else payloads
+        self._rounds = rounds
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = {
+            "status": "pending",
+            "started_at": None,
+            "ready_at": None,
+            "ontology_load_s": None,
+            "warmup_diagnoses": 0,
+            "last_diagnosis_ms": None,
+            "error": None
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.state["status"] == "ready"
+
+    def start(self) -> bool:
+        """Start the warm-up thread (idempotent). Returns True if it was started now."""
+        if self._thread is not None:
+            return False
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run, name="cvd-warmup", daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: float = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def _diagnose(self, ks, payload: dict) -> dict:
+        # Always a real reasoner run (never the persisted result cache), or a restart would
+        # report ready without having started the reasoner once.
+        # Real traffic may already hold the reasoner; wait our turn instead of failing
+        while True:
+            try:
+                return ks.diagnose(payload, use_cache=False)
+            except ReasonerBusy as e:
+                time.sleep(e.retry_after)
+
+    def _run(self):
+        self.state["status"] = "loading"
+        self.state["started_at"] = datetime.now().isoformat()
+        try:
+            start = time.perf_counter()
+            ks = self._get_ks()
+            self.state["ontology_load_s"] = round(time.perf_counter() - start, 3)
+
+            self.state["status"] = "warming"
+            for _ in range(self._rounds):
+                for payload in self._payloads:
+                    start = time.perf_counter()
+                    result = self._diagnose(ks, payload)
+                    self.state["last_diagnosis_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    ks.cleanup_patient(result["patient_id"])
+                    self.state["warmup_diagnoses"] += 1
+
+            self.state["status"] = "ready"
+            self.state["ready_at"] = datetime.now().isoformat()
+            print(f"✅ Warm-up complete: {self.state}")
+        except Exception as e:
+            self.state["status"] = "failed"
+            self.state["error"] = str(e)
+            print(f"❌ Warm-up failed: {e}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Pellet JVM Startup Benchmark - CVD Expert System
+Measures the per-invocation cost of the reasoner JVM (the exact command
+sync_reasoner_pellet runs) without and with the AppCDS archive, plus how many
+classes were actually served from the archive.
+
+Usage:
+    python -m services.jvm_cds build          # once, or let the Dockerfile do it
+    python benchmarks/jvm_startup_benchmark.py
+    python benchmarks/jvm_startup_benchmark.py --repeat 20 --archive /app/jvm/pellet-cds.jsa
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from reasoner_benchmark import DEFAULT_OWL, percentile
+
+from services.jvm_cds import archive_path, export_ntriples, pellet_command, read_metadata
+
+
+def time_invocations(command: list, env: dict, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def count_shared_classes(command: list, env: dict, log_file: str) -> tuple:
+    """(classes from the archive, total classes loaded) for one invocation."""
+    java, rest = command[0], command[1:]
+    subprocess.run([java, f"-Xlog:class+load=info:file={log_file}"] + rest, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    shared = total = 0
+    with open(log_file, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if "source:" not in line:
+                continue
+            total += 1
+            if "shared objects file" in line:
+                shared += 1
+    return shared, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pellet JVM startup cost with and without AppCDS.")
+    parser.add_argument("--owl", default=DEFAULT_OWL, help="Ontology file reasoned over")
+    parser.add_argument("--archive", default=None, help="CDS archive (default: $PELLET_CDS_ARCHIVE or jvm/pellet-cds.jsa)")
+    parser.add_argument("--repeat", type=int, default=10, help="Invocations per configuration")
+    args = parser.parse_args()
+
+    archive = args.archive or archive_path()
+    meta = read_metadata(archive)
+
+    # Strip any archive already configured so the baseline really runs without it
+    base_options = " ".join(
+        opt for opt in os.environ.get("JAVA_TOOL_OPTIONS", "").split()
+        if not opt.startswith("-XX:SharedArchiveFile") and not opt.startswith("-Xshare")
+    )
+    configs = [("no CDS", ["-Xshare:off"])]
+    if meta:
+        configs.append(("AppCDS", ["-Xshare:auto", f"-XX:SharedArchiveFile={archive}"]))
+    else:
+        print(f"⚠️  No CDS archive at {archive}; run `python -m services.jvm_cds build` first.")
+
+    print("=" * 60)
+    print("  Pellet JVM Startup Benchmark")
+    print("=" * 60)
+    print(f"  Ontology: {args.owl}  Repeat: {args.repeat}")
+    print(f"  JAVA_TOOL_OPTIONS: {base_options or '-'}")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nt_file = os.path.join(tmp, "ontology.nt")
+        export_ntriples(args.owl, nt_file)
+
+        rows = []
+        for label, jvm_args in configs:
+            env = dict(os.environ, JAVA_TOOL_OPTIONS=base_options)
+            command = pellet_command(nt_file, jvm_args)
+            try:
+                # One untimed run to warm the page cache for the jars / archive
+                time_invocations(command, env, 1)
+                timings = time_invocations(command, env, args.repeat)
+                shared, total = count_shared_classes(command, env, os.path.join(tmp, f"{len(rows)}.log"))
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"❌ {label}: {e}")
+                sys.exit(1)
+            rows.append({
+                "config": label,
+                "mean_ms": round(statistics.mean(timings), 1),
+                "p50_ms": round(percentile(timings, 50), 1),
+                "p95_ms": round(percentile(timings, 95), 1),
+                "min_ms": round(min(timings), 1),
+                "shared": shared,
+                "classes": total
+            })
+
+    print(f"\n{'config':<8} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'min ms':>10} {'shared/classes':>16}")
+    for row in rows:
+        print(f"{row['config']:<8} {row['mean_ms']:>10} {row['p50_ms']:>10} {row['p95_ms']:>10} "
+              f"{row['min_ms']:>10} {str(row['shared']) + '/' + str(row['classes']):>16}")
+    if len(rows) == 2:
+        saved = rows[0]["p50_ms"] - rows[1]["p50_ms"]
+        print(f"\nAppCDS saves {round(saved, 1)} ms per reasoner invocation at p50 "
+              f"({round(100 * saved / rows[0]['p50_ms'], 1)}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Reasoner Backend Benchmark - CVD Expert System
+Runs the same patient corpus through each reasoner backend (each in a fresh
+process) and reports latency, peak memory and any difference in the inferred
+diagnoses / medications compared with a reference backend.
+
+Usage:
+    python benchmarks/reasoner_benchmark.py
+    python benchmarks/reasoner_benchmark.py --backends pellet,rules --repeat 3
+    python benchmarks/reasoner_benchmark.py --json bench_output.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+DEFAULT_OWL = os.path.join(BASE_DIR, "cvd_sroiq_complete.owl")
+DEFAULT_CORPUS = os.path.join(BASE_DIR, "benchmarks", "patients.json")
+
+# Result fields compared between backends
+COMPARED_FIELDS = ("diagnoses", "medications", "contraindications", "risk_category", "severity")
+
+
+def summarize_result(result: dict) -> dict:
+    """Reduce a diagnosis result to the order-independent parts worth comparing."""
+    return {
+        "diagnoses": sorted(d.get("class", d.get("name")) for d in result.get("diagnoses", [])),
+        "medications": sorted(m.get("name") for m in result.get("medications", [])),
+        "contraindications": sorted(c.get("drug") for c in result.get("contraindications", [])),
+        "risk_category": result.get("risk_category"),
+        "severity": result.get("severity"),
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _run_backend(backend: str, owl_file: str, corpus: list, repeat: int, queue):
+    """Child process: load the ontology with one backend and run the corpus."""
+    from services.knowledge_service import KnowledgeService
+
+    report = {"backend": backend, "latencies_ms": [], "outputs": [], "errors": []}
+    try:
+        start = time.perf_counter()
+        # Off the result cache: every round must time a real reasoner run
+        ks = KnowledgeService(owl_file, reasoner=backend, use_result_cache=False)
+        report["load_s"] = round(time.perf_counter() - start, 3)
+
+        for round_no in range(repeat):
+            for i, payload in enumerate(corpus):
+                start = time.perf_counter()
+                result = ks.diagnose(payload)
+                report["latencies_ms"].append((time.perf_counter() - start) * 1000)
+                ks.cleanup_patient(result["patient_id"])
+
+                errors = [t.strip() for t in result.get("reasoning_trace", []) if t.startswith("❌")]
+                if errors and round_no == 0:
+                    report["errors"].append({"case": i, "errors": errors})
+                if round_no == 0:
+                    report["outputs"].append(summarize_result(result))
+    except Exception as e:
+        report["errors"].append({"case": None, "errors": [str(e)]})
+
+    # ru_maxrss is in KiB on Linux
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    report["peak_child_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    queue.put(report)
+
+
+def run_backend(backend: str, owl_file: str, corpus: list, repeat: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_backend, args=(backend, owl_file, corpus, repeat, queue))
+    proc.start()
+    report = queue.get()
+    proc.join()
+    return report
+
+
+def diff_outputs(reference: dict, other: dict, corpus: list) -> list:
+    """Per-case field differences between two backend reports."""
+    diffs = []
+    for i, (ref, out) in enumerate(zip(reference["outputs"], other["outputs"])):
+        for field in COMPARED_FIELDS:
+            if ref[field] != out[field]:
+                diffs.append({
+                    "case": i,
+                    "patient": corpus[i].get("demographics", {}).get("name", f"#{i}"),
+                    "field": field,
+                    reference["backend"]: ref[field],
+                    other["backend"]: out[field]
+                })
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reasoner backends on a patient corpus.")
+    parser.add_argument("--backends", default="pellet,hermit,rules",
+                        help="Comma-separated backend names (default: pellet,hermit,rules)")
+    parser.add_argument("--reference", default=None,
+                        help="Backend used as the correctness reference (default: first backend)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON list of /api/diagnose payloads")
+    parser.add_argument("--owl", default=DEFAULT_OWL, help="Ontology file")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to run the corpus per backend")
+    parser.add_argument("--json", dest="json_out", default=None, help="Write the full report to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    reference_name = args.reference or backends[0]
+
+    print("=" * 60)
+    print("  Reasoner Backend Benchmark")
+    print("=" * 60)
+    print(f"  Corpus: {args.corpus} ({len(corpus)} patients x {args.repeat})")
+    print(f"  Backends: {', '.join(backends)} (reference: {reference_name})")
+    print("=" * 60)
+
+    reports = {}
+    for backend in backends:
+        print(f"\n⏳ Running {backend}...")
+        reports[backend] = run_backend(backend, args.owl, corpus, args.repeat)
+        for err in reports[backend]["errors"][:3]:
+            print(f"   ❌ case {err['case']}: {err['errors'][0]}")
+
+    print(f"\n{'backend':<10} {'load s':>8} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'RSS MB':>8} {'JVM MB':>8} {'diffs':>6}")
+    reference = reports.get(reference_name)
+    summary = []
+    for backend in backends:
+        report = reports[backend]
+        lat = report["latencies_ms"]
+        diffs = diff_outputs(reference, report, corpus) if reference and backend != reference_name else []
+        report["diffs"] = diffs
+        row = {
+            "backend": backend,
+            "load_s": report.get("load_s"),
+            "mean_ms": round(statistics.mean(lat), 1) if lat else None,
+            "p50_ms": round(percentile(lat, 50), 1),
+            "p95_ms": round(percentile(lat, 95), 1),
+            "peak_rss_mb": report["peak_rss_mb"],
+            "peak_child_rss_mb": report["peak_child_rss_mb"],
+            "diffs": len(diffs),
+            "errors": len(report["errors"])
+        }
+        summary.append(row)
+        print(f"{backend:<10} {row['load_s'] or 0:>8} {row['mean_ms'] or 0:>10} {row['p50_ms']:>10} "
+              f"{row['p95_ms']:>10} {row['peak_rss_mb']:>8} {row['peak_child_rss_mb']:>8} {row['diffs']:>6}")
+
+    for backend in backends:
+        for d in reports[backend].get("diffs", [])[:10]:
+            print(f"  ≠ {backend} [{d['patient']}] {d['field']}: "
+                  f"{reference_name}={d[reference_name]} {backend}={d[backend]}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "reports": reports}, f, indent=2, ensure_ascii=False)
+        print(f"\nReport written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Golden-Corpus Regression Gate - CVD Expert System
+Runs the checked-in golden corpus through a KnowledgeService copy
+(services/ or azure/services/), diffs the outputs against the expected results
+stored for that target and reasoner backend, and compares latency with the
+stored baselines.
+
+Exits non-zero on semantic drift, when p50/p95 latency (of the fastest corpus
+round) regresses by more than the allowed threshold and the timer noise floor,
+when a target cannot run the requested backend, or when nothing was recorded
+yet for a target and backend.
+
+Usage:
+    python benchmarks/regression_gate.py                  # main, corpus backend
+    python benchmarks/regression_gate.py --target azure --backend pellet
+    python benchmarks/regression_gate.py --update         # accept current outputs/latency
+    python benchmarks/regression_gate.py --update --target azure --backend pellet
+    python benchmarks/regression_gate.py --update --seed benchmarks/patients.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+from reasoner_benchmark import BASE_DIR, summarize_result, percentile
+
+GOLDEN_DIR = os.path.join(BASE_DIR, "benchmarks", "golden")
+CORPUS_FILE = os.path.join(GOLDEN_DIR, "corpus.json")
+BASELINE_FILE = os.path.join(GOLDEN_DIR, "baseline.json")
+
+# Each KnowledgeService copy with the ontology file it ships with and the backends it can run
+# (the azure copy has no backend selection: always Pellet)
+TARGETS = {
+    "main": {"root": BASE_DIR, "owl": os.path.join(BASE_DIR, "cvd_sroiq_complete.owl"),
+             "backends": ("pellet", "hermit", "rules"), "selectable": True},
+    "azure": {"root": os.path.join(BASE_DIR, "azure"), "owl": os.path.join(BASE_DIR, "azure", "cvd_sroiq_complete.owl"),
+              "backends": ("pellet",), "selectable": False},
+}
+
+
+def golden_summary(result: dict) -> dict:
+    """Fields of a diagnosis result that must not drift."""
+    summary = summarize_result(result)
+    summary["emergency"] = bool(result.get("emergency"))
+    summary["recommendations"] = sorted(
+        r.get("name") or r.get("recommendation") or "?" for r in result.get("lifestyle_recommendations", [])
+    )
+    summary["rules_fired"] = result.get("rules_fired", 0)
+    return summary
+
+
+def _run_target(root: str, owl_file: str, backend: str, selectable: bool, payloads: list, repeat: int, queue):
+    """Child process: import the target's own services package and run the corpus."""
+    sys.path.insert(0, root)
+    report = {"outputs": [], "latencies_ms": [], "errors": []}
+    try:
+        from services.knowledge_service import KnowledgeService
+        # Off the result cache: latencies are real reasoner runs, and the node's cache file stays untouched
+        if selectable:
+            ks = KnowledgeService(owl_file, reasoner=backend, use_result_cache=False)
+        else:
+            ks = KnowledgeService(owl_file, use_result_cache=False)
+
+        for round_no in range(repeat):
+            for payload in payloads:
+                start = time.perf_counter()
+                result = ks.diagnose(payload)
+                report["latencies_ms"].append((time.perf_counter() - start) * 1000)
+                ks.cleanup_patient(result["patient_id"])
+                if round_no == 0:
+                    report["outputs"].append(golden_summary(result))
+                    errors = [t.strip() for t in result.get("reasoning_trace", []) if t.startswith("❌")]
+                    if errors:
+                        report["errors"].append(errors[0])
+    except Exception as e:
+        report["errors"].append(str(e))
+    queue.put(report)
+
+
+def run_target(name: str, backend: str, payloads: list, repeat: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    target = TARGETS[name]
+    proc = ctx.Process(
+        target=_run_target,
+        args=(target["root"], target["owl"], backend, target["selectable"], payloads, repeat, queue)
+    )
+    proc.start()
+    report = queue.get()
+    proc.join()
+    report["backend"] = backend
+    # Best round: host noise comes in bursts that slow some rounds, a real slowdown shows in all of them
+    n = len(payloads)
+    rounds = [report["latencies_ms"][i:i + n] for i in range(0, len(report["latencies_ms"]), n)] or [[]]
+    report["p50_ms"] = round(min(percentile(r, 50) for r in rounds), 2)
+    report["p95_ms"] = round(min(percentile(r, 95) for r in rounds), 2)
+    return report
+
+
+def load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def check_semantics(name: str, key: str, cases: list, outputs: list) -> list:
+    failures = []
+    missing = [case["name"] for case in cases if key not in case["expected"]]
+    if missing:
+        return [f"[{name}] no golden outputs recorded for {key} ({len(missing)} case(s)); "
+                f"record them with --update --target {name} --backend {key.split(':')[1]}"]
+    for case, actual in zip(cases, outputs):
+        expected = case["expected"][key]
+        for field in sorted(set(expected) | set(actual)):
+            if expected.get(field) != actual.get(field):
+                failures.append(
+                    f"[{name}] {case['name']}: {field} expected={expected.get(field)} actual={actual.get(field)}"
+                )
+    return failures
+
+
+def check_latency(name: str, report: dict, baseline: dict, max_regression: float,
+                  min_delta_ms: float, min_delta_ratio: float) -> list:
+    failures = []
+    key = f"{name}:{report['backend']}"
+    stored = baseline.get(key)
+    if not stored:
+        print(f"   ⚠️  No latency baseline for {key} (run with --update to record one)")
+        return failures
+    for metric in ("p50_ms", "p95_ms"):
+        limit = stored[metric] * (1 + max_regression)
+        # Timer noise floor: absolute for the ms-scale rules backend, relative for the slow reasoners
+        noise_ms = max(min_delta_ms, stored[metric] * min_delta_ratio)
+        if report[metric] > limit and report[metric] - stored[metric] > noise_ms:
+            failures.append(
+                f"[{name}] {metric} regressed: {report[metric]} ms > {round(limit, 2)} ms "
+                f"(baseline {stored[metric]} ms, +{int(max_regression * 100)}% allowed)"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-corpus correctness and latency gate.")
+    parser.add_argument("--target", choices=sorted(TARGETS) + ["all"], default="main")
+    parser.add_argument("--backend", default=None,
+                        help="Reasoner backend (default: the corpus's backend, the one main is gated on)")
+    parser.add_argument("--repeat", type=int, default=5, help="Corpus rounds for latency measurement (the fastest is gated)")
+    parser.add_argument("--max-regression", type=float, default=0.5,
+                        help="Allowed relative p50/p95 increase over baseline (default 0.5 = +50%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore latency increases smaller than this many ms (timer noise, default 0.5)")
+    parser.add_argument("--min-delta-ratio", type=float, default=0.25,
+                        help="...or smaller than this fraction of the baseline (default 0.25 = 25%%)")
+    parser.add_argument("--update", action="store_true", help="Accept current outputs and latency as the new golden")
+    parser.add_argument("--seed", default=None, help="With --update: JSON list of payloads to (re)build the corpus from")
+    args = parser.parse_args()
+
+    golden = load_json(CORPUS_FILE, {"backend": "pellet", "cases": []})
+    baseline = load_json(BASELINE_FILE, {})
+    backend = args.backend or golden.get("backend", "pellet")
+
+    if args.seed:
+        payloads = load_json(args.seed, [])
+        golden["cases"] = [
+            {"name": p.get("demographics", {}).get("name", f"case_{i}"), "payload": p, "expected": {}}
+            for i, p in enumerate(payloads)
+        ]
+    cases = golden["cases"]
+    if not cases:
+        print("❌ Golden corpus is empty. Seed it with --update --seed benchmarks/patients.json")
+        sys.exit(2)
+
+    targets = sorted(TARGETS) if args.target == "all" else [args.target]
+    payloads = [c["payload"] for c in cases]
+    failures = []
+
+    print("=" * 60)
+    print("  Golden-Corpus Regression Gate")
+    print("=" * 60)
+    print(f"  Cases: {len(cases)}  Backend: {backend}  Targets: {', '.join(targets)}")
+    print("=" * 60)
+
+    for name in targets:
+        print(f"\n⏳ {name}...")
+        if backend not in TARGETS[name]["backends"]:
+            failures.append(f"[{name}] cannot run the {backend} backend (supports: {', '.join(TARGETS[name]['backends'])})")
+            print(f"   ❌ {failures[-1]}")
+            continue
+        key = f"{name}:{backend}"
+        report = run_target(name, backend, payloads, args.repeat)
+        print(f"   p50={report['p50_ms']} ms  p95={report['p95_ms']} ms  backend={report['backend']}")
+        for err in report["errors"][:3]:
+            print(f"   ❌ {err}")
+
+        if args.update:
+            if report["errors"]:
+                failures.append(f"[{name}] refusing to record golden outputs from a failing run")
+                continue
+            for case, output in zip(cases, report["outputs"]):
+                case["expected"][key] = output
+            baseline[key] = {
+                "p50_ms": report["p50_ms"],
+                "p95_ms": report["p95_ms"],
+                "recorded": datetime.now().isoformat(timespec="seconds")
+            }
+            continue
+
+        failures += [f"[{name}] {e}" for e in report["errors"][:1]]
+        failures += check_semantics(name, key, cases, report["outputs"])
+        failures += check_latency(name, report, baseline, args.max_regression,
+                                  args.min_delta_ms, args.min_delta_ratio)
+
+    if args.update and not failures:
+        golden["generated"] = datetime.now().isoformat(timespec="seconds")
+        save_json(CORPUS_FILE, golden)
+        save_json(BASELINE_FILE, baseline)
+        print(f"\n✅ Golden corpus and baselines updated ({CORPUS_FILE})")
+        return
+
+    if failures:
+        print(f"\n❌ {len(failures)} regression(s):")
+        for f in failures:
+            print(f"   {f}")
+        sys.exit(1)
+
+    print("\n✅ No semantic drift or latency regression")
+
+
+if __name__ == "__main__":
+    main()
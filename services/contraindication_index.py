@@ -0,0 +1,221 @@
+"""
+Contraindication Index - CVD Expert System
+Precomputed drug x condition matrix built from the SWRL contraindication rules.
+Each condition gets one bit; every medication and drug class stores the bitset
+of conditions that contraindicate it, so a check is a handful of AND operations.
+The reason text of a condition is built from the ontology as well: the display
+name or label of the condition's class, or the label of the data property and
+the rule's threshold.
+"""
+
+import re
+
+from services.rule_compiler import BUILTIN_OPS, BUILTIN_SYMBOLS, PATIENT_CLASS, is_variable
+
+
+CONTRAINDICATION_PROPERTY = "kontraindikasiPada"
+MEDICATION_PROPERTY = "memerlukan"
+MEDICATION_ROOT_CLASS = "Obat"
+
+DEFAULT_REASON = "Kontraindikasi berdasarkan kondisi pasien"
+
+
+def _first(entity, prop: str):
+    values = getattr(entity, prop, None) or []
+    return values[0] if values else None
+
+
+def entity_label(entity) -> str:
+    """Display name, else rdfs:label, else the name split at its capitals ("PenyakitHatiAktif")."""
+    label = _first(entity, "hasDisplayName") or _first(entity, "label")
+    return str(label) if label else re.sub(r"(?<=[a-z])(?=[A-Z])", " ", entity.name)
+
+
+def condition_reason(onto, tests: tuple) -> str:
+    """Reason text of a condition, e.g. "Pasien memiliki Asma" or "eGFR (Estimated GFR) < 30"."""
+    parts = []
+    for test in tests:
+        if test[0] == "entity":
+            individual = onto[test[2]]
+            if individual is None:
+                continue
+            # The condition is the individual's class (Asma_Instance is an Asma)
+            classes = [cls for cls in individual.is_a if hasattr(cls, "name")]
+            parts.append(f"Pasien memiliki {entity_label(classes[0] if classes else individual)}")
+        else:
+            prop = onto[test[1]]
+            label = entity_label(prop) if prop is not None else test[1]
+            parts.append(f"{label} {BUILTIN_SYMBOLS.get(test[2], test[2])} {test[3]}")
+    return "; ".join(parts) or DEFAULT_REASON
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a drug / class name for lookup ("Beta Blocker" == "BetaBlocker")."""
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+class Condition:
+    """A conjunction of patient tests taken from one contraindication rule body."""
+
+    __slots__ = ("key", "tests", "label", "reason")
+
+    def __init__(self, tests: tuple, reason: str = DEFAULT_REASON):
+        # tests: ("entity", prop, individual) or ("value", prop, builtin, constant)
+        self.tests = tests
+        parts = []
+        for test in tests:
+            if test[0] == "entity":
+                parts.append(test[2])
+            else:
+                parts.append(f"{test[1]} {BUILTIN_SYMBOLS.get(test[2], test[2])} {test[3]}")
+        self.key = " & ".join(parts)
+        self.label = self.key
+        self.reason = reason
+
+    def matches(self, facts) -> bool:
+        for test in self.tests:
+            if test[0] == "entity":
+                if not facts.has(test[1], test[2]):
+                    return False
+            else:
+                value = facts.values.get(test[1])
+                if value is None or not BUILTIN_OPS[test[2]](value, test[3]):
+                    return False
+        return True
+
+
+class ContraindicationIndex:
+    """Drug/class -> condition bitsets derived from the ontology at load time."""
+
+    def __init__(self, onto, rules: list):
+        self.conditions = []
+        self.drug_masks = {}
+        self.class_masks = {}
+        self.aliases = {}
+        self._build(onto, rules)
+
+    def _condition_bit(self, onto, tests: tuple) -> int:
+        for i, cond in enumerate(self.conditions):
+            if cond.tests == tests:
+                return 1 << i
+        self.conditions.append(Condition(tests, condition_reason(onto, tests)))
+        return 1 << (len(self.conditions) - 1)
+
+    def _build(self, onto, rules: list):
+        class_targets = {}
+
+        for rule in rules:
+            heads = [a for a in rule.head if a[0] == "object" and a[1] == CONTRAINDICATION_PROPERTY]
+            if not heads:
+                continue
+
+            drug_term = heads[0][2][1]
+            drug_classes = []
+            tests = []
+            bound_values = {}
+
+            for kind, pred, args in rule.body:
+                if kind == "data" and is_variable(args[1]):
+                    bound_values[args[1]] = pred
+
+            for kind, pred, args in rule.body:
+                if kind == "class":
+                    if pred == PATIENT_CLASS:
+                        continue
+                    if args[0] == drug_term:
+                        drug_classes.append(pred)
+                elif kind == "object":
+                    if pred == MEDICATION_PROPERTY:
+                        continue
+                    if not is_variable(args[1]):
+                        tests.append(("entity", pred, args[1]))
+                elif kind == "builtin" and pred in BUILTIN_OPS:
+                    var, const = args[0], args[1]
+                    if var in bound_values and not is_variable(const):
+                        tests.append(("value", bound_values[var], pred, const))
+
+            bit = self._condition_bit(onto, tuple(tests))
+            if is_variable(drug_term):
+                for cls_name in drug_classes:
+                    class_targets[cls_name] = class_targets.get(cls_name, 0) | bit
+            else:
+                self.drug_masks[drug_term] = self.drug_masks.get(drug_term, 0) | bit
+
+        root = onto[MEDICATION_ROOT_CLASS]
+        drug_classes = list(root.descendants()) if root else []
+
+        # A class is contraindicated by every rule that targets it or an ancestor
+        for cls in drug_classes:
+            mask = 0
+            for ancestor in cls.ancestors():
+                mask |= class_targets.get(getattr(ancestor, "name", None), 0)
+            self.class_masks[cls.name] = mask
+            self.aliases[normalize_name(cls.name)] = ("class", cls.name)
+
+        for drug in (root.instances() if root else []):
+            mask = self.drug_masks.get(drug.name, 0)
+            for drug_cls in drug.is_a:
+                mask |= self.class_masks.get(getattr(drug_cls, "name", None), 0)
+            self.drug_masks[drug.name] = mask
+            self.aliases[normalize_name(drug.name)] = ("drug", drug.name)
+            for display in getattr(drug, "hasDisplayName", []) or []:
+                self.aliases.setdefault(normalize_name(display), ("drug", drug.name))
+
+    def input_properties(self) -> tuple:
+        """(data properties, object properties) read by the index conditions."""
+        data_props = {t[1] for c in self.conditions for t in c.tests if t[0] == "value"}
+        object_props = {t[1] for c in self.conditions for t in c.tests if t[0] == "entity"}
+        return data_props, object_props
+
+    def patient_mask(self, facts) -> int:
+        """Bitset of index conditions present in the patient facts."""
+        mask = 0
+        for i, cond in enumerate(self.conditions):
+            if cond.matches(facts):
+                mask |= 1 << i
+        return mask
+
+    def lookup(self, name: str):
+        """Resolve a medication or drug-class name to (kind, canonical_name, mask)."""
+        entry = self.aliases.get(normalize_name(name))
+        if entry is None:
+            return None
+        kind, canonical = entry
+        masks = self.drug_masks if kind == "drug" else self.class_masks
+        return kind, canonical, masks.get(canonical, 0)
+
+    def reasons(self, name: str, patient_mask: int) -> list:
+        """Conditions (as Condition objects) contraindicating a medication for a patient."""
+        entry = self.lookup(name)
+        if entry is None:
+            return []
+        hits = entry[2] & patient_mask
+        found = []
+        while hits:
+            low = hits & -hits
+            found.append(self.conditions[low.bit_length() - 1])
+            hits ^= low
+        return found
+
+    def check(self, medications: list, facts) -> dict:
+        """Check a medication list against patient facts without reasoning."""
+        mask = self.patient_mask(facts)
+        contraindications = []
+        unknown = []
+
+        for name in medications:
+            entry = self.lookup(name)
+            if entry is None:
+                unknown.append(name)
+                continue
+            kind, canonical, _ = entry
+            for cond in self.reasons(name, mask):
+                contraindications.append({
+                    "drug": canonical,
+                    "type": kind,
+                    "condition": cond.label,
+                    "reason": cond.reason,
+                    "source": "Contraindication Index (from SWRL Rules)"
+                })
+
+        return {"contraindications": contraindications, "unknown_medications": unknown}
@@ -0,0 +1,235 @@
+"""
+Hot Reload - CVD Expert System
+Replaces the KnowledgeService when the ontology file changes, without
+restarting the worker. The new service (ontology, rule indexes, caches) is
+built in a background thread and validated on a smoke corpus before it is
+swapped in; requests already running keep the service they started with.
+Each smoke case must give the same diagnoses and severity as the live
+service, or as the case's own `expected` outcome when the edit is meant to
+change it. A failed build or smoke run leaves the current service in place.
+
+Triggers: an admin call to trigger(), or the file watcher, which polls the
+ontology file every ONTOLOGY_WATCH_S seconds (0 = off). It reloads once the
+file has stopped changing for one interval and its hash differs.
+Smoke corpus: ONTOLOGY_SMOKE_CORPUS (a JSON list of /api/diagnose payloads),
+else the warm-up patients. The smoke run waits at most ONTOLOGY_SMOKE_BUSY_S
+seconds (120) in total for reasoner slots held by live traffic; past that the
+reload ends with status "busy" and can be triggered again later.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from services.resource_governor import ReasonerBusy
+from services.result_cache import file_sha256
+from services.warmup import WARMUP_PAYLOADS
+
+
+def load_smoke_corpus(path: str = None) -> list:
+    """
+    Smoke cases: a JSON list whose items are /api/diagnose payloads, or
+    {"payload": ..., "expected": {"diagnoses": [class names], "severity": ...}}
+    for cases whose outcome the new ontology is meant to change.
+    """
+    path = path or os.environ.get("ONTOLOGY_SMOKE_CORPUS")
+    if not path:
+        return WARMUP_PAYLOADS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def smoke_outcome(result: dict) -> dict:
+    """The parts of a result a reload must not change unexpectedly."""
+    return {
+        "diagnoses": sorted(d.get("class") or d.get("name") for d in result.get("diagnoses") or []),
+        "severity": result.get("severity")
+    }
+
+
+class SmokeBusy(RuntimeError):
+    """Live traffic held the reasoner for the whole smoke deadline."""
+
+
+def _diagnose(ks, payload: dict, deadline: float) -> dict:
+    while True:
+        try:
+            result = ks.diagnose(payload, use_cache=False)
+            break
+        except ReasonerBusy as e:
+            # Live traffic shares the reasoner; wait our turn, up to the deadline
+            if time.monotonic() + e.retry_after > deadline:
+                raise SmokeBusy(f"reasoner busy with live traffic: {e}") from e
+            time.sleep(e.retry_after)
+    ks.cleanup_patient(result["patient_id"])
+    return result
+
+
+def smoke_check(ks, cases: list, reference=None, busy_timeout: float = None) -> list:
+    """
+    Diagnose every case on a candidate service and compare diagnoses and severity
+    with the case's `expected`, else with the reference (live) service's result.
+    Raises on the first broken or differing case, SmokeBusy when no reasoner slot
+    frees up within busy_timeout seconds (ONTOLOGY_SMOKE_BUSY_S) in total.
+
+    Returns:
+        Per case: name, diagnoses, severity, what it was compared with and elapsed ms
+    """
+    if busy_timeout is None:
+        busy_timeout = float(os.environ.get("ONTOLOGY_SMOKE_BUSY_S", "120"))
+    deadline = time.monotonic() + busy_timeout
+    report = []
+    for case in cases:
+        payload = case["payload"] if "payload" in case else case
+        name = case.get("name") or payload.get("demographics", {}).get("name", "?")
+        start = time.perf_counter()
+        try:
+            result = _diagnose(ks, payload, deadline)
+        except SmokeBusy as e:
+            raise SmokeBusy(f"Smoke case '{name}': {e}") from e
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        failed = [line for line in result.get("reasoning_trace", []) if line.lstrip().startswith(("❌", "⏱️"))]
+        if failed:
+            raise RuntimeError(f"Smoke case '{name}': {failed[0].strip()}")
+        if not isinstance(result.get("diagnoses"), list):
+            raise RuntimeError(f"Smoke case '{name}' returned no diagnoses list")
+
+        outcome = smoke_outcome(result)
+        if "expected" in case:
+            expected, against = case["expected"], "corpus"
+        elif reference is not None:
+            expected, against = smoke_outcome(_diagnose(reference, payload, deadline)), "live"
+        else:
+            expected, against = None, None
+        for field in (expected or {}):
+            if outcome.get(field) != expected[field]:
+                raise RuntimeError(
+                    f"Smoke case '{name}': {field} {outcome.get(field)} differs from {against} {expected[field]}"
+                )
+        report.append(dict(outcome, name=name, compared_with=against, elapsed_ms=elapsed_ms))
+    return report
+
+
+class OntologyReloader:
+    """Background build, smoke validation and swap of the knowledge service."""
+
+    def __init__(self, ontology_path: str, get_current, build, swap, corpus: list = None,
+                 watch_interval: float = None):
+        """
+        Args:
+            get_current: () -> the service in use
+            build: () -> a new service loaded from ontology_path
+            swap: (new_service) -> None, installs it for the next requests
+        """
+        self.ontology_path = ontology_path
+        self._get_current = get_current
+        self._build = build
+        self._swap = swap
+        self._corpus = corpus
+        self.watch_interval = (float(os.environ.get("ONTOLOGY_WATCH_S", "0"))
+                               if watch_interval is None else watch_interval)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._watcher = None
+        self.state = {
+            "status": "idle",
+            "trigger": None,
+            "version": None,
+            "previous_version": None,
+            "started_at": None,
+            "finished_at": None,
+            "build_s": None,
+            "smoke": None,
+            "error": None,
+            "reloads": 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self, reason: str = "admin", force: bool = False) -> bool:
+        """Start a reload in the background. False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=self._run, args=(reason, force), name="ontology-reload", daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: float = None) -> dict:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state
+
+    def _run(self, reason: str, force: bool):
+        state = self.state
+        state.update(status="building", trigger=reason, started_at=datetime.now().isoformat(),
+                     finished_at=None, build_s=None, smoke=None, error=None)
+        try:
+            current = self._get_current()
+            if not force and file_sha256(self.ontology_path) == current.ontology_version:
+                state["status"] = "unchanged"
+                return
+
+            start = time.perf_counter()
+            candidate = self._build()
+            state["build_s"] = round(time.perf_counter() - start, 3)
+            state["version"] = candidate.ontology_version[:16]
+
+            state["status"] = "validating"
+            corpus = self._corpus if self._corpus is not None else load_smoke_corpus()
+            state["smoke"] = smoke_check(candidate, corpus, reference=current)
+
+            self._swap(candidate)
+            state["previous_version"] = current.ontology_version[:16]
+            state["status"] = "swapped"
+            state["reloads"] += 1
+            print(f"🔄 Ontology reloaded ({reason}): {state['previous_version']} -> {state['version']}")
+        except SmokeBusy as e:
+            state["status"] = "busy"
+            state["error"] = str(e)
+            print(f"⏳ Ontology reload gave up, keeping the current version: {e}")
+        except Exception as e:
+            state["status"] = "failed"
+            state["error"] = str(e)
+            print(f"❌ Ontology reload failed, keeping the current version: {e}")
+        finally:
+            state["finished_at"] = datetime.now().isoformat()
+
+    def start_watching(self) -> bool:
+        """Start the file watcher (idempotent; no-op when ONTOLOGY_WATCH_S is 0)."""
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return False
+        with self._lock:
+            if self._watcher is not None:
+                return False
+            self._watcher = threading.Thread(target=self._watch, name="ontology-watch", daemon=True)
+            self._watcher.start()
+            return True
+
+    def _stat(self):
+        try:
+            st = os.stat(self.ontology_path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _watch(self):
+        seen = self._stat()
+        pending = None
+        while True:
+            time.sleep(self.watch_interval)
+            current = self._stat()
+            if current is None or current == seen:
+                pending = None
+                continue
+            if current != pending:
+                # Still being written (or just changed); check again next interval
+                pending = current
+                continue
+            seen, pending = current, None
+            self.trigger("file-watch")
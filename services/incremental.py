@@ -0,0 +1,268 @@
+"""
+Incremental Re-diagnosis - CVD Expert System
+Longitudinal patient sessions for follow-up visits: new observations update the
+existing Pasien_* individual and only the rules downstream of the changed input
+properties are re-evaluated, with per-rule support sets so facts whose
+derivation no longer holds are retracted (Rete-style dependency tracking).
+
+The session's derived facts come from the in-process rule engine (SWRL layer),
+so this path is used with the `rules` backend only. With Pellet or HermiT the
+reasoner's own inferences (OWL class axioms) cannot be retracted rule by rule:
+KnowledgeService.rediagnose rebuilds the individual from the updated payload
+and runs the reasoner again, then rebases the session (see rebase).
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from owlready2 import FunctionalProperty, ObjectPropertyClass
+
+from services.patient_facts import PatientFacts, facts_from_payload
+
+
+# Result lists compared by key, and scalar fields compared by value
+DIFF_LISTS = {
+    "diagnoses": lambda d: d.get("class") or d.get("name"),
+    "medications": lambda m: m.get("name"),
+    "contraindications": lambda c: c.get("drug"),
+    "lifestyle_recommendations": lambda r: r.get("name"),
+}
+DIFF_VALUES = ("emergency", "risk_category", "ascvd_score", "severity")
+
+
+def fact_set(facts: PatientFacts) -> set:
+    """All (property, value) pairs of a PatientFacts."""
+    pairs = set(facts.values.items())
+    for prop, objs in facts.objects.items():
+        pairs.update((prop, obj) for obj in objs)
+    return pairs
+
+
+def merge_observations(payload: dict, observations: dict) -> dict:
+    """
+    New payload with the observations applied: dict sections are merged per key
+    (null removes the value), "symptoms" replaces the list.
+    """
+    merged = copy.deepcopy(payload)
+    for section, values in observations.items():
+        if isinstance(values, dict):
+            target = merged.setdefault(section, {})
+            for key, value in values.items():
+                if value is None:
+                    target.pop(key, None)
+                else:
+                    target[key] = value
+        else:
+            merged[section] = copy.deepcopy(values)
+    return merged
+
+
+def diff_results(before: dict, after: dict) -> dict:
+    """Changed parts of two diagnosis results (only fields that differ)."""
+    diff = {}
+    for field, key in DIFF_LISTS.items():
+        old = {key(x) for x in before.get(field, [])}
+        new = {key(x) for x in after.get(field, [])}
+        if old != new:
+            diff[field] = {"added": sorted(new - old), "removed": sorted(old - new)}
+    for field in DIFF_VALUES:
+        if before.get(field) != after.get(field):
+            diff[field] = {"before": before.get(field), "after": after.get(field)}
+    return diff
+
+
+class PatientSession:
+    """Payload, last result and rule-derived state of one patient."""
+
+    __slots__ = ("patient_id", "payload", "diagnosed_payload", "result", "asserted", "facts", "support")
+
+    def __init__(self, patient_id: str, payload: dict, result: dict):
+        self.patient_id = patient_id
+        # Current observations, and the ones the last result was derived from
+        self.payload = copy.deepcopy(payload)
+        self.diagnosed_payload = self.payload
+        self.result = result
+        # Built on the first follow-up, so plain diagnoses pay nothing
+        self.asserted = None
+        self.facts = None
+        self.support = None
+
+
+class IncrementalDiagnosis:
+    """Session store plus the dependency-tracked re-evaluation."""
+
+    def __init__(self, engine, max_sessions: int = None):
+        self.engine = engine
+        self.max_sessions = max_sessions or int(os.environ.get("PATIENT_SESSIONS_MAX", "500"))
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, patient_id: str, payload: dict, result: dict):
+        with self._lock:
+            self.sessions[patient_id] = PatientSession(patient_id, payload, result)
+            self.sessions.move_to_end(patient_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def adopt(self, session: PatientSession):
+        """Take over a session from another store (the service this one replaces)."""
+        with self._lock:
+            self.sessions.setdefault(session.patient_id, session)
+
+    def export(self) -> list:
+        """Sessions, least recently used first."""
+        with self._lock:
+            return list(self.sessions.values())
+
+    def drop(self, patient_id: str):
+        with self._lock:
+            self.sessions.pop(patient_id, None)
+
+    def get(self, patient_id: str) -> PatientSession:
+        """Session of a patient; KeyError if it was never diagnosed here (or was evicted)."""
+        with self._lock:
+            session = self.sessions[patient_id]
+            self.sessions.move_to_end(patient_id)
+            return session
+
+    def update_observations(self, patient_id: str, observations: dict) -> list:
+        """Apply follow-up observations; returns the input properties changed since the last diagnosis."""
+        session = self.get(patient_id)
+        session.payload = merge_observations(session.payload, observations)
+        return self.changed_properties(session)
+
+    def _ensure_state(self, session: PatientSession):
+        if session.facts is not None:
+            return
+        # Derived state of the observations the last result came from
+        session.asserted = facts_from_payload(session.diagnosed_payload)
+        session.facts = session.asserted.copy()
+        session.support = {}
+        self.engine.run(session.facts, None, session.support)
+
+    def changed_properties(self, session: PatientSession) -> list:
+        """Input properties that differ between the session's payload and the last diagnosed one."""
+        old = fact_set(facts_from_payload(session.diagnosed_payload))
+        new = fact_set(facts_from_payload(session.payload))
+        return sorted({prop for prop, _ in old ^ new})
+
+    def rebase(self, session: PatientSession):
+        """The payload was re-diagnosed in full (reasoner run): drop the rule-derived state built for the old one."""
+        session.diagnosed_payload = session.payload
+        session.asserted = None
+        session.facts = None
+        session.support = None
+
+    def ranked_facts(self, session: PatientSession) -> list:
+        """
+        The session's current facts in the order a full run writes them back:
+        inputs first, then per rule in rule order (what apply_delta picks
+        functional property values from).
+        """
+        self._ensure_state(session)
+        current = fact_set(session.facts)
+        ranked = sorted(fact_set(session.asserted), key=str)
+        seen = set(ranked)
+        for rule in self.engine.rules:
+            for pair in sorted(session.support.get(rule.id, ()), key=str):
+                if pair in current and pair not in seen:
+                    ranked.append(pair)
+                    seen.add(pair)
+        return ranked
+
+    def reevaluate(self, session: PatientSession) -> dict:
+        """
+        Bring the session's facts up to date with its payload.
+
+        Returns:
+            {"removed": set, "added": set, "changed_properties": list,
+             "rules_reevaluated": int, "elapsed_us": float}
+        """
+        start = time.perf_counter()
+        self._ensure_state(session)
+        facts = session.facts
+        before = fact_set(facts)
+
+        new_asserted = facts_from_payload(session.payload)
+        old_pairs, new_pairs = fact_set(session.asserted), fact_set(new_asserted)
+        changed = {prop for prop, _ in old_pairs ^ new_pairs}
+        affected = self.engine.downstream(changed)
+        affected_ids = {rule.id for rule in affected}
+
+        # Facts still justified by a rule outside the affected region
+        kept = set(new_pairs)
+        for rule_id, derived in session.support.items():
+            if rule_id not in affected_ids:
+                kept |= derived
+
+        # Retract old inputs and everything the affected rules derived
+        retract = (old_pairs - new_pairs) | set().union(*(session.support.pop(r, set()) for r in affected_ids))
+        for prop, value in retract - kept:
+            if facts.values.get(prop) == value:
+                del facts.values[prop]
+            elif value in facts.objects.get(prop, ()):
+                facts.objects[prop].discard(value)
+        for prop, value in new_pairs - old_pairs:
+            if prop in new_asserted.values:
+                facts.values[prop] = value
+            else:
+                facts.add(prop, value)
+
+        self.engine.run(facts, affected, session.support)
+
+        session.asserted = new_asserted
+        session.diagnosed_payload = session.payload
+        after = fact_set(facts)
+        return {
+            "removed": before - after,
+            "added": after - before,
+            "changed_properties": sorted(changed),
+            "rules_reevaluated": len(affected),
+            "elapsed_us": round((time.perf_counter() - start) * 1e6, 1)
+        }
+
+
+def apply_delta(onto, patient, removed: set, added: set, ranked: list):
+    """
+    Write a fact delta onto the patient individual.
+
+    Non-functional properties get the delta itself. A functional property holds
+    a single value, so every one the delta touches is recomputed from ranked
+    (the session's current facts in write-back order, see ranked_facts): its
+    first remaining value, or None - the same rule as RuleEngineBackend.
+    """
+    functional = {}
+    with onto:
+        for prop_name, value in removed:
+            prop = onto[prop_name]
+            if prop is None:
+                continue
+            if FunctionalProperty in prop.is_a:
+                functional[prop_name] = prop
+                continue
+            target = onto[value] if isinstance(prop, ObjectPropertyClass) else value
+            values = getattr(patient, prop.python_name)
+            if target in values:
+                values.remove(target)
+
+        for prop_name, value in sorted(added, key=str):
+            prop = onto[prop_name]
+            if prop is None:
+                continue
+            if FunctionalProperty in prop.is_a:
+                functional[prop_name] = prop
+                continue
+            target = onto[value] if isinstance(prop, ObjectPropertyClass) else value
+            if target is None:
+                continue
+            values = getattr(patient, prop.python_name)
+            if target not in values:
+                values.append(target)
+
+        for prop_name, prop in functional.items():
+            is_object = isinstance(prop, ObjectPropertyClass)
+            targets = (onto[value] if is_object else value for name, value in ranked if name == prop_name)
+            setattr(patient, prop.python_name, next((t for t in targets if t is not None), None))
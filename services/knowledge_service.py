@@ -4,49 +4,143 @@ Handles ontology loading, patient instance creation, and Pellet reasoning.
 """
 
 from owlready2 import *
-# Set Java Memory to 1024M to prevent OOM in Azure Functions (Default is 2000M)
+# JVM heap is sized per run by the resource governor (services/resource_governor.py)
 import owlready2
-owlready2.reasoning.JAVA_MEMORY = 1024
+from owlready2.sparql.parser import CURRENT_TRANSLATOR
+import hashlib
+import io
 import uuid
 import os
+import threading
+import time
 from datetime import datetime
 
+from services.rule_compiler import compile_rules, class_members
+from services.rule_engine import RuleEngine
+from services.triage import TriageEvaluator
+from services.patient_facts import SYMPTOM_INSTANCES, facts_from_payload, facts_from_individual
+from services.contraindication_index import ContraindicationIndex, DEFAULT_REASON
+from services.reasoners import RuleEngineBackend, get_reasoner_backend
+from services.incremental import IncrementalDiagnosis, apply_delta, diff_results
+from services.sweep import ParameterSweep
+from services.threshold_map import ThresholdMap
+from services.result_cache import ResultCache
+from services.response_format import description_index
+from services.history_record import history_catalog
+from services.rule_profile import RuleProfile, reconcile, replay, rules_fired, trace_events
+from services.priority import PRIORITY_NAMES, PRIORITY_ROUTINE, classify_priority
+from services.resource_governor import ResourceGovernor, ReasonerBusy, ReasonerRun, ReasonerTimeout
+
+
+class _NoTrace(list):
+    """reasoning_trace of a diagnosis whose caller did not ask for it: lines are dropped."""
+
+    def append(self, line):
+        pass
+
 
 class KnowledgeService:
     """Service for interacting with the CVD ontology."""
     
-    def __init__(self, ontology_path: str):
-        """Initialize the knowledge service with ontology."""
+    def __init__(self, ontology_path: str, reasoner: str = None, governor: ResourceGovernor = None,
+                 use_result_cache: bool = True, background: bool = False):
+        """
+        Initialize the knowledge service with ontology.
+        
+        Args:
+            ontology_path: Path to the OWL file
+            reasoner: Reasoner backend name (pellet, hermit, rules);
+                defaults to the REASONER_BACKEND environment variable, then pellet
+            governor: Share an existing ResourceGovernor (e.g. with the service a reload replaces)
+            use_result_cache: False for side instances (shadow candidates) that must not
+                touch the node's shared result cache
+            background: Reasoner runs take the lowest priority and never queue: they are
+                shed (ReasonerBusy) unless a slot of the governor is free right now
+        """
         self.ontology_path = ontology_path
+        self.reasoner = get_reasoner_backend(reasoner or os.environ.get("REASONER_BACKEND"))
         self.onto = None
         self.reasoning_trace = []
+        self.rules = []
+        self.rule_properties = (set(), set())
+        self.contraindication_index = None
+        self.rule_engine = None
+        self.triage_evaluator = None
+        self.incremental = None
+        self.sweep = None
+        self.threshold_map = None
+        self.description_index = {}
+        self.history_catalog = {}
+        self.rule_profile = None
+        self.ontology_version = None
+        self.result_cache = None
+        self.use_result_cache = use_result_cache
+        self.background = background
+        self.governor = governor or ResourceGovernor(ontology_path)
+        # Requests pinned to this instance; a retired instance closes its world at zero
+        self._pins = 0
+        self._pin_lock = threading.Lock()
+        self._on_drained = None
+        self.retired = False
+        self.closed = False
         self._load_ontology()
+        self._build_indexes()
     
     def _load_ontology(self):
         """Load the ontology from file."""
         if not os.path.exists(self.ontology_path):
             raise FileNotFoundError(f"Ontology file not found: {self.ontology_path}")
         
+        # Hash and parse the same bytes, so the version always matches what was loaded
+        with open(self.ontology_path, "rb") as f:
+            content = f.read()
+        self.ontology_version = hashlib.sha256(content).hexdigest()
+        
+        # Own world per service, so a reloaded ontology never mixes with the one it replaces
         # Use file:// protocol for owlready2
         onto_path = "file://" + self.ontology_path.replace(" ", "%20")
-        self.onto = get_ontology(onto_path).load()
+        self.onto = World().get_ontology(onto_path).load(fileobj=io.BytesIO(content))
     
-    def create_patient(self, data: dict) -> str:
+    def _build_indexes(self):
+        """Precompute rule-derived indexes once, right after the ontology is loaded."""
+        self.rules = compile_rules(self.onto)
+        # (data, object) properties the rules read or write: the individual's rule-layer facts
+        self.rule_properties = (
+            {pred for rule in self.rules for kind, pred, _ in rule.body + rule.head if kind == "data"},
+            {pred for rule in self.rules for kind, pred, _ in rule.body + rule.head if kind == "object"}
+        )
+        self.contraindication_index = ContraindicationIndex(self.onto, self.rules)
+        self.rule_engine = RuleEngine(self.rules, class_members(self.onto, self.rules))
+        self.triage_evaluator = TriageEvaluator(self.onto, self.rules, self.rule_engine)
+        self.incremental = IncrementalDiagnosis(self.rule_engine)
+        self.threshold_map = ThresholdMap(self.onto, self.rules)
+        self.sweep = ParameterSweep(self.onto, self.rule_engine, self.threshold_map)
+        self.description_index = description_index(self.onto)
+        self.history_catalog = history_catalog(self.onto)
+        self.rule_profile = RuleProfile(self.rules)
+        # Shared by the workers of this node; results are per ontology version and backend
+        if self.use_result_cache:
+            self.result_cache = ResultCache.from_env(self.ontology_version, self.reasoner.name)
+    
+    def create_patient(self, data: dict, patient_id: str = None, trace: bool = True) -> str:
         """
         Create a patient individual in the ontology.
         
         Args:
             data: Patient data dictionary with demographics, vitals, labs, etc.
+            patient_id: Reuse this id (default: a new one from the name)
+            trace: False to skip the reasoning_trace display strings
             
         Returns:
             Patient ID (individual name)
         """
-        self.reasoning_trace = []
+        self.reasoning_trace = [] if trace else _NoTrace()
         
         with self.onto:
             # Generate unique patient ID
-            patient_name = data.get("demographics", {}).get("name", "Unknown")
-            patient_id = f"Pasien_{patient_name.replace(' ', '_')}_{uuid.uuid4().hex[:8]}"
+            if patient_id is None:
+                patient_name = data.get("demographics", {}).get("name", "Unknown")
+                patient_id = f"Pasien_{patient_name.replace(' ', '_')}_{uuid.uuid4().hex[:8]}"
             
             # Create patient individual
             Pasien = self.onto.Pasien
@@ -125,15 +219,7 @@ class KnowledgeService:
             
             # Add symptoms
             symptoms = data.get("symptoms", [])
-            symptom_map = {
-                "nyeri_dada": "NyeriDada_Instance",
-                "sesak_napas": "SesakNapas_Instance",
-                "edema": "EdemaPerifer_Instance",
-                "kelelahan": "Kelelahan_Instance",
-                "pusing": "Pusing_Instance",
-                "orthopnea": "Orthopnea_Instance",
-                "palpitasi": "Palpitasi_Instance"
-            }
+            symptom_map = SYMPTOM_INSTANCES
             for symptom in symptoms:
                 if symptom in symptom_map:
                     symptom_ind = self.onto[symptom_map[symptom]]
@@ -174,15 +260,26 @@ class KnowledgeService:
         
         return patient_id
     
-    def run_inference(self):
-        """Run Pellet reasoner to infer new facts."""
-        self.reasoning_trace.append("\n🧠 Menjalankan Pellet Reasoner...")
+    def run_inference(self, patient_id: str = None, priority: int = PRIORITY_ROUTINE, handle: ReasonerRun = None):
+        """
+        Run the configured reasoner backend (Pellet by default) to infer new facts.
+        
+        Runs through the resource governor, queued by priority class: raises
+        ReasonerBusy when no slot is free, returns False when the run hits its deadline.
+        `handle` lets the caller cancel this run (see ReasonerRun).
+        """
+        self.reasoning_trace.append(f"\n🧠 Menjalankan {self.reasoner.label}...")
         
         try:
-            with self.onto:
-                sync_reasoner_pellet(infer_property_values=True, infer_data_property_values=True)
+            self.governor.run(lambda: self.reasoner.run(self, patient_id), self.reasoner.jvm, priority, handle,
+                              wait=not self.background)
             self.reasoning_trace.append("✅ Reasoning selesai")
             return True
+        except ReasonerBusy:
+            raise
+        except ReasonerTimeout as e:
+            self.reasoning_trace.append(f"⏱️ {str(e)}")
+            return False
         except Exception as e:
             self.reasoning_trace.append(f"❌ Error: {str(e)}")
             return False
@@ -320,27 +417,21 @@ class KnowledgeService:
         
         contraindications = []
         
-        contra_reasons = {
-            "BetaBlocker": {"Asma_Instance": "Pasien memiliki Asma - Beta Blocker dapat memperburuk bronkospasme"},
-            "ACEInhibitor": {"Kehamilan_Instance": "Pasien hamil - ACE Inhibitor teratogenik"},
-            "Statin": {"PenyakitHatiAktif_Instance": "Pasien memiliki penyakit hati aktif"},
-            "Metformin": {"CKD_Stage4": "eGFR < 30 - risiko asidosis laktat"},
-            "Spironolactone": {"Hyperkalemia": "Kalium > 5.5 - risiko hiperkalemia berat"}
-        }
-        
         # Check kontraindikasiPada property
         contra_meds = list(patient.kontraindikasiPada)
         
+        # Reasons come from the precomputed index, matched against the patient's own facts
+        index = self.contraindication_index
+        patient_mask = 0
+        if contra_meds:
+            data_props, object_props = index.input_properties()
+            facts = facts_from_individual(patient, data_props, object_props)
+            patient_mask = index.patient_mask(facts)
+        
         for med in contra_meds:
             med_name = med.name if hasattr(med, 'name') else str(med)
-            reason = "Kontraindikasi berdasarkan kondisi pasien"
-            
-            # Try to find specific reason
-            for drug_class, reasons in contra_reasons.items():
-                if drug_class in med_name or (hasattr(med, 'is_a') and any(drug_class in str(t) for t in med.is_a)):
-                    for cond, msg in reasons.items():
-                        reason = msg
-                        break
+            matched = index.reasons(med_name, patient_mask)
+            reason = "; ".join(c.reason for c in matched) if matched else DEFAULT_REASON
             
             contraindications.append({
                 "drug": med_name,
@@ -351,6 +442,29 @@ class KnowledgeService:
         
         return contraindications
     
+    def triage(self, data: dict) -> dict:
+        """Emergency triage on the raw payload, before create_patient and reasoning."""
+        return self.triage_evaluator.evaluate(data)
+    
+    def check_contraindications(self, data: dict) -> dict:
+        """
+        Standalone contraindication check from the precomputed index (no reasoning).
+        
+        Args:
+            data: {"medications": [...], "comorbid": {...}, "labs": {...}}
+            
+        Returns:
+            Contraindications, unrecognized medication names and elapsed time
+        """
+        start = time.perf_counter()
+        medications = data.get("medications") or []
+        if isinstance(medications, str):
+            medications = [medications]
+        facts = facts_from_payload(data)
+        result = self.contraindication_index.check(medications, facts)
+        result["elapsed_us"] = round((time.perf_counter() - start) * 1e6, 1)
+        return result
+    
     def get_risk_category(self, patient_id: str) -> dict:
         """Get the risk category for a patient."""
         patient = self.onto[patient_id]
@@ -583,34 +697,169 @@ class KnowledgeService:
     
     def cleanup_patient(self, patient_id: str):
         """Remove patient individual from ontology."""
+        self.incremental.drop(patient_id)
         patient = self.onto[patient_id]
         if patient:
             with self.onto:
                 destroy_entity(patient)
     
-    def diagnose(self, data: dict) -> dict:
+    def diagnose(self, data: dict, use_cache: bool = True, trace: bool = True) -> dict:
         """
         Complete diagnosis workflow.
         
         Args:
             data: Patient data dictionary
+            use_cache: False to always run the reasoner (warm-up, smoke checks);
+                the fresh result still refreshes the result cache
+            trace: False to leave out reasoning_trace (its strings are then never built)
             
         Returns:
             Complete diagnosis result
         """
+        result = None
+        for stage, payload in self.diagnose_stages(data, use_cache=use_cache, trace=trace):
+            if stage == "complete":
+                result = payload
+        return result
+    
+    def diagnose_stages(self, data: dict, heartbeat: float = None, use_cache: bool = True, trace: bool = True):
+        """
+        Diagnosis workflow as a generator, yielding (stage, payload) as each stage finishes.
+        
+        Stages: accepted, reasoning, diagnoses, medications, contraindications,
+        risk, severity, recommendations, complete.
+        
+        Args:
+            data: Patient data dictionary
+            heartbeat: If set, the reasoner runs in a background thread and a
+                ("heartbeat", None) is yielded every `heartbeat` seconds while it runs.
+                Closing the generator at that point cancels this request's run only.
+            use_cache: False to skip the result cache lookup (see diagnose)
+            trace: False to leave out reasoning_trace (see diagnose)
+        """
+        # Emergency fast path (no reasoning needed), also decides the queue priority
+        triage = self.triage(data)
+        priority = PRIORITY_ROUTINE if self.background else classify_priority(data, triage)
+        
+        # Same payload already diagnosed on this node with this ontology version
+        cached = self.result_cache.get(data) if self.result_cache and use_cache else None
+        if cached is not None:
+            yield from self._cached_stages(cached, data, priority, triage, trace)
+            return
+        
         # Create patient
-        patient_id = self.create_patient(data)
+        patient_id = self.create_patient(data, trace=trace)
+        yield "accepted", {
+            "patient_id": patient_id,
+            "emergency": triage["emergency"],
+            "priority": PRIORITY_NAMES[priority],
+            "triage": triage
+        }
         
         # Run inference
-        self.run_inference()
+        reasoning_start = time.perf_counter()
+        try:
+            if heartbeat is None:
+                success = self.run_inference(patient_id, priority)
+            else:
+                outcome = {}
+                run = ReasonerRun()
+                
+                def reason():
+                    try:
+                        outcome["success"] = self.run_inference(patient_id, priority, run)
+                    except ReasonerBusy as e:
+                        outcome["busy"] = e
+                
+                worker = threading.Thread(target=reason, daemon=True)
+                worker.start()
+                try:
+                    while worker.is_alive():
+                        worker.join(heartbeat)
+                        if worker.is_alive():
+                            yield "heartbeat", None
+                except GeneratorExit:
+                    # Client went away: leave the queue, or kill this run's JVM if it started one.
+                    # The world is only cleaned up once the reasoner thread has stopped writing to it.
+                    run.cancel()
+                    worker.join()
+                    self.cleanup_patient(patient_id)
+                    raise
+                if "busy" in outcome:
+                    raise outcome["busy"]
+                success = outcome.get("success", False)
+        except ReasonerBusy as e:
+            # Shed load, but keep the triage result so an emergency is still reported
+            self.cleanup_patient(patient_id)
+            e.triage = triage
+            raise
+        reasoner_ms = (time.perf_counter() - reasoning_start) * 1000
+        yield "reasoning", {"success": success}
+        
+        # Rule layer replay: the per-rule counters, and rules_fired once checked against the individual
+        inputs, fired, timings = replay(self.rule_engine, data)
+        self.rule_profile.record(timings, reasoner_ms)
+        fired, _ = reconcile(inputs, fired, self.asserted_facts(patient_id))
         
+        for stage, payload in self._result_stages(patient_id, data, triage, fired, trace):
+            if stage == "complete":
+                # Keep the session so follow-up visits can be re-diagnosed incrementally
+                self.incremental.register(patient_id, data, payload)
+                # Only complete results (with their trace) are cached
+                if success and trace and self.result_cache:
+                    self.result_cache.put(data, payload)
+            yield stage, payload
+    
+    def _cached_stages(self, cached: dict, data: dict, priority: int, triage: dict, trace: bool = True):
+        """
+        Stages of a cached result under a new patient. The individual only gets the
+        rule-layer facts (no reasoner run), enough for incremental follow-ups.
+        """
+        patient_id = self.create_patient(data)
+        RuleEngineBackend().run(self, patient_id)
+        yield "accepted", {
+            "patient_id": patient_id,
+            "emergency": triage["emergency"],
+            "priority": PRIORITY_NAMES[priority],
+            "triage": triage,
+            "cached": True
+        }
+        yield "reasoning", {"success": True, "cached": True}
+        yield "diagnoses", cached["diagnoses"]
+        yield "medications", cached["medications"]
+        yield "contraindications", cached["contraindications"]
+        yield "risk", {"risk_category": cached["risk_category"], "ascvd_score": cached["ascvd_score"]}
+        yield "severity", {"severity": cached["severity"]}
+        yield "recommendations", cached["lifestyle_recommendations"]
+        result = dict(
+            cached,
+            patient_id=patient_id,
+            timestamp=datetime.now().isoformat(),
+            triage=triage,
+            cached=True
+        )
+        if not trace:
+            result.pop("reasoning_trace", None)
+        self.incremental.register(patient_id, data, result)
+        yield "complete", result
+    
+    def _result_stages(self, patient_id: str, data: dict, triage: dict, fired: list = None, trace: bool = True):
+        """
+        Read the (reasoned) patient back stage by stage, ending with the complete result.
+        `fired` is the rule layer replay of data reconciled with the individual
+        (done here if not given); trace=False leaves out reasoning_trace.
+        """
         # Get results
         diagnoses = self.get_inferred_diagnoses(patient_id)
+        yield "diagnoses", diagnoses
         medications = self.get_recommended_medications(patient_id)
+        yield "medications", medications
         contraindications = self.get_contraindications(patient_id)
+        yield "contraindications", contraindications
         risk = self.get_risk_category(patient_id)
+        yield "risk", {"risk_category": risk["category"], "ascvd_score": risk["score"]}
         severity = self.get_severity(patient_id)
-        reasoning = self.get_reasoning_trace()
+        yield "severity", {"severity": severity}
         
         # Get lifestyle recommendations from SWRL inference (primary)
         lifestyle_recommendations = self.get_inferred_recommendations(patient_id)
@@ -619,17 +868,23 @@ class KnowledgeService:
         if not lifestyle_recommendations:
             has_smoking = data.get('history', {}).get('smoking', False)
             lifestyle_recommendations = self.get_lifestyle_recommendations(diagnoses, has_smoking)
+        yield "recommendations", lifestyle_recommendations
+        
+        if fired is None:
+            inputs, fired, _ = replay(self.rule_engine, data)
+            fired, _ = reconcile(inputs, fired, self.asserted_facts(patient_id))
         
         # Check for emergency
-        emergency = any(d.get("severity") == "Kritis" for d in diagnoses)
+        emergency = any(d.get("severity") == "Kritis" for d in diagnoses) or triage["emergency"]
         
         # Cleanup (optional - keep for history)
         # self.cleanup_patient(patient_id)
         
-        return {
+        result = {
             "patient_id": patient_id,
             "timestamp": datetime.now().isoformat(),
             "emergency": emergency,
+            "triage": triage,
             "diagnoses": diagnoses,
             "medications": medications,
             "contraindications": contraindications,
@@ -637,6 +892,216 @@ class KnowledgeService:
             "ascvd_score": risk["score"],
             "severity": severity,
             "lifestyle_recommendations": lifestyle_recommendations,
-            "reasoning_trace": reasoning,
-            "rules_fired": len([r for r in reasoning if "Inferred" in r or "Medication" in r or "Rekomendasi" in r])
+            "rules_fired": rules_fired(fired)
         }
+        if trace:
+            result["reasoning_trace"] = self.get_reasoning_trace()
+        yield "complete", result
+    
+    def adopt_sessions(self, sessions: list) -> int:
+        """
+        Take over follow-up sessions from the service this one replaces. Each patient is
+        re-created under the same id with its rule-layer facts only (as for a cached result).
+        """
+        backend = RuleEngineBackend()
+        adopted = 0
+        for session in sessions:
+            if session.patient_id in self.incremental.sessions or self.onto[session.patient_id] is not None:
+                continue
+            self.create_patient(session.diagnosed_payload, session.patient_id)
+            backend.run(self, session.patient_id)
+            self.incremental.adopt(session)
+            adopted += 1
+        return adopted
+    
+    def acquire(self):
+        """Pin this instance for a request (released with release())."""
+        with self._pin_lock:
+            self._pins += 1
+    
+    def release(self):
+        """Unpin; the last request of a retired instance closes it."""
+        with self._pin_lock:
+            self._pins -= 1
+            drained = self.retired and self._pins == 0
+        if drained:
+            self._drain()
+    
+    def retire(self, on_drained=None):
+        """
+        Stop serving new requests. Once the requests pinned to this instance have
+        finished, on_drained(self) runs (e.g. to hand over follow-up sessions they
+        registered) and the world is closed.
+        """
+        with self._pin_lock:
+            self.retired = True
+            self._on_drained = on_drained
+            drained = self._pins == 0
+        if drained:
+            self._drain()
+    
+    def _drain(self):
+        try:
+            if self._on_drained:
+                self._on_drained(self)
+        finally:
+            self.close()
+    
+    def close(self):
+        """
+        Release the owlready2 world: close its quadstore and drop the module-level
+        references that would otherwise keep it alive (prepared SPARQL queries and the
+        last query translator of this thread).
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.onto.world.close()
+        World._prepare_sparql.cache_clear()
+        CURRENT_TRANSLATOR.set(None)
+    
+    def update_observations(self, patient_id: str, observations: dict) -> dict:
+        """
+        Record follow-up observations for a previously diagnosed patient.
+        
+        Args:
+            patient_id: Patient ID returned by diagnose
+            observations: Partial payload ({"labs": {"gfr": 25}}, null removes a value)
+            
+        Returns:
+            The input properties that differ from the last diagnosis
+        """
+        changed = self.incremental.update_observations(patient_id, observations)
+        return {"patient_id": patient_id, "changed_properties": changed}
+    
+    def rediagnose(self, patient_id: str) -> dict:
+        """
+        Incremental re-diagnosis: re-evaluate only the rules downstream of the
+        changed observations, update the existing individual and diff the
+        result against the previous diagnosis. With a reasoner other than the
+        rule engine the individual is rebuilt and reasoned again instead (see
+        _rediagnose_full); raises ReasonerBusy when that run is shed.
+        """
+        session = self.incremental.get(patient_id)
+        patient = self.onto[patient_id]
+        if patient is None:
+            self.incremental.drop(patient_id)
+            raise KeyError(patient_id)
+        
+        if self.reasoner.name != RuleEngineBackend.name:
+            return self._rediagnose_full(session, patient)
+        
+        self.reasoning_trace = [f"🔁 Re-diagnosis inkremental: {patient_id}"]
+        delta = self.incremental.reevaluate(session)
+        for prop in delta["changed_properties"]:
+            self.reasoning_trace.append(f"📊 Update: {prop}")
+        self.reasoning_trace.append(
+            f"⚡ {delta['rules_reevaluated']}/{len(self.rules)} rules dievaluasi ulang "
+            f"({len(delta['added'])} fakta baru, {len(delta['removed'])} dicabut)"
+        )
+        apply_delta(self.onto, patient, delta["removed"], delta["added"], self.incremental.ranked_facts(session))
+        
+        data = session.payload
+        result = None
+        for stage, payload in self._result_stages(patient_id, data, self.triage(data)):
+            if stage == "complete":
+                result = payload
+        
+        result["diff"] = diff_results(session.result, result)
+        result["incremental"] = {
+            "changed_properties": delta["changed_properties"],
+            "rules_reevaluated": delta["rules_reevaluated"],
+            "rules_total": len(self.rules),
+            "elapsed_us": delta["elapsed_us"]
+        }
+        session.result = result
+        return result
+    
+    def _rediagnose_full(self, session, patient) -> dict:
+        """
+        Re-diagnosis with Pellet / HermiT: their inferences (OWL class axioms included)
+        cannot be retracted from the rule-engine state, so the individual is re-created
+        from the updated payload under the same id and the reasoner runs again.
+        """
+        patient_id = session.patient_id
+        data = session.payload
+        changed = self.incremental.changed_properties(session)
+        triage = self.triage(data)
+        start = time.perf_counter()
+        
+        with self.onto:
+            destroy_entity(patient)
+        self.create_patient(data, patient_id)
+        self.reasoning_trace.insert(0, f"🔁 Re-diagnosis (full {self.reasoner.label}): {patient_id}")
+        for prop in changed:
+            self.reasoning_trace.append(f"📊 Update: {prop}")
+        # Shed or failed: the session keeps its last diagnosed payload, so a retry sees the same change
+        success = self.run_inference(patient_id, classify_priority(data, triage))
+        
+        result = None
+        for stage, payload in self._result_stages(patient_id, data, triage):
+            if stage == "complete":
+                result = payload
+        
+        result["diff"] = diff_results(session.result, result)
+        result["incremental"] = {
+            "changed_properties": changed,
+            "rules_reevaluated": len(self.rules),
+            "rules_total": len(self.rules),
+            "reasoner": self.reasoner.name,
+            "elapsed_us": round((time.perf_counter() - start) * 1e6, 1)
+        }
+        if success:
+            self.incremental.rebase(session)
+            session.result = result
+        return result
+    
+    def what_if(self, base: dict, parameters: list) -> dict:
+        """
+        What-if sweep of one or two numeric inputs on the SWRL rule layer (no reasoner run).
+        
+        Args:
+            base: /api/diagnose payload
+            parameters: [{"field": "vitals.sbp", "from": 120, "to": 200, "step": 1}, ...]
+            
+        Returns:
+            Where along the range(s) diagnoses, medications and contraindications change
+        """
+        return self.sweep.run(base, parameters)
+    
+    def get_thresholds(self) -> dict:
+        """
+        Decision boundaries of every numeric input, extracted from the SWRL rules at load time.
+        
+        Returns:
+            {"version": content hash, "fields": {"vitals.sbp": {"boundaries": [...], "thresholds": [...]}}}
+        """
+        return self.threshold_map.to_dict()
+    
+    def get_description_texts(self, refs: list = None) -> dict:
+        """Ontology description texts by description_ref (all of them when refs is None)."""
+        if refs is None:
+            return dict(self.description_index)
+        return {ref: self.description_index[ref] for ref in refs if ref in self.description_index}
+    
+    def asserted_facts(self, patient_id: str):
+        """Rule-layer facts (see rule_properties) the patient individual holds after reasoning."""
+        patient = self.onto[patient_id] if patient_id else None
+        if patient is None:
+            return None
+        return facts_from_individual(patient, *self.rule_properties)
+    
+    def explain(self, data: dict, patient_id: str = None) -> list:
+        """
+        Structured trace of a payload: input facts, then every SWRL rule firing
+        with the facts it produced (built only on request). Given the diagnosed
+        patient, firings are checked against its individual and the reasoner's
+        own inferences are listed too.
+        """
+        inputs, fired, timings = replay(self.rule_engine, data)
+        fired, inferred = reconcile(inputs, fired, self.asserted_facts(patient_id))
+        return trace_events(inputs, fired, timings, inferred)
+    
+    def get_rule_profile(self, sort: str = "time_us", limit: int = None) -> dict:
+        """Per-rule evaluation/firing counters and rule engine time of this process."""
+        return dict(self.rule_profile.snapshot(sort, limit), ontology_version=self.ontology_version[:16])
@@ -0,0 +1,84 @@
+"""
+Priority Classes - CVD Expert System
+Cheap classification of a raw diagnosis payload on arrival, used to order the
+reasoner queue so critical patients are not stuck behind routine checkups.
+"""
+
+
+PRIORITY_CRITICAL = 0
+PRIORITY_URGENT = 1
+PRIORITY_ROUTINE = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_CRITICAL: "kritis",
+    PRIORITY_URGENT: "mendesak",
+    PRIORITY_ROUTINE: "rutin"
+}
+
+# Raw-value mirror of the rules that conclude a Kritis condition (R10, R15, R27, R40).
+# Only used when no ontology triage result is available.
+CRITICAL_THRESHOLDS = [
+    ("vitals", "sbp", ">=", 180),
+    ("vitals", "dbp", ">=", 120),
+    ("labs", "gfr", "<", 15),
+]
+CRITICAL_TROPONIN = 0.04
+
+# One step below critical: findings that usually end in a Berat diagnosis
+URGENT_THRESHOLDS = [
+    ("vitals", "sbp", ">=", 160),
+    ("vitals", "dbp", ">=", 100),
+    ("vitals", "hr", ">=", 120),
+    ("labs", "troponin", ">", CRITICAL_TROPONIN),
+    ("labs", "ef", "<", 40),
+    ("labs", "gfr", "<", 30),
+    ("labs", "potassium", ">", 5.5),
+]
+URGENT_SYMPTOMS = {"nyeri_dada", "sesak_napas", "orthopnea"}
+
+_OPS = {
+    ">=": lambda a, b: a >= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+}
+
+
+def _value(data: dict, section: str, key: str):
+    value = (data.get(section) or {}).get(key)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _any_threshold(data: dict, thresholds: list) -> bool:
+    for section, key, op, limit in thresholds:
+        value = _value(data, section, key)
+        if value is not None and _OPS[op](value, limit):
+            return True
+    return False
+
+
+def classify_priority(data: dict, triage: dict = None) -> int:
+    """
+    Priority class of a payload.
+    If the ontology triage result is given it decides what is critical;
+    otherwise the raw critical thresholds are used.
+    """
+    symptoms = set(data.get("symptoms") or [])
+
+    if triage is not None:
+        critical = triage.get("emergency", False)
+    else:
+        troponin = _value(data, "labs", "troponin")
+        critical = _any_threshold(data, CRITICAL_THRESHOLDS) or (
+            troponin is not None and troponin > CRITICAL_TROPONIN and "nyeri_dada" in symptoms
+        )
+    if critical:
+        return PRIORITY_CRITICAL
+
+    if _any_threshold(data, URGENT_THRESHOLDS) or symptoms & URGENT_SYMPTOMS:
+        return PRIORITY_URGENT
+    return PRIORITY_ROUTINE
@@ -0,0 +1,47 @@
+"""
+Process Stats - CVD Expert System
+Resident memory of the current process, split into shared and private pages
+so copy-on-write sharing between gunicorn workers can be observed.
+"""
+
+import os
+
+
+def _read_kb_fields(path: str, fields: tuple) -> dict:
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    values[key] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def memory_stats() -> dict:
+    """
+    Memory of this process in MB (Linux /proc; empty elsewhere).
+
+    rss: resident set size
+    pss: proportional share (shared pages divided between the processes using them)
+    shared / private: clean + dirty pages shared with other processes or private to this one
+    """
+    pid = os.getpid()
+    status = _read_kb_fields(f"/proc/{pid}/status", ("VmRSS", "VmHWM"))
+    rollup = _read_kb_fields(
+        f"/proc/{pid}/smaps_rollup",
+        ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+    )
+
+    stats = {"pid": pid}
+    if "VmRSS" in status:
+        stats["rss_mb"] = round(status["VmRSS"] / 1024, 1)
+    if "VmHWM" in status:
+        stats["peak_rss_mb"] = round(status["VmHWM"] / 1024, 1)
+    if rollup:
+        stats["pss_mb"] = round(rollup.get("Pss", 0) / 1024, 1)
+        stats["shared_mb"] = round((rollup.get("Shared_Clean", 0) + rollup.get("Shared_Dirty", 0)) / 1024, 1)
+        stats["private_mb"] = round((rollup.get("Private_Clean", 0) + rollup.get("Private_Dirty", 0)) / 1024, 1)
+    return stats
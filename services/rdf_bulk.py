@@ -0,0 +1,374 @@
+"""
+RDF Bulk - CVD Expert System
+Bulk dump and reload of the diagnosis history for the triple store.
+
+SparqlService.save_diagnosis sends one INSERT DATA request per diagnosis,
+which is far too slow for a backfill or a migration. This module turns
+history records from any source into the same triples and streams them:
+
+- to an N-Triples or Turtle file (optionally .gz) for an offline bulk loader
+  (e.g. tdb2.tdbloader), or
+- to a store through the SPARQL 1.1 Graph Store protocol, as large N-Triples
+  POSTs of RDF_BULK_CHUNK_TRIPLES triples (default 50000) each.
+
+Sources: Cosmos DB (either history format), an NDJSON history export, the
+SPARQL store itself (its Pasien triples, paged by subject) and, for load, an
+existing N-Triples file. Everything is a generator, so memory stays at one
+source page or one upload chunk.
+
+Usage:
+    python -m services.rdf_bulk dump --source cosmos --out history.nt.gz
+    python -m services.rdf_bulk dump --source sparql --sparql http://localhost:3030/cvd --out history.ttl
+    python -m services.rdf_bulk load --source ndjson:history.ndjson --endpoint http://localhost:3030/cvd
+    python -m services.rdf_bulk load --source nt:history.nt.gz --endpoint http://localhost:3030/cvd --graph urn:history
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from services.history_record import expand_record, flat_summary, summary_of
+from services.history_export import normalize_row, parse_bound
+
+
+CVD = "http://www.cvd-expert-system.org/ontology#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+PREFIXES = {"cvd": CVD, "xsd": XSD, "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#"}
+DEFAULT_CHUNK_TRIPLES = 50000
+DEFAULT_PAGE_SIZE = 500
+UPLOAD_RETRIES = 3
+_LOCAL_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+
+
+def iri(value: str) -> tuple:
+    return ("iri", value)
+
+
+def literal(value, datatype: str = "string", lang: str = None) -> tuple:
+    return ("lit", str(value), datatype if datatype is None or ":" in datatype else XSD + datatype, lang)
+
+
+def clean_string(text) -> str:
+    """Literal text as save_diagnosis has always stored it."""
+    if not text:
+        return ""
+    return str(text).replace('"', "'").replace('\n', ' ').strip()
+
+
+def local_name(name) -> str:
+    """IRI local name of an id: kept if it is a plain name, percent-encoded otherwise."""
+    name = str(name)
+    return name if _LOCAL_NAME.match(name) else urllib.parse.quote(name, safe="")
+
+
+def diagnosis_triples(row: dict, diagnosis_classes=(), timestamp: str = None) -> list:
+    """
+    The triples of one diagnosis (a normalized history row, see history_export.normalize_row).
+
+    Args:
+        diagnosis_classes: ontology classes of the diagnoses, linked via cvd:memiliki
+        timestamp: lastDiagnosisTime (default: the row's timestamp)
+    """
+    patient = CVD + local_name(row["patient_id"])
+    triples = [
+        (patient, RDF_TYPE, iri(CVD + "Pasien")),
+        (patient, CVD + "memilikiNama", literal(clean_string(row.get("patient_name") or "Unknown"))),
+        (patient, CVD + "memilikiUsia", literal(row.get("age") or 0, "integer")),
+        (patient, CVD + "memilikiJenisKelamin", literal(clean_string(row.get("gender") or "Unknown")))
+    ]
+    triples += [(patient, CVD + "memiliki", iri(CVD + local_name(f"{cls}_Instance"))) for cls in diagnosis_classes if cls]
+    triples += [(patient, CVD + "hasRecentDiagnosis", literal(clean_string(d))) for d in row.get("diagnoses") or []]
+    triples += [
+        (patient, CVD + "hasRecentRiskCategory", literal(clean_string(row.get("risk_category")))),
+        (patient, CVD + "hasRecentSeverity", literal(clean_string(row.get("severity")))),
+        (patient, CVD + "lastDiagnosisTime", literal(timestamp or row.get("timestamp"), "dateTime"))
+    ]
+    if row.get("ascvd_score") is not None:
+        triples.append((patient, CVD + "hasRecentASCVD", literal(row["ascvd_score"], "float")))
+    triples += [
+        (patient, CVD + "hasRulesFired", literal(row.get("rules_fired") or 0, "integer")),
+        (patient, CVD + "isEmergency", literal(str(bool(row.get("emergency"))).lower(), "boolean"))
+    ]
+    triples += [(patient, CVD + "hasRecommendedMedication", literal(clean_string(m)))
+                for m in row.get("medications") or []]
+    triples += [(patient, CVD + "hasContraindication", literal(clean_string(c)))
+                for c in row.get("contraindications") or []]
+    return triples
+
+
+def result_row(patient_data: dict, result: dict) -> dict:
+    """Normalized history row of a diagnosis request and its result."""
+    row = flat_summary(result, patient_data.get("demographics", {}))
+    return normalize_row(dict(row, patient_id=result.get("patient_id", "unknown")))
+
+
+# --- Serialization -------------------------------------------------------------
+
+def _escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _term(value) -> str:
+    if isinstance(value, str):
+        return f"<{value}>"
+    if value[0] == "iri":
+        return f"<{value[1]}>"
+    if value[0] == "bnode":
+        return f"_:{value[1]}"
+    _, text, datatype, lang = value
+    if lang:
+        return f'"{_escape(text)}"@{lang}'
+    return f'"{_escape(text)}"^^<{datatype}>' if datatype else f'"{_escape(text)}"'
+
+
+def ntriple(triple: tuple) -> str:
+    s, p, o = triple
+    return f"{_term(s)} {_term(p)} {_term(o)} .\n"
+
+
+def _turtle_name(value) -> str:
+    text = value if isinstance(value, str) else value[1] if value[0] == "iri" else None
+    if text is None:
+        return _term(value)
+    for prefix, namespace in PREFIXES.items():
+        if text.startswith(namespace) and _LOCAL_NAME.match(text[len(namespace):]):
+            return f"{prefix}:{text[len(namespace):]}"
+    return f"<{text}>"
+
+
+def _turtle_predicate(value: str) -> str:
+    return "a" if value == RDF_TYPE else _turtle_name(value)
+
+
+def _turtle_object(value) -> str:
+    if isinstance(value, tuple) and value[0] == "lit":
+        _, text, datatype, lang = value
+        if datatype and not lang:
+            return f'"{_escape(text)}"^^{_turtle_name(datatype)}'
+        return _term(value)
+    return _turtle_name(value)
+
+
+def turtle_lines(triples):
+    """Turtle text with prefixes, one block per consecutive run of a subject."""
+    yield "".join(f"@prefix {prefix}: <{namespace}> .\n" for prefix, namespace in PREFIXES.items()) + "\n"
+    subject = None
+    for s, p, o in triples:
+        if s != subject:
+            if subject is not None:
+                yield " .\n\n"
+            subject = s
+            yield f"{_turtle_name(s)} {_turtle_predicate(p)} {_turtle_object(o)}"
+        else:
+            yield f" ;\n    {_turtle_predicate(p)} {_turtle_object(o)}"
+    if subject is not None:
+        yield " .\n"
+
+
+# --- Sources ---------------------------------------------------------------------
+
+def cosmos_triples(container, start: str = None, end: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+    """Triples of every Cosmos DB history item (compact or original format), oldest first."""
+    conditions, parameters = [], []
+    if start:
+        conditions.append("c.timestamp >= @start")
+        parameters.append({"name": "@start", "value": start})
+    if end:
+        conditions.append("c.timestamp < @end")
+        parameters.append({"name": "@end", "value": end})
+    query = "SELECT * FROM c" + (" WHERE " + " AND ".join(conditions) if conditions else "") + " ORDER BY c.timestamp"
+    pages = container.query_items(
+        query=query, parameters=parameters, enable_cross_partition_query=True, max_item_count=page_size
+    ).by_page()
+    for page in pages:
+        for item in page:
+            # Entity ids are all that is needed here, so no catalog
+            item = expand_record(item, {})
+            result = item.get("diagnosis_result") or {}
+            row = normalize_row(dict(summary_of(item), patient_id=item.get("patient_id")))
+            classes = [d.get("class") for d in result.get("diagnoses") or [] if isinstance(d, dict)]
+            yield from diagnosis_triples(row, classes)
+
+
+def ndjson_triples(path: str):
+    """Triples of an NDJSON history export (rows may carry `diagnosis_classes`)."""
+    with _open(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                yield from diagnosis_triples(normalize_row(row), row.get("diagnosis_classes") or ())
+
+
+def _binding_term(binding: dict):
+    kind = binding["type"]
+    if kind == "uri":
+        return iri(binding["value"])
+    if kind == "bnode":
+        return ("bnode", binding["value"])
+    return literal(binding["value"], binding.get("datatype"), binding.get("xml:lang"))
+
+
+def sparql_triples(sparql_service, page_size: int = DEFAULT_PAGE_SIZE):
+    """Every triple of the store's Pasien individuals, grouped by subject."""
+    for binding in sparql_service.iter_patient_triples(page_size):
+        yield binding["s"]["value"], binding["p"]["value"], _binding_term(binding["o"])
+
+
+def ntriples_lines(path: str):
+    """Lines of an existing N-Triples file, passed through as they are."""
+    with _open(path, "rt") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                yield line if line.endswith("\n") else line + "\n"
+
+
+# --- Sinks -----------------------------------------------------------------------
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return open(sys.stdout.fileno() if "w" in mode else sys.stdin.fileno(), mode, encoding="utf-8", closefd=False)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_dump(triples, path: str, fmt: str = None) -> int:
+    """Stream triples to an N-Triples (nt) or Turtle (ttl) file; returns the number of triples."""
+    fmt = fmt or ("ttl" if ".ttl" in os.path.basename(path) else "nt")
+    count = 0
+
+    def counted():
+        nonlocal count
+        for triple in triples:
+            count += 1
+            yield triple
+
+    with _open(path, "wt") as f:
+        lines = turtle_lines(counted()) if fmt == "ttl" else (ntriple(t) for t in counted())
+        for line in lines:
+            f.write(line)
+    return count
+
+
+def gsp_url(endpoint: str, graph: str = None) -> str:
+    """Graph Store protocol URL of the dataset's default graph or a named graph."""
+    base = endpoint.rstrip("/") + "/data"
+    return f"{base}?graph={urllib.parse.quote(graph, safe='')}" if graph else f"{base}?default"
+
+
+def _post(url: str, body: bytes, headers: dict):
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+            with urllib.request.urlopen(request, timeout=300) as response:
+                response.read()
+            return
+        except (urllib.error.URLError, TimeoutError) as e:
+            # 4xx (bad data, auth) will not get better with a retry
+            if isinstance(e, urllib.error.HTTPError) and e.code < 500 or attempt == UPLOAD_RETRIES:
+                raise
+            print(f"⚠️ Upload failed ({e}), retry {attempt}/{UPLOAD_RETRIES - 1}")
+            time.sleep(2 ** attempt)
+
+
+def upload(lines, endpoint: str, graph: str = None, chunk_triples: int = None, headers: dict = None) -> dict:
+    """
+    POST N-Triples lines to the store's Graph Store protocol endpoint in chunks
+    (the triples are added to the graph). Returns counts and throughput.
+    """
+    chunk_triples = chunk_triples or int(os.environ.get("RDF_BULK_CHUNK_TRIPLES", DEFAULT_CHUNK_TRIPLES))
+    url = gsp_url(endpoint, graph)
+    headers = dict(headers or {}, **{"Content-Type": "application/n-triples; charset=utf-8"})
+    stats = {"triples": 0, "requests": 0, "bytes": 0}
+    started = time.perf_counter()
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_triples:
+            _send_chunk(url, chunk, headers, stats)
+            chunk = []
+    if chunk:
+        _send_chunk(url, chunk, headers, stats)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["triples_per_s"] = round(stats["triples"] / elapsed) if elapsed else None
+    return stats
+
+
+def _send_chunk(url: str, chunk: list, headers: dict, stats: dict):
+    body = "".join(chunk).encode("utf-8")
+    _post(url, body, headers)
+    stats["triples"] += len(chunk)
+    stats["requests"] += 1
+    stats["bytes"] += len(body)
+    print(f"📤 {stats['triples']} triples uploaded ({stats['requests']} requests)")
+
+
+# --- CLI -------------------------------------------------------------------------
+
+def _cosmos_container():
+    from azure.cosmos import CosmosClient
+    client = CosmosClient.from_connection_string(os.environ["COSMOS_DB_CONNECTION_STRING"])
+    database = client.get_database_client(os.environ.get("COSMOS_DB_DATABASE_NAME", "CVDExpertSystem"))
+    return database.get_container_client(os.environ.get("COSMOS_DB_CONTAINER_NAME", "DiagnosisHistory"))
+
+
+def source_triples(source: str, args):
+    """Triples of a --source: cosmos, sparql or ndjson:<path>."""
+    if source == "cosmos":
+        return cosmos_triples(_cosmos_container(), parse_bound(args.start), parse_bound(args.end, end=True),
+                              args.page_size)
+    if source == "sparql":
+        from services.sparql_service import SparqlService
+        return sparql_triples(SparqlService(args.sparql or os.environ["SPARQL_ENDPOINT"]), args.page_size)
+    if source.startswith("ndjson:"):
+        return ndjson_triples(source[len("ndjson:"):])
+    raise ValueError(f"Unknown source: {source}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk dump / reload of the diagnosis history as RDF.")
+    parser.add_argument("command", choices=["dump", "load"])
+    parser.add_argument("--source", required=True,
+                        help="cosmos, sparql, ndjson:<export file> or, for load, nt:<N-Triples file>")
+    parser.add_argument("--out", default="-", help="dump: output file (.nt, .ttl, optionally .gz; - = stdout)")
+    parser.add_argument("--format", choices=["nt", "ttl"], help="dump: output format (default: from --out)")
+    parser.add_argument("--endpoint", help="load: dataset URL of the target store (its /data is the Graph Store)")
+    parser.add_argument("--graph", help="load: named graph IRI (default graph if omitted)")
+    parser.add_argument("--chunk", type=int, default=None, help=f"load: triples per request ({DEFAULT_CHUNK_TRIPLES})")
+    parser.add_argument("--sparql", help="source=sparql: dataset URL (default: $SPARQL_ENDPOINT)")
+    parser.add_argument("--from", dest="start", help="source=cosmos: first timestamp (ISO date/datetime)")
+    parser.add_argument("--to", dest="end", help="source=cosmos: last timestamp (a date includes that day)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Records or subjects per source page")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "dump":
+        if args.source.startswith("nt:"):
+            parser.error("nt: sources are for load only")
+        count = write_dump(source_triples(args.source, args), args.out, args.format)
+        print(f"✅ {count} triples written to {args.out} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        if not args.endpoint:
+            parser.error("load needs --endpoint")
+        if args.source.startswith("nt:"):
+            lines = ntriples_lines(args.source[len("nt:"):])
+        else:
+            lines = (ntriple(t) for t in source_triples(args.source, args))
+        stats = upload(lines, args.endpoint, args.graph, args.chunk)
+        print(f"✅ Loaded: {stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Reasoner Backends - CVD Expert System
+Pluggable inference backends for KnowledgeService.run_inference.
+Select one with KnowledgeService(..., reasoner="pellet") or the REASONER_BACKEND
+environment variable.
+"""
+
+import owlready2
+from owlready2 import FunctionalProperty, ObjectPropertyClass
+
+from services.jvm_cds import enable_pellet_cds
+from services.patient_facts import facts_from_individual
+from services.resource_governor import current_run
+
+
+DEFAULT_BACKEND = "pellet"
+
+
+class ReasonerBackend:
+    """Base class: a backend infers new facts into the knowledge service's world."""
+
+    name = None
+    label = None
+    # Runs a JVM through owlready2 (heap sized, killed by PID on timeout)
+    jvm = False
+
+    def run(self, ks, patient_id: str = None):
+        raise NotImplementedError
+
+
+class PelletBackend(ReasonerBackend):
+    """Pellet via owlready2 (OWL 2 DL + SWRL with builtins). Default backend."""
+
+    name = "pellet"
+    label = "Pellet Reasoner"
+    jvm = True
+
+    def __init__(self):
+        # AppCDS archive built at image build time (see services/jvm_cds.py), if any
+        self.cds_archive = enable_pellet_cds()
+
+    def run(self, ks, patient_id: str = None):
+        with ks.onto:
+            owlready2.sync_reasoner_pellet(ks.onto.world, infer_property_values=True, infer_data_property_values=True)
+
+
+class HermitBackend(ReasonerBackend):
+    """HermiT via owlready2. Supports DL-safe SWRL but not the comparison builtins."""
+
+    name = "hermit"
+    label = "HermiT Reasoner"
+    jvm = True
+
+    def run(self, ks, patient_id: str = None):
+        with ks.onto:
+            owlready2.sync_reasoner_hermit(ks.onto.world, infer_property_values=True)
+
+
+class RuleEngineBackend(ReasonerBackend):
+    """
+    In-process forward chaining over the compiled SWRL rules (no JVM).
+    Covers the rule layer only; OWL class axioms are not evaluated.
+    """
+
+    name = "rules"
+    label = "In-process Rule Engine"
+
+    def run(self, ks, patient_id: str = None):
+        onto = ks.onto
+        data_props, object_props = ks.rule_properties
+
+        if patient_id:
+            patients = [onto[patient_id]] if onto[patient_id] else []
+        else:
+            patients = list(onto.Pasien.instances())
+
+        run = current_run()
+        with onto:
+            for patient in patients:
+                facts = facts_from_individual(patient, data_props, object_props)
+                for _, produced in ks.rule_engine.run(facts):
+                    # Timed out or cancelled: stop touching the shared world
+                    if run is not None and run.cancelled:
+                        return
+                    self._write_back(onto, patient, produced)
+
+    def _write_back(self, onto, patient, produced):
+        for prop_name, value in produced:
+            prop = onto[prop_name]
+            if prop is None:
+                continue
+            target = onto[value] if isinstance(prop, ObjectPropertyClass) else value
+            if target is None:
+                continue
+            if FunctionalProperty in prop.is_a:
+                # Rules fire in ontology order; keep the first inferred value
+                if getattr(patient, prop.python_name) is None:
+                    setattr(patient, prop.python_name, target)
+            else:
+                values = getattr(patient, prop.python_name)
+                if target not in values:
+                    values.append(target)
+
+
+REASONER_BACKENDS = {
+    backend.name: backend
+    for backend in (PelletBackend, HermitBackend, RuleEngineBackend)
+}
+
+
+def get_reasoner_backend(name: str = None) -> ReasonerBackend:
+    """Instantiate a backend by name (pellet, hermit, rules)."""
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in REASONER_BACKENDS:
+        raise ValueError(
+            f"Unknown reasoner backend '{name}'. "
+            f"Available: {', '.join(sorted(REASONER_BACKENDS))}"
+        )
+    return REASONER_BACKENDS[name]()
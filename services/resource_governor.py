@@ -0,0 +1,434 @@
+"""
+Resource Governor - CVD Expert System
+Admission control, JVM heap sizing and deadlines around reasoner runs.
+
+Every Pellet/HermiT run is a separate JVM. Without a cap a burst of requests
+starts one JVM per request and the container runs out of memory; without a
+deadline a stuck run holds the worker until gunicorn kills it. The governor:
+- caps concurrent reasoner runs and how many requests may wait for one,
+  rejecting the rest immediately with ReasonerBusy (503 + Retry-After),
+- sizes the JVM heap of each run from the memory actually available
+  (cgroup limit or MemAvailable) and the ontology size,
+- enforces a per-call deadline and kills the JVM that run started (and only
+  that one) when it passes; an in-process run keeps its slot until its thread
+  has really exited,
+- serves waiting requests by priority class (services/priority.py), aging
+  them so routine requests cannot starve, and lets a higher-priority request
+  displace the lowest-priority waiter when the queue is full.
+
+Environment: REASONER_MAX_CONCURRENT (1), REASONER_MAX_QUEUE (8),
+REASONER_QUEUE_TIMEOUT_S (30), REASONER_DEADLINE_S (120),
+REASONER_HEAP_MAX_MB (1024), REASONER_HEAP_MB (fixed heap, disables sizing),
+REASONER_PRIORITY_AGING_S (10, seconds of waiting worth one priority class).
+"""
+
+import math
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from services.priority import PRIORITY_NAMES, PRIORITY_ROUTINE
+
+
+MB = 1024 * 1024
+HEAP_MIN_MB = 128
+# Metaspace, code cache and thread stacks on top of the heap, per JVM
+JVM_OVERHEAD_MB = 96
+# Pellet's working set grows with the size of the world it is handed
+HEAP_PER_ONTOLOGY_MB = 64
+# Share of the available memory reasoner JVMs may take together
+MEMORY_FRACTION = 0.75
+# Recent queue waits kept per priority class for the metrics
+WAIT_SAMPLES = 200
+
+
+class ReasonerBusy(Exception):
+    """No reasoner slot (or memory) available; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ReasonerTimeout(Exception):
+    """The reasoner exceeded its deadline and was terminated."""
+
+
+class ReasonerCancelled(Exception):
+    """The run was cancelled (its client went away) before it finished."""
+
+
+_current = threading.local()
+
+
+def current_run():
+    """The ReasonerRun of the calling reasoner thread, if any."""
+    return getattr(_current, "run", None)
+
+
+class ReasonerRun:
+    """
+    One reasoner call: the JVM it started (if any), that JVM's heap and whether it
+    was cancelled. Lets a deadline or a disconnected client stop exactly this run.
+    """
+
+    def __init__(self):
+        self.heap_mb = None
+        self.process = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._on_cancel = []
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def command(self, command: list) -> list:
+        """The java command line with this run's heap; refused once the run is cancelled."""
+        if self.cancelled:
+            raise ReasonerCancelled("Reasoner run cancelled before its JVM started")
+        if self.heap_mb:
+            command = [f"-Xmx{self.heap_mb}M" if str(arg).startswith("-Xmx") else arg for arg in command]
+        return command
+
+    def started(self, process):
+        with self._lock:
+            self.process = process
+            cancelled = self.cancelled
+        if cancelled:
+            self.kill()
+
+    def kill(self) -> bool:
+        """Kill the JVM of this run if it is still running. True if one was killed."""
+        with self._lock:
+            process = self.process
+        if process is None or process.poll() is not None:
+            return False
+        try:
+            process.kill()
+        except OSError:
+            return False
+        return True
+
+    def cancel(self) -> bool:
+        """Stop this run: leave the queue, or kill its JVM if it has started one."""
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            callback()
+        return self.kill()
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+
+class _TrackedSubprocess:
+    """
+    Stands in for the subprocess module inside owlready2.reasoning. owlready2
+    builds and starts the java command itself; this gives the JVM the heap of the
+    calling thread's ReasonerRun and records its process there, so a deadline or
+    a cancel kills that JVM and no other.
+    """
+
+    def __getattr__(self, name):
+        return getattr(subprocess, name)
+
+    def Popen(self, command, **kwargs):
+        run = current_run()
+        if run is not None:
+            command = run.command(command)
+        process = subprocess.Popen(command, **kwargs)
+        if run is not None:
+            run.started(process)
+        return process
+
+    def run(self, command, check: bool = False, **kwargs):
+        with self.Popen(command, **kwargs) as process:
+            stdout, stderr = process.communicate()
+        if check and process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    def check_output(self, command, **kwargs):
+        return self.run(command, check=True, stdout=subprocess.PIPE, **kwargs).stdout
+
+
+def track_reasoner_processes():
+    """Route owlready2's reasoner JVMs through _TrackedSubprocess (idempotent)."""
+    from owlready2 import reasoning
+    if not isinstance(reasoning.subprocess, _TrackedSubprocess):
+        reasoning.subprocess = _TrackedSubprocess()
+
+
+def _read_int(path: str):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def available_memory_mb():
+    """Memory still available to this container: cgroup limit minus usage, capped by MemAvailable."""
+    candidates = []
+    for limit_file, usage_file in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        limit, usage = _read_int(limit_file), _read_int(usage_file)
+        # cgroup v2 writes "max" for no limit, v1 a huge number
+        if limit and usage is not None and limit < 1 << 60:
+            candidates.append((limit - usage) / MB)
+            break
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    candidates.append(int(line.split()[1]) / 1024)
+                    break
+    except OSError:
+        pass
+    return max(0.0, min(candidates)) if candidates else None
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "evicted")
+
+    def __init__(self, priority: int, seq: int, enqueued: float):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = enqueued
+        self.evicted = False
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class ResourceGovernor:
+    """Bounded, deadline-enforcing gate in front of the reasoner."""
+
+    def __init__(self, ontology_path: str = None, max_concurrent: int = None, max_queue: int = None,
+                 queue_timeout: float = None, deadline: float = None):
+        env = os.environ.get
+        self.max_concurrent = max_concurrent or int(env("REASONER_MAX_CONCURRENT", "1"))
+        self.max_queue = int(env("REASONER_MAX_QUEUE", "8")) if max_queue is None else max_queue
+        self.queue_timeout = float(env("REASONER_QUEUE_TIMEOUT_S", "30")) if queue_timeout is None else queue_timeout
+        self.deadline = float(env("REASONER_DEADLINE_S", "120")) if deadline is None else deadline
+        self.heap_max_mb = int(env("REASONER_HEAP_MAX_MB", "1024"))
+        self.fixed_heap_mb = int(env("REASONER_HEAP_MB")) if env("REASONER_HEAP_MB") else None
+        self.aging_s = float(env("REASONER_PRIORITY_AGING_S", "10"))
+
+        ontology_mb = os.path.getsize(ontology_path) / MB if ontology_path and os.path.exists(ontology_path) else 0
+        self.heap_floor_mb = max(HEAP_MIN_MB, math.ceil(HEAP_PER_ONTOLOGY_MB * ontology_mb))
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = []
+        self._seq = 0
+        self._run_times = deque(maxlen=20)
+        self._waits = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_NAMES}
+        self._rejected = {p: 0 for p in PRIORITY_NAMES}
+        self.stats = {"admitted": 0, "rejected": 0, "displaced": 0, "timeouts": 0, "killed": 0, "last_heap_mb": None}
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from recent run times and the queue length."""
+        avg = sum(self._run_times) / len(self._run_times) if self._run_times else 1.0
+        return max(1, math.ceil(avg * (len(self._waiting) + 1) / self.max_concurrent))
+
+    def saturated(self, priority: int = PRIORITY_ROUTINE) -> bool:
+        """True if a new request of this priority would be rejected right now."""
+        with self._cond:
+            return (
+                self._running >= self.max_concurrent
+                and len(self._waiting) >= self.max_queue
+                and self._lowest_waiter().priority <= priority
+            )
+
+    def _lowest_waiter(self) -> _Waiter:
+        # Displacement candidate: lowest priority, most recently queued
+        return max(self._waiting, key=lambda w: (w.priority, w.seq))
+
+    def _next_waiter(self) -> _Waiter:
+        # Aging: every aging_s seconds of waiting counts as one priority class
+        now = time.monotonic()
+        return min(self._waiting, key=lambda w: (w.priority - (now - w.enqueued) / self.aging_s, w.seq))
+
+    def _reject(self, priority: int, message: str):
+        self.stats["rejected"] += 1
+        self._rejected[priority] += 1
+        return ReasonerBusy(message, self.retry_after())
+
+    def heap_size_mb(self) -> int:
+        """-Xmx for the next JVM run."""
+        if self.fixed_heap_mb:
+            return self.fixed_heap_mb
+        available = available_memory_mb()
+        if available is None:
+            return min(self.heap_max_mb, max(self.heap_floor_mb, 256))
+        budget = available * MEMORY_FRACTION / self.max_concurrent - JVM_OVERHEAD_MB
+        if budget < self.heap_floor_mb:
+            raise ReasonerBusy(
+                f"Not enough memory for a reasoner run ({int(available)} MB available, "
+                f"{self.heap_floor_mb + JVM_OVERHEAD_MB} MB needed)",
+                self.retry_after()
+            )
+        return int(max(self.heap_floor_mb, min(self.heap_max_mb, budget)))
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _acquire(self, priority: int, wait: bool = True, handle: ReasonerRun = None):
+        enqueued = time.monotonic()
+        with self._cond:
+            if self._running >= self.max_concurrent or self._waiting:
+                if not wait:
+                    raise self._reject(priority, "No free reasoner slot")
+                if len(self._waiting) >= self.max_queue:
+                    victim = self._lowest_waiter()
+                    if victim.priority <= priority:
+                        raise self._reject(priority, "Reasoner queue is full")
+                    victim.evicted = True
+                    self._waiting.remove(victim)
+                    self.stats["displaced"] += 1
+                    self._cond.notify_all()
+
+                self._seq += 1
+                waiter = _Waiter(priority, self._seq, enqueued)
+                self._waiting.append(waiter)
+                give_up = enqueued + self.queue_timeout
+                if handle is not None:
+                    handle.on_cancel(self._wake)
+                try:
+                    while True:
+                        if waiter.evicted:
+                            raise self._reject(priority, "Displaced from the reasoner queue by a higher-priority patient")
+                        if handle is not None and handle.cancelled:
+                            raise ReasonerCancelled("Left the reasoner queue: the request was cancelled")
+                        if self._running < self.max_concurrent and self._next_waiter() is waiter:
+                            break
+                        remaining = give_up - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject(priority, "Timed out waiting for a reasoner slot")
+                        self._cond.wait(remaining)
+                finally:
+                    if not waiter.evicted:
+                        self._waiting.remove(waiter)
+                    self._cond.notify_all()
+            self._running += 1
+            self.stats["admitted"] += 1
+            self._waits[priority].append(time.monotonic() - enqueued)
+        return time.perf_counter()
+
+    def _release(self, start: float):
+        with self._cond:
+            self._running -= 1
+            self._run_times.append(time.perf_counter() - start)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_ROUTINE, wait: bool = True, handle: ReasonerRun = None):
+        """
+        Hold one of the reasoner slots. Waiters are served by aged priority;
+        raises ReasonerBusy if the queue is full, the wait times out or the
+        request is displaced by a higher-priority one (immediately if a slot is
+        not free and wait is False), ReasonerCancelled if `handle` is cancelled
+        while it waits.
+        """
+        start = self._acquire(priority, wait, handle)
+        try:
+            yield
+        finally:
+            self._release(start)
+
+    def run(self, fn, jvm: bool = False, priority: int = PRIORITY_ROUTINE, handle: ReasonerRun = None,
+            wait: bool = True):
+        """
+        Run fn() in a reasoner slot (queued by priority) under the deadline.
+
+        Args:
+            jvm: fn starts a reasoner JVM through owlready2; it is given the sized
+                heap and, on timeout, killed by its own PID
+            handle: ReasonerRun the caller can cancel (leaves the queue or kills the JVM)
+            wait: False to give up at once instead of queueing (background work)
+
+        The slot is given back only when fn has returned, so a timed-out in-process
+        run (cancelled, see current_run) still counts against max_concurrent until
+        its thread has stopped writing to the world.
+        """
+        handle = handle or ReasonerRun()
+        start = self._acquire(priority, wait, handle)
+        try:
+            if jvm:
+                track_reasoner_processes()
+                handle.heap_mb = self.stats["last_heap_mb"] = self.heap_size_mb()
+        except BaseException:
+            self._release(start)
+            raise
+
+        outcome = {}
+
+        def target():
+            _current.run = handle
+            try:
+                outcome["value"] = fn()
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                _current.run = None
+                self._release(start)
+
+        worker = threading.Thread(target=target, name="reasoner", daemon=True)
+        worker.start()
+        worker.join(self.deadline)
+        if worker.is_alive():
+            self.stats["timeouts"] += 1
+            if handle.cancel():
+                self.stats["killed"] += 1
+                # Let the reasoner thread unwind now that its JVM is gone
+                worker.join(5)
+            raise ReasonerTimeout(f"Reasoner exceeded its {self.deadline:g}s deadline and was stopped")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome.get("value")
+
+    def wait_metrics(self) -> dict:
+        """Queue wait per priority class over the recent samples, in ms."""
+        metrics = {}
+        for priority, name in PRIORITY_NAMES.items():
+            waits = list(self._waits[priority])
+            metrics[name] = {
+                "admitted": len(waits),
+                "rejected": self._rejected[priority],
+                "mean_wait_ms": round(1000 * sum(waits) / len(waits), 1) if waits else None,
+                "p50_wait_ms": round(1000 * _percentile(waits, 50), 1) if waits else None,
+                "p95_wait_ms": round(1000 * _percentile(waits, 95), 1) if waits else None,
+                "max_wait_ms": round(1000 * max(waits), 1) if waits else None
+            }
+        return metrics
+
+    def snapshot(self) -> dict:
+        available = available_memory_mb()
+        with self._cond:
+            return dict(
+                self.stats,
+                running=self._running,
+                waiting=len(self._waiting),
+                max_concurrent=self.max_concurrent,
+                max_queue=self.max_queue,
+                deadline_s=self.deadline,
+                heap_floor_mb=self.heap_floor_mb,
+                available_mb=None if available is None else int(available),
+                priorities=self.wait_metrics()
+            )
@@ -0,0 +1,175 @@
+"""
+Result Cache - CVD Expert System
+Diagnosis results shared by all workers on a node, kept across restarts.
+
+Results are stored in a local SQLite file (WAL journal, memory-mapped reads),
+which every gunicorn worker can read and write safely at the same time. The
+key is the ontology version, the reasoner backend and the content hash of the
+normalized payload, so workers (or a hot-reload candidate) on different
+ontology versions share the file without touching each other's rows. Rows of
+a version nobody uses any more are never served; they expire after the TTL
+like all entries, or are evicted first, being least recently used, when the
+file grows past its size budget.
+
+Environment: RESULT_CACHE (1; 0 disables), RESULT_CACHE_PATH
+(cache/results.sqlite3), RESULT_CACHE_MAX_MB (256), RESULT_CACHE_TTL_S (86400).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from services.idempotency import content_hash
+
+
+MB = 1024 * 1024
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "results.sqlite3")
+# Evict down to this share of the budget so eviction does not run on every write
+EVICT_TO = 0.9
+MMAP_BYTES = 64 * MB
+# Bump when the stored result changes shape or meaning; rows of other formats are dropped like other ontologies
+RESULT_FORMAT = 2
+
+
+def file_sha256(path: str) -> str:
+    """sha256 of a file's bytes (the ontology version)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Node-local, cross-process cache of complete diagnosis results."""
+
+    def __init__(self, ontology_version: str, namespace: str = "", path: str = None,
+                 max_mb: float = None, ttl: float = None):
+        env = os.environ.get
+        self.ontology_version = ontology_version
+        self._stored_version = f"{ontology_version}:{RESULT_FORMAT}"
+        self.namespace = namespace
+        self.path = path or env("RESULT_CACHE_PATH") or DEFAULT_PATH
+        self.max_bytes = int((max_mb or float(env("RESULT_CACHE_MAX_MB", "256"))) * MB)
+        self.ttl = float(env("RESULT_CACHE_TTL_S", "86400")) if ttl is None else ttl
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0, "errors": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Short-lived connection: the service may be built in the gunicorn master before forking
+        db = self._connect()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, ontology TEXT NOT NULL, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        db.close()
+
+    @classmethod
+    def from_env(cls, ontology_version: str, namespace: str = ""):
+        """The configured cache, or None if disabled or the store cannot be opened."""
+        if os.environ.get("RESULT_CACHE", "1") == "0":
+            return None
+        try:
+            return cls(ontology_version, namespace)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Result cache disabled: {e}")
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        return db
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process (gunicorn forks after the service is built)
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            self._local.db = db = self._connect()
+            self._local.pid = os.getpid()
+        return db
+
+    def _key(self, data: dict) -> str:
+        return f"{self._stored_version}:{self.namespace}:{content_hash(data)}"
+
+    def get(self, data: dict):
+        """Stored result for this payload, or None."""
+        key = self._key(data)
+        now = time.time()
+        try:
+            db = self._db()
+            with db:
+                row = db.execute(
+                    "SELECT value FROM results WHERE key = ? AND ontology = ? AND created > ?",
+                    (key, self._stored_version, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE results SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Result cache read failed: {e}")
+            return None
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, data: dict, result: dict):
+        """Store a result; expired and least recently used rows make room for it."""
+        value = zlib.compress(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+        now = time.time()
+        try:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO results (key, ontology, value, size, created, accessed, hits)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (self._key(data), self._stored_version, value, len(value), now, now)
+                )
+                db.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl,))
+                self._evict(db)
+            self.stats["stores"] += 1
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Result cache write failed: {e}")
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * EVICT_TO)
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM results WHERE key = ?", victims)
+        self.stats["evicted"] += len(victims)
+
+    def snapshot(self) -> dict:
+        """Counters of this process plus the shared store's size."""
+        try:
+            entries, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except sqlite3.Error:
+            entries = size = None
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(
+            self.stats,
+            hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else None,
+            entries=entries,
+            size_mb=None if size is None else round(size / MB, 2),
+            max_mb=round(self.max_bytes / MB, 2),
+            ttl_s=self.ttl,
+            ontology_version=self.ontology_version[:16]
+        )
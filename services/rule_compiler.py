@@ -0,0 +1,127 @@
+"""
+Rule Compiler - CVD Expert System
+Translates the SWRL rules of the ontology into plain Python tuples so that
+derived indexes can be built once at load time and evaluated without owlready2.
+"""
+
+import operator
+
+
+# SWRL builtins used by the ontology, mapped to Python comparisons
+BUILTIN_OPS = {
+    "greaterThan": operator.gt,
+    "greaterThanOrEqual": operator.ge,
+    "lessThan": operator.lt,
+    "lessThanOrEqual": operator.le,
+    "equal": operator.eq,
+    "notEqual": operator.ne,
+}
+
+BUILTIN_SYMBOLS = {
+    "greaterThan": ">",
+    "greaterThanOrEqual": ">=",
+    "lessThan": "<",
+    "lessThanOrEqual": "<=",
+    "equal": "==",
+    "notEqual": "!=",
+}
+
+PATIENT_CLASS = "Pasien"
+
+
+def is_variable(term) -> bool:
+    """Variables are kept as strings prefixed with '?'."""
+    return isinstance(term, str) and term.startswith("?")
+
+
+def _term(arg):
+    """Convert an owlready2 rule argument into a plain Python term."""
+    cls_name = type(arg).__name__
+    if cls_name == "Variable":
+        return f"?{arg.name}"
+    if isinstance(arg, bool):
+        return arg
+    if isinstance(arg, (int, float)):
+        return arg
+    if isinstance(arg, str):
+        # Undeclared individuals come back as raw IRIs
+        return arg.rsplit("#", 1)[-1]
+    if hasattr(arg, "name"):
+        return arg.name
+    return str(arg)
+
+
+def _atom(atom) -> tuple:
+    """
+    Convert an owlready2 SWRL atom into a tuple.
+
+    Shapes:
+        ("class", class_name, (term,))
+        ("data", property_name, (subject, value))
+        ("object", property_name, (subject, object))
+        ("builtin", builtin_name, (arg1, arg2, ...))
+    """
+    kind = type(atom).__name__
+    args = tuple(_term(a) for a in atom.arguments)
+    if kind == "ClassAtom":
+        return ("class", atom.class_predicate.name, args)
+    if kind == "DatavaluedPropertyAtom":
+        return ("data", atom.property_predicate.name, args)
+    if kind == "IndividualPropertyAtom":
+        return ("object", atom.property_predicate.name, args)
+    if kind == "BuiltinAtom":
+        builtin = atom.builtin
+        return ("builtin", builtin if isinstance(builtin, str) else builtin.name, args)
+    return (kind, None, args)
+
+
+class CompiledRule:
+    """A SWRL rule as plain tuples, identified by its position in the ontology."""
+
+    __slots__ = ("id", "index", "text", "body", "head")
+
+    def __init__(self, index: int, text: str, body: tuple, head: tuple):
+        self.index = index
+        self.id = f"R{index + 1:02d}"
+        self.text = text
+        self.body = body
+        self.head = head
+
+    def atoms(self, kind: str, where: str = "body") -> list:
+        """Return atoms of a given kind from the body or head."""
+        return [a for a in getattr(self, where) if a[0] == kind]
+
+    def input_properties(self) -> set:
+        """Data properties read by the rule body."""
+        return {a[1] for a in self.body if a[0] == "data"}
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "rule": self.text}
+
+    def __repr__(self):
+        return f"<CompiledRule {self.id}: {self.text}>"
+
+
+def compile_rules(onto) -> list:
+    """Compile every SWRL rule in the ontology, preserving ontology order."""
+    compiled = []
+    for i, rule in enumerate(onto.rules()):
+        body = tuple(_atom(a) for a in rule.body)
+        head = tuple(_atom(a) for a in rule.head)
+        compiled.append(CompiledRule(i, str(rule).replace("cvd_sroiq_complete.", ""), body, head))
+    return compiled
+
+
+def class_members(onto, rules: list) -> dict:
+    """
+    Precompute instance names for every class used on a non-patient variable.
+    Used to evaluate atoms such as Statin(?stat) without the reasoner.
+    """
+    members = {}
+    for rule in rules:
+        for _, cls_name, args in rule.atoms("class"):
+            if cls_name == PATIENT_CLASS or cls_name in members:
+                continue
+            cls = onto[cls_name]
+            members[cls_name] = frozenset(i.name for i in cls.instances()) if cls else frozenset()
+    return members
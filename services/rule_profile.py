@@ -0,0 +1,185 @@
+"""
+Rule Profile - CVD Expert System
+Structured rule trace and per-rule counters.
+
+Every diagnosis replays the patient's input facts through the in-process rule
+engine (microseconds to a few ms) and diffs the replay against the reasoned
+individual. A rule fires when its body matched and the head facts it derived
+hold on the individual, whether or not an earlier rule had already derived
+them (`rules_fired`, the structured trace built only when a client asks for
+it); facts the reasoner asserted that no rule explains are traced as reasoner
+inferences (OWL axioms). The per-rule counters (evaluations, firings, firings
+that added new facts, time) are those of the rule engine replay only, kept
+per process and per ontology version; the reasoner's own wall time is summed
+separately (Pellet does not report per-rule cost).
+"""
+
+import threading
+from datetime import datetime
+
+from services.patient_facts import facts_from_payload
+
+
+def replay(engine, data: dict):
+    """
+    Run the rule layer on a payload.
+
+    Returns:
+        (facts, fired, timings): the input facts, [(rule, derived), ...] with every
+        head fact of each rule whose body matched (new or not), in order of first
+        match, and [(rule_id, elapsed_ns, new facts, derived facts), ...] per evaluation
+    """
+    facts = facts_from_payload(data)
+    inputs = facts.copy()
+    support = {}
+    timings = []
+    engine.run(facts, support=support, timings=timings)
+    rules = {rule.id: rule for rule in engine.rules}
+    fired = []
+    for rule_id in dict.fromkeys(rule_id for rule_id, _, _, derived in timings if derived):
+        fired.append((rules[rule_id], sorted(support[rule_id], key=str)))
+    return inputs, fired, timings
+
+
+def reconcile(inputs, fired: list, asserted) -> tuple:
+    """
+    Diff the replay against the facts asserted on the reasoned individual.
+
+    Returns:
+        (fired, inferred): the firings restricted to the facts the individual holds
+        (firings left without any are dropped), and the (property, value) facts it
+        holds that neither the input nor a firing explains. Without an individual
+        (asserted is None) the replay is returned as is.
+    """
+    if asserted is None:
+        return fired, []
+    confirmed = []
+    explained = set()
+    for rule, produced in fired:
+        held = [(prop, value) for prop, value in produced if _holds(asserted, prop, value)]
+        if held:
+            confirmed.append((rule, held))
+            explained.update(held)
+
+    inferred = [(prop, value) for prop, value in sorted(asserted.values.items())
+                if inputs.values.get(prop) != value and (prop, value) not in explained]
+    for prop, targets in sorted(asserted.objects.items()):
+        inferred.extend((prop, target) for target in sorted(targets)
+                        if not inputs.has(prop, target) and (prop, target) not in explained)
+    return confirmed, inferred
+
+
+def _holds(facts, prop: str, value) -> bool:
+    if prop in facts.values:
+        return facts.values[prop] == value
+    return facts.has(prop, value)
+
+
+def rules_fired(fired: list) -> int:
+    """Number of distinct rules that fired (see reconcile)."""
+    return len({rule.id for rule, _ in fired})
+
+
+def trace_events(inputs, fired: list, timings: list, inferred: list = ()) -> list:
+    """
+    Structured trace: one event per input fact, then one per fired rule with the
+    rule id, its SWRL text, the facts it derived, how many of them were new when
+    it ran and its evaluation time, in order of first match, then the reasoner's
+    own inferences (see reconcile).
+    """
+    events = [{"type": "input", "property": prop, "value": value} for prop, value in sorted(inputs.values.items())]
+    for prop, targets in sorted(inputs.objects.items()):
+        events.extend({"type": "input", "property": prop, "value": target} for target in sorted(targets))
+
+    # Evaluation time and new facts summed over a rule's evaluations
+    elapsed, new = {}, {}
+    for rule_id, ns, produced, _ in timings:
+        elapsed[rule_id] = elapsed.get(rule_id, 0) + ns
+        new[rule_id] = new.get(rule_id, 0) + produced
+    for rule, derived in fired:
+        events.append({
+            "type": "rule",
+            "rule": rule.id,
+            "swrl": rule.text,
+            "facts": [{"property": prop, "value": value} for prop, value in derived],
+            "new_facts": new.get(rule.id, 0),
+            "elapsed_us": round(elapsed.get(rule.id, 0) / 1000, 1)
+        })
+    events.extend({"type": "reasoner", "property": prop, "value": value} for prop, value in inferred)
+    return events
+
+
+class RuleProfile:
+    """Per-process firing counters and evaluation time of every rule (rule engine replay only)."""
+
+    def __init__(self, rules: list):
+        self._rules = {rule.id: rule for rule in rules}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # rule id -> [evaluations, firings, firings that added facts, new facts, ns]
+            self._stats = {rule_id: [0, 0, 0, 0, 0] for rule_id in self._rules}
+            self._runs = 0
+            self._reasoner_ms = 0.0
+            self._since = datetime.now().isoformat()
+
+    def record(self, timings: list, reasoner_ms: float = None):
+        """Add one diagnosis: the replay timings and, if it ran, the reasoner's wall time."""
+        with self._lock:
+            self._runs += 1
+            if reasoner_ms is not None:
+                self._reasoner_ms += reasoner_ms
+            for rule_id, elapsed_ns, produced, derived in timings:
+                stats = self._stats.get(rule_id)
+                if stats is None:
+                    continue
+                stats[0] += 1
+                stats[1] += 1 if derived else 0
+                stats[2] += 1 if produced else 0
+                stats[3] += produced
+                stats[4] += elapsed_ns
+
+    def snapshot(self, sort: str = "time_us", limit: int = None) -> dict:
+        """
+        Counters per rule, sorted by `sort` (time_us, firings, new_fact_firings, evaluations,
+        facts) descending. A firing is an evaluation whose body matched; new_fact_firings
+        and facts count only what was not already derived. never_fired lists the rules
+        that were evaluated but never matched, redundant the ones that fired but never
+        added a fact. All counters come from the rule engine replay, not from the
+        configured reasoner.
+        """
+        with self._lock:
+            stats = {rule_id: list(values) for rule_id, values in self._stats.items()}
+            runs, reasoner_ms, since = self._runs, self._reasoner_ms, self._since
+
+        total_ns = sum(values[4] for values in stats.values())
+        rules = []
+        for rule_id, (evaluations, firings, new_fact_firings, facts, ns) in stats.items():
+            rules.append({
+                "rule": rule_id,
+                "swrl": self._rules[rule_id].text,
+                "evaluations": evaluations,
+                "firings": firings,
+                "new_fact_firings": new_fact_firings,
+                "facts": facts,
+                "fire_rate": round(firings / evaluations, 3) if evaluations else None,
+                "time_us": round(ns / 1000, 1),
+                "mean_us": round(ns / 1000 / evaluations, 2) if evaluations else None,
+                "time_share": round(ns / total_ns, 4) if total_ns else 0.0
+            })
+        rules.sort(key=lambda r: (r.get(sort) or 0, r["rule"]), reverse=True)
+
+        return {
+            "since": since,
+            "source": "rule_engine_replay",
+            "diagnoses": runs,
+            "rules": len(rules),
+            "rule_engine_ms": round(total_ns / 1e6, 2),
+            "reasoner_ms": round(reasoner_ms, 1),
+            "never_fired": sorted(r["rule"] for r in rules if r["evaluations"] and not r["firings"]),
+            "redundant": sorted(r["rule"] for r in rules if r["firings"] and not r["new_fact_firings"]),
+            "never_evaluated": sorted(r["rule"] for r in rules if not r["evaluations"]),
+            "by_rule": rules[:limit] if limit else rules
+        }
@@ -0,0 +1,243 @@
+"""
+Shadow Evaluation - CVD Expert System
+Runs a sampled fraction of live diagnoses a second time against a candidate
+ontology file, off the response path, to see what an ontology edit would
+change before it is promoted.
+
+A single background thread owns the candidate KnowledgeService. Its reasoner
+runs go through the live governor at the lowest priority and never queue:
+a sample is dropped unless a slot is free, so shadow runs stay inside the
+live concurrency and heap budget. It does not use the shared result cache.
+Samples wait in a bounded queue and are dropped when it is full. Each run
+records the latency of both sides and the diagnosis, medication,
+contraindication, risk and severity differences in a local SQLite report
+store, which the workers of the node share. Payloads are stored only as
+their content hash.
+
+Environment: SHADOW_ONTOLOGY (candidate .owl; unset = off),
+SHADOW_SAMPLE_RATE (0.1), SHADOW_QUEUE (16), SHADOW_REPORT_PATH
+(cache/shadow.sqlite3).
+"""
+
+import copy
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from services.idempotency import content_hash
+from services.incremental import diff_results
+from services.resource_governor import ReasonerBusy
+from services.result_cache import file_sha256
+
+
+DEFAULT_REPORT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "shadow.sqlite3"
+)
+# Rows the summary aggregates (most recent first)
+SUMMARY_WINDOW = 1000
+RECENT_DIFFERENCES = 10
+
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))], 1)
+
+
+class ShadowReport:
+    """SQLite store of shadow runs, shared by the workers of a node."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("SHADOW_REPORT_PATH") or DEFAULT_REPORT_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS shadow_runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at TEXT NOT NULL,"
+                " live_version TEXT, candidate_version TEXT, payload_hash TEXT,"
+                " live_ms REAL, candidate_ms REAL, live_cached INTEGER NOT NULL DEFAULT 0,"
+                " identical INTEGER, diff TEXT, error TEXT)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Only the shadow thread and summary requests use it; a connection per call is enough
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def record(self, row: dict):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO shadow_runs (recorded_at, live_version, candidate_version, payload_hash,"
+                " live_ms, candidate_ms, live_cached, identical, diff, error)"
+                " VALUES (:recorded_at, :live_version, :candidate_version, :payload_hash,"
+                " :live_ms, :candidate_ms, :live_cached, :identical, :diff, :error)",
+                row
+            )
+
+    def summary(self, candidate_version: str = None) -> dict:
+        """Aggregate over the most recent runs of one candidate version (default: the latest)."""
+        with self._connect() as db:
+            if candidate_version is None:
+                latest = db.execute("SELECT candidate_version FROM shadow_runs ORDER BY id DESC LIMIT 1").fetchone()
+                candidate_version = latest[0] if latest else None
+            rows = db.execute(
+                "SELECT recorded_at, live_version, payload_hash, live_ms, candidate_ms, live_cached, identical, diff, error"
+                " FROM shadow_runs WHERE candidate_version IS ? ORDER BY id DESC LIMIT ?",
+                (candidate_version, SUMMARY_WINDOW)
+            ).fetchall()
+
+        compared = [r for r in rows if r[8] is None]
+        deltas = [r[4] - r[3] for r in compared if not r[5]]
+        fields = Counter()
+        items = Counter()
+        recent = []
+        for recorded_at, live_version, payload_hash, _, _, _, identical, diff, _ in compared:
+            if identical:
+                continue
+            diff = json.loads(diff)
+            for field, change in diff.items():
+                fields[field] += 1
+                for sign in ("added", "removed"):
+                    for item in change.get(sign, []):
+                        items[f"{field} {'+' if sign == 'added' else '-'}{item}"] += 1
+            if len(recent) < RECENT_DIFFERENCES:
+                recent.append({"recorded_at": recorded_at, "payload_hash": payload_hash[:16], "diff": diff})
+
+        return {
+            "candidate_version": candidate_version,
+            "runs": len(rows),
+            "errors": len(rows) - len(compared),
+            "identical": sum(1 for r in compared if r[6]),
+            "changed": sum(1 for r in compared if not r[6]),
+            "latency_delta_ms": {
+                "samples": len(deltas),
+                "mean": round(sum(deltas) / len(deltas), 1) if deltas else None,
+                "p50": _percentile(deltas, 50),
+                "p95": _percentile(deltas, 95)
+            },
+            "changed_fields": dict(fields.most_common()),
+            "top_changes": dict(items.most_common(20)),
+            "recent_differences": recent
+        }
+
+
+class ShadowEvaluator:
+    """Samples live diagnoses and replays them against the candidate ontology in the background."""
+
+    def __init__(self, build_candidate, candidate_path: str = None, sample_rate: float = None,
+                 queue_size: int = None, report: ShadowReport = None):
+        """
+        Args:
+            build_candidate: (ontology_path) -> KnowledgeService for the candidate
+        """
+        env = os.environ.get
+        self.candidate_path = candidate_path or env("SHADOW_ONTOLOGY")
+        self.sample_rate = float(env("SHADOW_SAMPLE_RATE", "0.1")) if sample_rate is None else sample_rate
+        self._build_candidate = build_candidate
+        self._queue = queue.Queue(maxsize=queue_size or int(env("SHADOW_QUEUE", "16")))
+        self._report = report
+        self._lock = threading.Lock()
+        self._thread = None
+        self._candidate = None
+        self.state = {
+            "enabled": bool(self.candidate_path) and self.sample_rate > 0,
+            "candidate_path": self.candidate_path,
+            "candidate_version": None,
+            "sampled": 0,
+            "dropped": 0,
+            "evaluated": 0,
+            "error": None
+        }
+
+    @property
+    def report(self) -> ShadowReport:
+        if self._report is None:
+            self._report = ShadowReport()
+        return self._report
+
+    def submit(self, data: dict, result: dict, live_ms: float, live_version: str) -> bool:
+        """Maybe queue a shadow run of a finished live diagnosis (never blocks)."""
+        if not self.state["enabled"] or random.random() >= self.sample_rate:
+            return False
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((copy.deepcopy(data), result, live_ms, live_version))
+        except queue.Full:
+            self.state["dropped"] += 1
+            return False
+        self.state["sampled"] += 1
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="shadow-eval", daemon=True)
+                self._thread.start()
+
+    def _candidate_service(self):
+        # Rebuilt when the candidate file changes, so a new edit can be shadowed without a restart
+        version = file_sha256(self.candidate_path)
+        if self._candidate is None or self._candidate.ontology_version != version:
+            previous = self._candidate
+            self._candidate = self._build_candidate(self.candidate_path)
+            self.state["candidate_version"] = self._candidate.ontology_version[:16]
+            print(f"👥 Shadow candidate loaded: {self.state['candidate_version']}")
+            if previous is not None:
+                # Only this thread runs it and its last sample has finished: close its world
+                previous.retire()
+        return self._candidate
+
+    def _work(self):
+        while True:
+            data, live, live_ms, live_version = self._queue.get()
+            try:
+                self._evaluate(data, live, live_ms, live_version)
+            except Exception as e:
+                # Candidate file missing or unloadable: keep sampling, report why nothing is compared
+                self.state["error"] = str(e)
+                print(f"❌ Shadow evaluation failed: {e}")
+
+    def _evaluate(self, data: dict, live: dict, live_ms: float, live_version: str):
+        candidate = self._candidate_service()
+        row = {
+            "recorded_at": datetime.now().isoformat(),
+            "live_version": live_version[:16],
+            "candidate_version": candidate.ontology_version[:16],
+            "payload_hash": content_hash(data),
+            "live_ms": round(live_ms, 1),
+            "candidate_ms": None,
+            "live_cached": int(bool(live.get("cached"))),
+            "identical": None,
+            "diff": None,
+            "error": None
+        }
+        start = time.perf_counter()
+        try:
+            shadow = candidate.diagnose(data)
+        except ReasonerBusy:
+            # Live traffic comes first; this sample is simply lost
+            self.state["dropped"] += 1
+            return
+        except Exception as e:
+            row["error"] = str(e)
+        else:
+            row["candidate_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            candidate.cleanup_patient(shadow["patient_id"])
+            diff = diff_results(live, shadow)
+            row["identical"] = int(not diff)
+            row["diff"] = json.dumps(diff, ensure_ascii=False)
+        self.report.record(row)
+        self.state["evaluated"] += 1
+
+    def summary(self) -> dict:
+        return dict(self.state, report=self.report.summary(self.state["candidate_version"]))
@@ -1,9 +1,10 @@
 
 from SPARQLWrapper import SPARQLWrapper, JSON, POST
 from datetime import datetime
-import uuid
 import logging
 
+from services.rdf_bulk import diagnosis_triples, result_row, ntriple
+
 class SparqlService:
     """Service for interacting with Apache Jena Fuseki via SPARQL."""
     
@@ -25,78 +26,14 @@ class SparqlService:
         Save diagnosis result to Jena Fuseki using SPARQL INSERT.
         """
         try:
-            # Generate unique ID for this diagnosis event
-            diag_id = f"Diagnosa_{uuid.uuid4().hex[:8]}"
             patient_name = self._clean_string(patient_data.get('demographics', {}).get('name', 'Unknown'))
-            patient_id_ref = diagnosis_result.get('patient_id') # Ref to the individual in ontology
-            
             timestamp = datetime.now().isoformat()
             
-            # Prepare data values
-            age = patient_data.get('demographics', {}).get('age', 0)
-            gender = self._clean_string(patient_data.get('demographics', {}).get('gender', 'Unknown'))
-            
-            # Construct RDF Triples for INSERT
-            triples = []
-            
-            # Define Patient individual (if not exists, or update existing)
-            # Note: We use the same ID logic as KnowledgeService to ensure consistency
-            triples.append(f"cvd:{patient_id_ref} rdf:type cvd:Pasien .")
-            triples.append(f'cvd:{patient_id_ref} cvd:memilikiNama "{patient_name}"^^xsd:string .')
-            triples.append(f'cvd:{patient_id_ref} cvd:memilikiUsia "{age}"^^xsd:integer .')
-            triples.append(f'cvd:{patient_id_ref} cvd:memilikiJenisKelamin "{gender}"^^xsd:string .')
-            
-            # Add Diagnoses properties
-            for diag in diagnosis_result.get('diagnoses', []):
-                diag_class = diag.get('class')
-                if diag_class:
-                    triples.append(f"cvd:{patient_id_ref} cvd:memiliki cvd:{diag_class}_Instance .") # Assuming instance linking or creates new
-                    # Alternatively, just link to the class/concept if that's what we mean
-                    # But usually output connects to specific instances. 
-                    # Let's link to the stored 'memiliki' relationships.
-            
-            # For logging history, we might want a separate "DiagnosisEvent" object in RDF
-            # Or attach timestamp to the patient (though patient has many diagnoses over time)
-            # Let's create a specific History/Log object if we want time-series
-            # But per user request "save result", let's attach the result directly to patient 
-            # and maybe add a Data Property for the specific timestamp of THIS diagnosis
-            
-            # Simplified approach: Update the Patient individual with the latest facts
-            
-            # 1. Diagnoses
-            for d in diagnosis_result.get('diagnoses', []):
-                d_name = d.get('name')
-                triples.append(f'cvd:{patient_id_ref} cvd:hasRecentDiagnosis "{self._clean_string(d_name)}"^^xsd:string .')
-
-            # 2. Risk & Severity
-            risk = diagnosis_result.get('risk_category')
-            severity = diagnosis_result.get('severity')
-            triples.append(f'cvd:{patient_id_ref} cvd:hasRecentRiskCategory "{self._clean_string(risk)}"^^xsd:string .')
-            triples.append(f'cvd:{patient_id_ref} cvd:hasRecentSeverity "{self._clean_string(severity)}"^^xsd:string .')
-            
-            # 3. Timestamp & Medical Data
-            triples.append(f'cvd:{patient_id_ref} cvd:lastDiagnosisTime "{timestamp}"^^xsd:dateTime .')
-            
-            # Additional CSV-matching fields
-            ascvd = diagnosis_result.get('ascvd_score', 0)
-            rules = diagnosis_result.get('rules_fired', 0)
-            emergency = str(diagnosis_result.get('emergency', 'False')).lower()
-            
-            triples.append(f'cvd:{patient_id_ref} cvd:hasRecentASCVD "{ascvd}"^^xsd:float .')
-            triples.append(f'cvd:{patient_id_ref} cvd:hasRulesFired "{rules}"^^xsd:integer .')
-            triples.append(f'cvd:{patient_id_ref} cvd:isEmergency "{emergency}"^^xsd:boolean .')
-
-            # 4. Medications (List)
-            for m in diagnosis_result.get('medications', []):
-                m_name = self._clean_string(m.get('name'))
-                triples.append(f'cvd:{patient_id_ref} cvd:hasRecommendedMedication "{m_name}"^^xsd:string .')
-
-            # 5. Contraindications (List)
-            for c in diagnosis_result.get('contraindications', []):
-                c_drug = self._clean_string(c.get('drug'))
-                triples.append(f'cvd:{patient_id_ref} cvd:hasContraindication "{c_drug}"^^xsd:string .')
-
-            triple_str = "\n".join(triples)
+            # The same triples the bulk loader writes (services/rdf_bulk.py): patient facts,
+            # cvd:memiliki links to the diagnosis classes, latest results and timestamp
+            classes = [d.get('class') for d in diagnosis_result.get('diagnoses', [])]
+            triples = diagnosis_triples(result_row(patient_data, diagnosis_result), classes, timestamp)
+            triple_str = "\n".join(ntriple(t).rstrip("\n") for t in triples)
             
             query = f"""
             {self.prefix}
@@ -125,13 +62,12 @@ class SparqlService:
             logging.error(f"Failed to save to Jena: {str(e)}")
             return False
 
-    def get_history(self, limit=50):
-        """Retrieve diagnosis history from Jena."""
-        try:
-            query = f"""
+    def _history_query(self, filters: str = "", order: str = "DESC(?time)", limit: int = 50) -> str:
+        """History SELECT: one row per patient diagnosis, list values joined with '; '."""
+        return f"""
             {self.prefix}
             
-            SELECT ?time ?name ?age ?gender 
+            SELECT ?patient ?time ?name ?age ?gender 
                    (GROUP_CONCAT(DISTINCT ?diag; separator="; ") AS ?diagnoses)
                    (GROUP_CONCAT(DISTINCT ?med; separator="; ") AS ?medications)
                    (GROUP_CONCAT(DISTINCT ?contra; separator="; ") AS ?contraindications)
@@ -152,11 +88,94 @@ class SparqlService:
                 OPTIONAL {{ ?patient cvd:hasRecentASCVD ?ascvd }}
                 OPTIONAL {{ ?patient cvd:hasRulesFired ?rules }}
                 OPTIONAL {{ ?patient cvd:isEmergency ?emergency }}
+                {filters}
             }}
-            GROUP BY ?time ?name ?age ?gender ?risk ?ascvd ?severity ?rules ?emergency
-            ORDER BY DESC(?time)
+            GROUP BY ?patient ?time ?name ?age ?gender ?risk ?ascvd ?severity ?rules ?emergency
+            ORDER BY {order}
             LIMIT {limit}
             """
+
+    def _history_row(self, r: dict) -> dict:
+        """Flat history row of one SELECT binding."""
+        return {
+            "timestamp": r.get("time", {}).get("value", ""),
+            "patient_id": r.get("patient", {}).get("value", "").rsplit("#", 1)[-1],
+            "patient_name": r.get("name", {}).get("value", "Unknown"),
+            "age": r.get("age", {}).get("value", ""),
+            "gender": r.get("gender", {}).get("value", ""),
+            "diagnoses": r.get("diagnoses", {}).get("value", ""),
+            "medications": r.get("medications", {}).get("value", ""),
+            "contraindications": r.get("contraindications", {}).get("value", ""),
+            "risk_category": r.get("risk", {}).get("value", ""),
+            "ascvd_score": r.get("ascvd", {}).get("value", ""),
+            "severity": r.get("severity", {}).get("value", ""),
+            "rules_fired": r.get("rules", {}).get("value", 0),
+            "emergency": r.get("emergency", {}).get("value", "false")
+        }
+
+    def _select(self, query: str) -> list:
+        sparql = SPARQLWrapper(self.query_endpoint)
+        sparql.setReturnFormat(JSON)
+        sparql.setQuery(query)
+        return sparql.query().convert()["results"]["bindings"]
+
+    def iter_history(self, start: str = None, end: str = None, page_size: int = 500):
+        """
+        All history rows with start <= time < end (ISO datetimes, optional), oldest first.
+        Pages are fetched by keyset (time, patient) so every query stays as cheap as the first.
+        """
+        bounds = []
+        if start:
+            bounds.append(f'?time >= "{start}"^^xsd:dateTime')
+        if end:
+            bounds.append(f'?time < "{end}"^^xsd:dateTime')
+        after = None
+        while True:
+            conditions = list(bounds)
+            if after:
+                time, patient = after
+                conditions.append(
+                    f'(?time > "{time}"^^xsd:dateTime || '
+                    f'(?time = "{time}"^^xsd:dateTime && STR(?patient) > "{patient}"))'
+                )
+            filters = f"FILTER({' && '.join(conditions)})" if conditions else ""
+            # Some stores answer an empty grouped SELECT with one unbound row
+            bindings = [r for r in self._select(self._history_query(filters, "?time ?patient", page_size))
+                        if "patient" in r]
+            for r in bindings:
+                yield self._history_row(r)
+            if len(bindings) < page_size:
+                return
+            last = bindings[-1]
+            after = (last["time"]["value"], last["patient"]["value"])
+
+    def iter_patient_triples(self, page_size: int = 500):
+        """
+        Every (s, p, o) binding of the store's Pasien individuals, grouped by subject.
+        Subjects are paged by keyset, then their triples fetched with one VALUES query per page.
+        """
+        after = None
+        while True:
+            keyset = f'FILTER(STR(?s) > "{after}")' if after else ""
+            query = f"""
+            {self.prefix}
+            SELECT DISTINCT ?s WHERE {{ ?s rdf:type cvd:Pasien . {keyset} }}
+            ORDER BY STR(?s)
+            LIMIT {page_size}
+            """
+            subjects = [r["s"]["value"] for r in self._select(query) if "s" in r]
+            if not subjects:
+                return
+            values = " ".join(f"<{subject}>" for subject in subjects)
+            yield from self._select(f"SELECT ?s ?p ?o WHERE {{ VALUES ?s {{ {values} }} ?s ?p ?o }} ORDER BY ?s")
+            if len(subjects) < page_size:
+                return
+            after = subjects[-1]
+
+    def get_history(self, limit=50):
+        """Retrieve diagnosis history from Jena."""
+        try:
+            query = self._history_query(limit=limit)
             
             # VISIBILITY: Print the query for the user
             print("\n" + "="*50)
@@ -165,29 +184,7 @@ class SparqlService:
             print(query)
             print("="*50 + "\n")
             
-            sparql = SPARQLWrapper(self.query_endpoint)
-            sparql.setReturnFormat(JSON)
-            sparql.setQuery(query)
-            results = sparql.query().convert()
-            
-            history = []
-            for r in results["results"]["bindings"]:
-                history.append({
-                    "timestamp": r.get("time", {}).get("value", ""),
-                    "patient_name": r.get("name", {}).get("value", "Unknown"),
-                    "age": r.get("age", {}).get("value", ""),
-                    "gender": r.get("gender", {}).get("value", ""),
-                    "diagnoses": r.get("diagnoses", {}).get("value", ""),
-                    "medications": r.get("medications", {}).get("value", ""),
-                    "contraindications": r.get("contraindications", {}).get("value", ""),
-                    "risk_category": r.get("risk", {}).get("value", ""),
-                    "ascvd_score": r.get("ascvd", {}).get("value", ""),
-                    "severity": r.get("severity", {}).get("value", ""),
-                    "rules_fired": r.get("rules", {}).get("value", 0),
-                    "emergency": r.get("emergency", {}).get("value", "false")
-                })
-                
-            return history
+            return [self._history_row(r) for r in self._select(query)]
             
         except Exception as e:
             logging.error(f"Failed to fetch history from Jena: {str(e)}")
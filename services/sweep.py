@@ -0,0 +1,206 @@
+"""
+What-if Sweep - CVD Expert System
+Evaluates a base payload over a range of one or two input parameters
+("at what SBP does this patient reach Stage 2?", "what if eGFR fell to 25?").
+
+- Shared prefix: SWRL rules are monotonic, so everything derivable without the
+  swept properties is derived once and copied into every variant; each variant
+  only runs the rules downstream of the swept properties.
+- Threshold jumping: the rules compare each input against constants, so the
+  outcome can only change at those constants. One representative per interval
+  between thresholds is evaluated instead of every point of the range.
+"""
+
+import itertools
+import time
+
+from services.patient_facts import DATA_FIELDS, facts_from_payload
+from services.triage import entity_annotation
+
+
+MAX_PARAMETERS = 2
+MAX_POINTS_PER_AXIS = 10000
+# Evaluations allowed when thresholds cannot be used (full grid)
+MAX_EVALUATIONS = 5000
+
+# Outcome fields: result name -> object property read from the derived facts
+OUTCOME_PROPERTIES = {
+    "diagnoses": "memiliki",
+    "medications": "memerlukan",
+    "contraindications": "kontraindikasiPada",
+    "risk_category": "memilikiKategoriRisiko",
+    "severity": "memilikiTingkatKeparahan",
+}
+
+# "vitals.sbp" -> (section, key, property, cast)
+SWEEPABLE_FIELDS = {f"{section}.{key}": (section, key, prop, cast) for section, key, prop, cast in DATA_FIELDS}
+
+
+class ParameterSweep:
+    """Shared-prefix, threshold-jumping evaluation of payload variants on the rule engine."""
+
+    def __init__(self, onto, engine, threshold_map):
+        self.onto = onto
+        self.engine = engine
+        # Properties compared any other way than against a constant are swept point by point
+        self.thresholds = {prop: set(threshold_map.boundaries(prop)) for prop in threshold_map.properties}
+        self.exact = set(threshold_map.inexact)
+        self._names = {}
+
+    def _display(self, name: str) -> str:
+        if name not in self._names:
+            self._names[name] = entity_annotation(self.onto, name, "hasDisplayName") or name.replace("_Instance", "")
+        return self._names[name]
+
+    def _axis(self, spec: dict) -> dict:
+        field = spec.get("field")
+        if field not in SWEEPABLE_FIELDS:
+            raise ValueError(f"Unknown or non-numeric field '{field}'. Sweepable: {', '.join(sorted(SWEEPABLE_FIELDS))}")
+        section, key, prop, cast = SWEEPABLE_FIELDS[field]
+        if cast is str:
+            raise ValueError(f"Field '{field}' is not numeric")
+        try:
+            start, stop = float(spec["from"]), float(spec["to"])
+            step = float(spec.get("step", 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Parameter '{field}' needs numeric 'from' and 'to' (and optional 'step')")
+        if step <= 0 or stop < start:
+            raise ValueError(f"Parameter '{field}' needs from <= to and step > 0")
+        count = int(round((stop - start) / step)) + 1
+        if count > MAX_POINTS_PER_AXIS:
+            raise ValueError(f"Parameter '{field}' has {count} points (max {MAX_POINTS_PER_AXIS})")
+
+        grid = []
+        for i in range(count):
+            value = cast(round(start + i * step, 10))
+            if not grid or grid[-1] != value:
+                grid.append(value)
+
+        if prop in self.exact:
+            points = list(range(len(grid)))
+        else:
+            # First grid point at/after each threshold covers both >= and > comparisons
+            cuts = {0}
+            for c in self.thresholds.get(prop, ()):
+                for i, value in enumerate(grid):
+                    if value >= c:
+                        cuts.add(i)
+                        if value == c and i + 1 < len(grid):
+                            cuts.add(i + 1)
+                        break
+            points = sorted(cuts)
+
+        return {"field": field, "section": section, "key": key, "property": prop,
+                "grid": grid, "points": points}
+
+    def _outcome(self, facts) -> tuple:
+        return tuple(
+            tuple(sorted(self._display(v) for v in facts.objects.get(prop, ())))
+            for prop in OUTCOME_PROPERTIES.values()
+        )
+
+    def _outcome_dict(self, outcome: tuple) -> dict:
+        return {name: list(values) for name, values in zip(OUTCOME_PROPERTIES, outcome)}
+
+    def run(self, base: dict, parameters: list) -> dict:
+        """
+        Args:
+            base: /api/diagnose payload
+            parameters: 1-2 of {"field": "vitals.sbp", "from": 120, "to": 200, "step": 1}
+
+        Returns:
+            1 parameter: segments of the range with their outcome, and the changes between them
+            2 parameters: row/column ranges and a cell table of outcome indexes
+        """
+        start = time.perf_counter()
+        if not parameters or len(parameters) > MAX_PARAMETERS:
+            raise ValueError(f"Give 1 to {MAX_PARAMETERS} parameters")
+        axes = [self._axis(p) for p in parameters]
+        if len({a["property"] for a in axes}) != len(axes):
+            raise ValueError("Parameters must be different fields")
+
+        evaluations = variants = 1
+        for axis in axes:
+            evaluations *= len(axis["points"])
+            variants *= len(axis["grid"])
+        if evaluations > MAX_EVALUATIONS:
+            raise ValueError(f"Sweep needs {evaluations} evaluations (max {MAX_EVALUATIONS}); use a larger step")
+
+        # Shared prefix: everything derivable without the swept properties
+        swept = [a["property"] for a in axes]
+        prefix = facts_from_payload(base)
+        for prop in swept:
+            prefix.values.pop(prop, None)
+        self.engine.run(prefix)
+        agenda = self.engine.downstream(swept)
+
+        outcomes = []
+        index = {}
+        cells = {}
+        for combo in itertools.product(*(a["points"] for a in axes)):
+            facts = prefix.copy()
+            for axis, i in zip(axes, combo):
+                facts.values[axis["property"]] = axis["grid"][i]
+            self.engine.run(facts, agenda)
+            outcome = self._outcome(facts)
+            if outcome not in index:
+                index[outcome] = len(outcomes)
+                outcomes.append(outcome)
+            cells[combo] = index[outcome]
+
+        ranges = [self._ranges(axis) for axis in axes]
+        result = {
+            "parameters": [
+                {"field": a["field"], "property": a["property"], "from": a["grid"][0], "to": a["grid"][-1],
+                 "points": len(a["grid"]), "thresholds": sorted(t for t in self.thresholds.get(a["property"], ())
+                                                                if a["grid"][0] <= t <= a["grid"][-1])}
+                for a in axes
+            ],
+            "variants": variants,
+            "evaluated": evaluations,
+            "rules_per_variant": len(agenda),
+        }
+
+        if len(axes) == 1:
+            result.update(self._segments(axes[0], ranges[0], cells, outcomes))
+        else:
+            result["outcomes"] = [self._outcome_dict(o) for o in outcomes]
+            result["table"] = {
+                "rows": {"field": axes[0]["field"], "ranges": ranges[0]},
+                "columns": {"field": axes[1]["field"], "ranges": ranges[1]},
+                "cells": [[cells[(i, j)] for j in axes[1]["points"]] for i in axes[0]["points"]]
+            }
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    def _ranges(self, axis: dict) -> list:
+        """[first, last] grid value represented by each evaluated point."""
+        points, grid = axis["points"], axis["grid"]
+        ends = points[1:] + [len(grid)]
+        return [[grid[p], grid[e - 1]] for p, e in zip(points, ends)]
+
+    def _segments(self, axis: dict, ranges: list, cells: dict, outcomes: list) -> dict:
+        # Merge neighbouring intervals with the same outcome
+        segments = []
+        for point, span in zip(axis["points"], ranges):
+            outcome = cells[(point,)]
+            if segments and segments[-1][1] == outcome:
+                segments[-1][0][1] = span[1]
+            else:
+                segments.append([list(span), outcome])
+
+        rows = []
+        changes = []
+        previous = None
+        for span, outcome_id in segments:
+            outcome = self._outcome_dict(outcomes[outcome_id])
+            rows.append(dict({axis["field"]: span}, **outcome))
+            if previous is not None:
+                change = {"at": {axis["field"]: span[0]}}
+                for name in OUTCOME_PROPERTIES:
+                    old, new = set(previous[name]), set(outcome[name])
+                    if old != new:
+                        change[name] = {"added": sorted(new - old), "removed": sorted(old - new)}
+                changes.append(change)
+            previous = outcome
+        return {"segments": rows, "changes": changes}
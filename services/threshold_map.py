@@ -0,0 +1,102 @@
+"""
+Threshold Map - CVD Expert System
+Decision boundaries of every numeric input, extracted from the SWRL builtin
+comparisons at load time: each comparison constant, the rule it belongs to,
+what that rule concludes and what else it requires. Served at /api/thresholds
+so clients can validate inputs and show "distance to next stage" locally.
+"""
+
+import hashlib
+import json
+
+from services.patient_facts import DATA_FIELDS
+from services.rule_compiler import BUILTIN_SYMBOLS, PATIENT_CLASS, is_variable
+from services.triage import entity_annotation
+
+
+# Operator seen from the variable's side when the constant comes first (c < ?x  ==  ?x > c)
+_FLIPPED = {">": "<", ">=": "<=", "<": ">", "<=": ">=", "==": "==", "!=": "!="}
+
+# ontology data property -> payload field ("vitals.sbp")
+PROPERTY_FIELDS = {prop: f"{section}.{key}" for section, key, prop, _ in DATA_FIELDS}
+
+
+class ThresholdMap:
+    """Per-property table of comparison constants and the conclusions they lead to."""
+
+    def __init__(self, onto, rules: list):
+        self.onto = onto
+        self.properties = {}
+        # Properties compared with something other than a single constant
+        self.inexact = set()
+        self._build(rules)
+        self._payload = None
+
+    def _label(self, name):
+        if not isinstance(name, str):
+            return name
+        return entity_annotation(self.onto, name, "hasDisplayName") or name.replace("_Instance", "")
+
+    def _build(self, rules: list):
+        for rule in rules:
+            bound = {args[1]: pred for kind, pred, args in rule.body if kind == "data" and is_variable(args[1])}
+            comparisons = []
+            for kind, pred, args in rule.body:
+                if kind != "builtin" or pred not in BUILTIN_SYMBOLS:
+                    continue
+                variables = [a for a in args if is_variable(a)]
+                constants = [a for a in args if not is_variable(a)]
+                if len(variables) != 1 or len(constants) != 1 or not isinstance(constants[0], (int, float)):
+                    self.inexact.update(bound[v] for v in variables if v in bound)
+                    continue
+                if variables[0] not in bound:
+                    continue
+                op = BUILTIN_SYMBOLS[pred] if is_variable(args[0]) else _FLIPPED[BUILTIN_SYMBOLS[pred]]
+                comparisons.append({"property": bound[variables[0]], "op": op, "value": constants[0]})
+
+            leads_to = [
+                {"property": pred, "value": args[-1], "label": self._label(args[-1])}
+                for kind, pred, args in rule.head if not is_variable(args[-1])
+            ]
+            links = [
+                {"property": pred, "value": args[1]}
+                for kind, pred, args in rule.body
+                if kind == "object" and not is_variable(args[1])
+            ]
+            classes = [pred for kind, pred, args in rule.body if kind == "class" and pred != PATIENT_CLASS]
+
+            for comparison in comparisons:
+                others = [c for c in comparisons if c is not comparison]
+                entry = {
+                    "op": comparison["op"],
+                    "value": comparison["value"],
+                    "rule": rule.id,
+                    "leads_to": leads_to,
+                    "requires": others + links + [{"class": c} for c in classes]
+                }
+                self.properties.setdefault(comparison["property"], []).append(entry)
+
+        for entries in self.properties.values():
+            entries.sort(key=lambda e: (e["value"], e["rule"]))
+
+    def boundaries(self, prop: str) -> list:
+        """Sorted distinct constants the property is compared with."""
+        return sorted({e["value"] for e in self.properties.get(prop, ())})
+
+    def to_dict(self) -> dict:
+        """JSON payload keyed by payload field (or property name), with a content version."""
+        if self._payload is None:
+            fields = {}
+            for prop, entries in sorted(self.properties.items()):
+                fields[PROPERTY_FIELDS.get(prop, prop)] = {
+                    "property": prop,
+                    "boundaries": self.boundaries(prop),
+                    "exact": prop not in self.inexact,
+                    "thresholds": entries
+                }
+            body = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+            self._payload = {
+                "version": hashlib.sha256(body.encode("utf-8")).hexdigest()[:16],
+                "fields": fields
+            }
+        return self._payload
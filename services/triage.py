@@ -0,0 +1,114 @@
+"""
+Triage Evaluator - CVD Expert System
+Emergency fast path: evaluates, on the raw payload, only the SWRL rules that can
+lead to a critical ("Kritis") conclusion, before the patient is created and
+Pellet runs.
+"""
+
+import time
+
+from services.patient_facts import facts_from_payload
+from services.rule_engine import RuleEngine
+
+
+CRITICAL_LEVEL = "Kritis"
+CONDITION_PROPERTY = "memiliki"
+SEVERITY_PROPERTY = "memilikiTingkatKeparahan"
+
+
+def _annotation(entity, name):
+    value = getattr(entity, name, None)
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def entity_annotation(onto, entity_name: str, name: str):
+    """Read an annotation from an entity, falling back to its class (X_Instance -> X)."""
+    entity = onto[entity_name]
+    if entity is None:
+        return None
+    value = _annotation(entity, name)
+    if value:
+        return value
+    for cls in getattr(entity, "is_a", []):
+        value = _annotation(cls, name)
+        if value:
+            return value
+    return None
+
+
+class TriageEvaluator:
+    """Precompiled subset of rules whose conclusions carry hasSeverityLevel Kritis."""
+
+    def __init__(self, onto, rules: list, engine: RuleEngine):
+        self.critical_conditions = {}
+        self.critical_severities = set()
+        self.rule_ids = set()
+        self._build(onto, rules)
+        self.engine = engine.subset(self.rule_ids)
+
+    def _is_goal(self, onto, pred, value) -> bool:
+        if pred == CONDITION_PROPERTY:
+            if value not in self.critical_conditions:
+                severity = entity_annotation(onto, value, "hasSeverityLevel")
+                if severity != CRITICAL_LEVEL:
+                    return False
+                self.critical_conditions[value] = (
+                    entity_annotation(onto, value, "hasDisplayName") or value.replace("_Instance", "")
+                )
+            return True
+        if pred == SEVERITY_PROPERTY:
+            if CRITICAL_LEVEL in str(value):
+                self.critical_severities.add(value)
+                return True
+        return False
+
+    def _build(self, onto, rules: list):
+        # Backward chaining from critical conclusions to the input-level rules that support them
+        goals = set()
+        for rule in rules:
+            for kind, pred, args in rule.head:
+                if kind == "object" and self._is_goal(onto, pred, args[1]):
+                    goals.add((pred, args[1]))
+
+        while True:
+            added = False
+            for rule in rules:
+                if rule.id in self.rule_ids:
+                    continue
+                if any(a[0] == "object" and (a[1], a[2][1]) in goals for a in rule.head):
+                    self.rule_ids.add(rule.id)
+                    added = True
+                    for kind, pred, args in rule.body:
+                        if kind == "object":
+                            goals.add((pred, args[1]))
+            if not added:
+                break
+
+    def evaluate(self, data: dict) -> dict:
+        """Run the triage rules on a raw /api/diagnose payload."""
+        start = time.perf_counter()
+        facts = facts_from_payload(data)
+        fired = self.engine.run(facts)
+
+        findings = []
+        critical_severity = False
+        for rule, produced in fired:
+            for prop, value in produced:
+                if prop == CONDITION_PROPERTY and value in self.critical_conditions:
+                    findings.append({
+                        "name": self.critical_conditions[value],
+                        "class": value.replace("_Instance", ""),
+                        "severity": CRITICAL_LEVEL,
+                        "rule": rule.id
+                    })
+                elif prop == SEVERITY_PROPERTY and value in self.critical_severities:
+                    critical_severity = True
+
+        return {
+            "emergency": bool(findings) or critical_severity,
+            "findings": findings,
+            "rules_evaluated": len(self.engine.rules),
+            "elapsed_us": round((time.perf_counter() - start) * 1e6, 1)
+        }
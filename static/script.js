@@ -18,37 +18,145 @@ document.getElementById('patientForm').addEventListener('submit', async (e) => {
     await submitDiagnosis();
 });
 
+// In-flight streaming diagnosis (aborted on cancel or resubmit)
+let diagnosisController = null;
+
+// Loading text shown after each streamed stage
+const STAGE_MESSAGES = {
+    accepted: 'Data diterima, menjalankan Pellet Reasoner...',
+    reasoning: 'Reasoning selesai, membaca diagnosis...',
+    diagnoses: 'Membaca rekomendasi obat...',
+    medications: 'Memeriksa kontraindikasi...',
+    contraindications: 'Menghitung kategori risiko...',
+    risk: 'Menentukan tingkat keparahan...',
+    severity: 'Menyusun rekomendasi gaya hidup...',
+    recommendations: 'Menyelesaikan hasil...'
+};
+
 async function submitDiagnosis() {
+    if (diagnosisController) {
+        diagnosisController.abort();
+    }
+    const controller = new AbortController();
+    diagnosisController = controller;
     showLoading(true);
 
     try {
         const formData = collectFormData();
         console.log('Sending data:', formData);
 
-        const response = await fetch(`${API_BASE}/api/diagnose`, {
+        const response = await fetch(`${API_BASE}/api/diagnose/stream`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
             },
-            body: JSON.stringify(formData)
+            body: JSON.stringify(formData),
+            signal: controller.signal
         });
 
         if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.error || 'Diagnosis failed');
+            throw diagnosisError(await response.json());
         }
 
-        const result = await response.json();
+        const result = await readDiagnosisStream(response);
         console.log('Result:', result);
 
         currentResult = result;
         displayResults(result);
 
     } catch (error) {
+        if (error.name === 'AbortError') {
+            console.log('Diagnosis cancelled');
+            return;
+        }
         console.error('Error:', error);
         alert('Error: ' + error.message);
     } finally {
-        showLoading(false);
+        if (diagnosisController === controller) {
+            diagnosisController = null;
+            showLoading(false);
+        }
+    }
+}
+
+function cancelDiagnosis() {
+    if (diagnosisController) {
+        diagnosisController.abort();
+    }
+}
+
+// Parse the Server-Sent Events stream and resolve with the final result
+async function readDiagnosisStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+
+            const payload = JSON.parse(data);
+            if (event === 'error') {
+                throw diagnosisError(payload);
+            }
+            if (event === 'complete') {
+                return payload;
+            }
+            handleStage(event, payload);
+        }
+    }
+    throw new Error('Diagnosis stream ended unexpectedly');
+}
+
+// A 503 from the reasoner governor carries retry_after (and the triage result)
+function diagnosisError(payload) {
+    let message = payload.error || 'Diagnosis failed';
+    if (payload.retry_after) {
+        message = `Server sedang sibuk, coba lagi dalam ${payload.retry_after} detik.`;
+        if (payload.triage && payload.triage.emergency) {
+            const names = (payload.triage.findings || []).map(f => f.name).join(', ');
+            message += ` PERHATIAN: kondisi kritis terdeteksi (${names}).`;
+        }
+    }
+    return new Error(message);
+}
+
+function handleStage(stage, payload) {
+    console.log('Stage:', stage, payload);
+    if (stage === 'accepted') {
+        showTriageAlert(payload.triage);
+    }
+    const text = document.getElementById('loadingText');
+    if (text && STAGE_MESSAGES[stage]) {
+        text.textContent = STAGE_MESSAGES[stage];
+    }
+}
+
+function showTriageAlert(triage) {
+    const alert = document.getElementById('triageAlert');
+    if (!alert) return;
+
+    if (triage && triage.emergency) {
+        const names = (triage.findings || []).map(f => f.name).join(', ');
+        document.getElementById('triageFindings').textContent = names || 'Kondisi kritis terdeteksi';
+        alert.classList.remove('hidden');
+    } else {
+        alert.classList.add('hidden');
     }
 }
 
@@ -479,6 +587,8 @@ Generated by CVD Expert System
 function showLoading(show) {
     const overlay = document.getElementById('loadingOverlay');
     if (show) {
+        showTriageAlert(null);
+        document.getElementById('loadingText').textContent = 'Menjalankan Pellet Reasoner...';
         overlay.classList.remove('hidden');
     } else {
         overlay.classList.add('hidden');
@@ -586,6 +696,70 @@ function setupTooltipHandlers() {
     });
 }
 
+// ============================================================
+// Decision Boundaries from Ontology Rules
+// ============================================================
+
+// Rule thresholds per payload field ("vitals.sbp"), from /api/thresholds
+let ruleThresholds = {};
+
+function thresholdLabels(entries) {
+    const labels = new Set();
+    entries.forEach(entry => entry.leads_to.forEach(target => labels.add(target.label)));
+    return [...labels].join(', ');
+}
+
+// Nearest rule boundary above (>, >=) and below (<, <=) the current value
+function updateThresholdHint(input, field) {
+    const group = input.closest('.form-group');
+    if (!group) return;
+    let hint = group.querySelector('.threshold-hint');
+    const value = parseFloat(input.value);
+    if (isNaN(value)) {
+        hint?.remove();
+        return;
+    }
+    const entries = field.thresholds;
+    const up = entries.filter(e => (e.op === '>=' && e.value > value) || (e.op === '>' && e.value >= value));
+    const down = entries.filter(e => (e.op === '<' && e.value <= value) || (e.op === '<=' && e.value < value));
+    const parts = [];
+    if (up.length) {
+        const next = Math.min(...up.map(e => e.value));
+        parts.push(`↑ ${next} (+${+(next - value).toFixed(2)}): ${thresholdLabels(up.filter(e => e.value === next))}`);
+    }
+    if (down.length) {
+        const next = Math.max(...down.map(e => e.value));
+        parts.push(`↓ ${next} (−${+(value - next).toFixed(2)}): ${thresholdLabels(down.filter(e => e.value === next))}`);
+    }
+    if (!parts.length) {
+        hint?.remove();
+        return;
+    }
+    if (!hint) {
+        hint = document.createElement('small');
+        hint.className = 'threshold-hint';
+        group.appendChild(hint);
+    }
+    hint.textContent = parts.join(' · ');
+}
+
+async function loadRuleThresholds() {
+    try {
+        const response = await fetch(`${API_BASE}/api/thresholds`);
+        if (!response.ok) return;
+        ruleThresholds = (await response.json()).fields || {};
+        Object.entries(ruleThresholds).forEach(([name, field]) => {
+            // Form input ids are the payload keys ("vitals.sbp" -> #sbp)
+            const input = document.getElementById(name.split('.').pop());
+            if (!input) return;
+            input.addEventListener('input', () => updateThresholdHint(input, field));
+            updateThresholdHint(input, field);
+        });
+    } catch (error) {
+        console.error('Failed to load rule thresholds:', error);
+    }
+}
+
 // ============================================================
 // CALCULATORS
 // ============================================================
@@ -1029,4 +1203,5 @@ document.getElementById('liver_disease')?.addEventListener('change', () => {
 // Initialize
 console.log('CVD Expert System initialized');
 loadParameterDescriptions();
+loadRuleThresholds();
 setupTooltipHandlers();
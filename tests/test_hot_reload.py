@@ -0,0 +1,64 @@
+"""
+Hot reload smoke check against a reasoner kept busy by live traffic (stand-in services).
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.hot_reload import OntologyReloader, SmokeBusy, smoke_check  # noqa: E402
+from services.resource_governor import ReasonerBusy  # noqa: E402
+
+
+CASES = [{"demographics": {"name": "Smoke"}, "vitals": {"sbp": 150}}]
+
+
+class Service:
+    """Diagnoses after `busy` ReasonerBusy rejections (None: never)."""
+
+    ontology_version = "0" * 64
+
+    def __init__(self, busy=0, retry_after=0):
+        self.busy = busy
+        self.retry_after = retry_after
+        self.rejected = 0
+
+    def diagnose(self, payload, use_cache=True):
+        if self.busy is None or self.rejected < self.busy:
+            self.rejected += 1
+            raise ReasonerBusy("Reasoner busy: 1/1 running, 8/8 waiting", self.retry_after)
+        return {"patient_id": "Pasien_Smoke", "diagnoses": [{"class": "HipertensiStage2"}], "severity": "Sedang"}
+
+    def cleanup_patient(self, patient_id):
+        pass
+
+
+def test_smoke_check_waits_for_a_free_slot():
+    service = Service(busy=3)
+    report = smoke_check(service, CASES, busy_timeout=5)
+    assert service.rejected == 3
+    assert report[0]["diagnoses"] == ["HipertensiStage2"]
+
+
+def test_smoke_check_gives_up_at_the_busy_deadline():
+    with pytest.raises(SmokeBusy, match="Smoke case 'Smoke': reasoner busy"):
+        smoke_check(Service(busy=None, retry_after=1), CASES, busy_timeout=0.5)
+
+
+def test_reload_ends_busy_and_keeps_the_current_service(tmp_path, monkeypatch):
+    monkeypatch.setenv("ONTOLOGY_SMOKE_BUSY_S", "0")
+    path = tmp_path / "cvd.owl"
+    path.write_text("<rdf:RDF/>", encoding="utf-8")
+    current = Service()
+    swapped = []
+    reloader = OntologyReloader(str(path), lambda: current, lambda: Service(busy=None, retry_after=1),
+                                swapped.append, corpus=CASES)
+    assert reloader.trigger("admin")
+    state = reloader.wait(10)
+    assert state["status"] == "busy"
+    assert "reasoner busy" in state["error"]
+    assert swapped == []
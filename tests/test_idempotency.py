@@ -0,0 +1,79 @@
+"""
+Idempotent diagnosis submissions: replay within the window, waiting on a
+duplicate that is still running, key conflicts and failed first attempts.
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.idempotency import IdempotencyConflict, IdempotencyStore, content_hash  # noqa: E402
+from services.resource_governor import ReasonerBusy  # noqa: E402
+
+
+PAYLOAD = {"demographics": {"name": "Budi", "age": 61}, "vitals": {"sbp": 150, "dbp": 95}, "symptoms": ["pusing"]}
+
+
+def test_normalized_payloads_share_a_hash():
+    retried = {"symptoms": ["pusing", ""], "vitals": {"dbp": "95", "sbp": 150.0}, "demographics": {"age": 61, "name": " Budi "},
+               "labs": {}}
+    assert content_hash(retried) == content_hash(PAYLOAD)
+    assert content_hash(dict(PAYLOAD, vitals={"sbp": 151, "dbp": 95})) != content_hash(PAYLOAD)
+
+
+def test_duplicate_is_replayed_without_running_again():
+    store = IdempotencyStore(window=60)
+    calls = []
+    result, replayed = store.run(PAYLOAD, lambda: calls.append(1) or {"patient_id": "Pasien_Budi_1"})
+    assert not replayed
+    again, replayed = store.run(dict(PAYLOAD), lambda: calls.append(1) or {"patient_id": "Pasien_Budi_2"})
+    assert replayed and again is result
+    assert calls == [1]
+    assert store.lookup(PAYLOAD) is result
+
+
+def test_duplicate_waits_for_the_running_submission():
+    store = IdempotencyStore(window=60)
+    started, release = threading.Event(), threading.Event()
+    first = {}
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return {"patient_id": "Pasien_Budi_1"}
+
+    leader = threading.Thread(target=lambda: first.update(result=store.run(PAYLOAD, slow)))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(ReasonerBusy):
+        store.run(PAYLOAD, lambda: {"patient_id": "unused"}, timeout=0.05)
+
+    release.set()
+    result, replayed = store.run(PAYLOAD, lambda: {"patient_id": "unused"}, timeout=5)
+    leader.join(5)
+    assert replayed and result is first["result"][0]
+    assert store.snapshot()["waited"] + store.snapshot()["replayed"] == 1
+
+
+def test_key_reused_for_another_payload_conflicts():
+    store = IdempotencyStore(window=60)
+    store.run(PAYLOAD, lambda: {"patient_id": "Pasien_Budi_1"}, idempotency_key="visit-1")
+    with pytest.raises(IdempotencyConflict):
+        store.run(dict(PAYLOAD, symptoms=["nyeri_dada"]), lambda: {}, idempotency_key="visit-1")
+
+
+def test_failed_first_attempt_is_not_replayed():
+    store = IdempotencyStore(window=60)
+
+    def fails():
+        raise RuntimeError("reasoner crashed")
+
+    with pytest.raises(RuntimeError):
+        store.run(PAYLOAD, fails)
+    result, replayed = store.run(PAYLOAD, lambda: {"patient_id": "Pasien_Budi_2"})
+    assert not replayed and result["patient_id"] == "Pasien_Budi_2"
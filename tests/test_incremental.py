@@ -0,0 +1,62 @@
+"""
+Incremental re-diagnosis against a fresh diagnosis of the same observations.
+
+Runs the real ontology with the in-process `rules` backend (no JVM): a
+follow-up re-diagnosed through the session's support sets must give the same
+result as diagnosing the updated payload from scratch.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["REASONER_BACKEND"] = "rules"
+os.environ["RESULT_CACHE"] = "0"
+
+from services.incremental import diff_results  # noqa: E402
+from services.knowledge_service import KnowledgeService  # noqa: E402
+
+
+CHEST_PAIN = {"demographics": {"name": "Tono", "age": 60, "gender": "Laki-laki"},
+              "labs": {"troponin": 0.5, "ef": 30}, "symptoms": ["nyeri_dada", "sesak_napas"]}
+
+
+@pytest.fixture(scope="module")
+def ks():
+    service = KnowledgeService(os.path.join(ROOT, "cvd_sroiq_complete.owl"))
+    yield service
+    service.close()
+
+
+def follow_up(ks, payload, observations):
+    """(incremental result, fresh result) for payload updated with observations."""
+    first = ks.diagnose(payload, use_cache=False)
+    ks.update_observations(first["patient_id"], observations)
+    incremental = ks.rediagnose(first["patient_id"])
+    fresh = ks.diagnose(ks.incremental.get(first["patient_id"]).payload, use_cache=False)
+    return first, incremental, fresh
+
+
+def test_retracted_functional_value_falls_back_to_the_remaining_one(ks):
+    # Kritis (troponin) is retracted; Berat (reduced EF) still holds and was never in the delta
+    first, incremental, fresh = follow_up(ks, CHEST_PAIN, {"labs": {"troponin": 0.01}})
+    assert first["severity"] == "Kritis"
+    assert fresh["severity"] == "Berat"
+    assert incremental["severity"] == fresh["severity"]
+    assert diff_results(fresh, incremental) == {}
+
+
+def test_follow_ups_between_benchmark_patients_match_a_fresh_diagnosis(ks):
+    with open(os.path.join(ROOT, "benchmarks", "patients.json"), encoding="utf-8") as f:
+        patients = json.load(f)
+    for before in patients:
+        for after in patients:
+            if before is after:
+                continue
+            observations = {k: v for k, v in after.items() if k != "demographics"}
+            _, incremental, fresh = follow_up(ks, before, observations)
+            assert diff_results(fresh, incremental) == {}, (before["demographics"]["name"], after["demographics"]["name"])
@@ -0,0 +1,100 @@
+"""
+Memory supervisor decisions and the session hand-over of a rebuild.
+
+The supervisor's samples are stubbed (no world to grow); the hand-over runs two
+real KnowledgeService instances with the in-process `rules` backend.
+"""
+
+import gc
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["REASONER_BACKEND"] = "rules"
+os.environ["RESULT_CACHE"] = "0"
+
+from services.incremental import diff_results  # noqa: E402
+from services.knowledge_service import KnowledgeService  # noqa: E402
+from services.memory_supervisor import MemorySupervisor  # noqa: E402
+
+
+class Service:
+    """Stand-in for a KnowledgeService: only identity matters to check()."""
+
+
+class Supervisor(MemorySupervisor):
+    """Reports a fixed sample instead of measuring the world."""
+
+    def __init__(self, services, **limits):
+        self.services = services
+        self.sample = {}
+        self.recycled = []
+        super().__init__(lambda: self.services[-1], self._start_rebuild, self.recycled.append,
+                         interval=1, cooldown=0, **limits)
+
+    def _start_rebuild(self, reason):
+        return True
+
+    def measure(self, ks=None):
+        return dict(self.sample)
+
+
+def test_sessions_to_keep_is_the_most_recent_half_of_the_patient_limit():
+    supervisor = MemorySupervisor(lambda: None, lambda reason: False, max_patients=10)
+    assert supervisor.sessions_to_keep(list(range(3))) == [0, 1, 2]
+    assert supervisor.sessions_to_keep(list(range(8))) == [3, 4, 5, 6, 7]
+    assert MemorySupervisor(lambda: None, lambda reason: False, max_patients=1).sessions_to_keep([0, 1]) == []
+    assert MemorySupervisor(lambda: None, lambda reason: False, max_patients=0).sessions_to_keep([0, 1]) == [0, 1]
+
+
+def test_rss_only_overrun_recycles_only_after_a_rebuild():
+    supervisor = Supervisor([Service()], max_rss_mb=100, max_patients=10)
+    supervisor.sample = {"rss_mb": 150, "patients": 20}
+    assert supervisor.check() == "rebuild"
+
+    # Rebuild not swapped in yet: still the grown service, rebuild again
+    supervisor.sample = {"rss_mb": 150, "patients": 4}
+    assert supervisor.check() == "rebuild"
+    assert supervisor.recycled == []
+
+    # The replaced service is freed and its successor reuses its id()
+    replaced = id(supervisor.services.pop())
+    gc.collect()
+    candidates = [Service() for _ in range(50000)]
+    successor = next((c for c in candidates if id(c) == replaced), None)
+    if successor is None:
+        pytest.skip("allocator did not reuse the freed id")
+    supervisor.services.append(successor)
+    del candidates
+    assert supervisor.check() == "recycle"
+    assert len(supervisor.recycled) == 1
+
+
+@pytest.fixture(scope="module")
+def services():
+    old = KnowledgeService(os.path.join(ROOT, "cvd_sroiq_complete.owl"))
+    new = KnowledgeService(os.path.join(ROOT, "cvd_sroiq_complete.owl"))
+    yield old, new
+    old.close()
+    new.close()
+
+
+def test_rebuilt_service_adopts_recent_sessions_for_follow_ups(services):
+    old, new = services
+    supervisor = MemorySupervisor(lambda: new, lambda reason: False, max_patients=4)
+    ids = [
+        old.diagnose({"demographics": {"name": f"P{i}", "age": 50 + i, "gender": "Laki-laki"},
+                      "vitals": {"sbp": 150, "dbp": 95}}, use_cache=False)["patient_id"]
+        for i in range(3)
+    ]
+
+    assert new.adopt_sessions(supervisor.sessions_to_keep(old.incremental.export())) == 2
+    assert set(new.incremental.sessions) == set(ids[1:])
+
+    new.update_observations(ids[2], {"vitals": {"sbp": 185, "dbp": 125}})
+    follow_up = new.rediagnose(ids[2])
+    fresh = new.diagnose(new.incremental.get(ids[2]).payload, use_cache=False)
+    assert diff_results(fresh, follow_up) == {}
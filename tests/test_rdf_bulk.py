@@ -0,0 +1,148 @@
+"""
+RDF bulk dump / reload against a stub SPARQL store.
+
+The stub is a stdlib http.server speaking the three Fuseki endpoints the
+module uses (Graph Store /data, /query, /update) over an rdflib graph, so the
+round trip runs without a triple store: NDJSON export -> N-Triples dump ->
+Graph Store load -> SPARQL dump -> Turtle, plus save_diagnosis' INSERT DATA.
+"""
+
+import json
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import rdflib
+from rdflib.compare import isomorphic
+from rdflib.namespace import XSD
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.rdf_bulk import (  # noqa: E402
+    CVD, local_name, ndjson_triples, ntriples_lines, sparql_triples, upload, write_dump
+)
+from services.sparql_service import SparqlService  # noqa: E402
+
+
+ROWS = [
+    {"patient_id": "Pasien_Budi_1a2b", "patient_name": "Budi", "age": 61, "gender": "L",
+     "timestamp": "2026-10-01T08:00:00", "diagnoses": "Hipertensi Stage 2; Dislipidemia",
+     "medications": "Amlodipine", "contraindications": "", "risk_category": "Tinggi",
+     "ascvd_score": 21.5, "severity": "Sedang", "rules_fired": 7, "emergency": False,
+     "diagnosis_classes": ["HipertensiStage2", "Dislipidemia"]},
+    # Ids from older history items are not always valid IRI local names
+    {"patient_id": "legacy id/2> x", "patient_name": 'Siti "S"', "age": 48, "gender": "P",
+     "timestamp": "2026-10-02T09:30:00", "diagnoses": "Obesitas", "medications": "",
+     "contraindications": "Propranolol", "risk_category": "Sedang", "ascvd_score": None,
+     "severity": "Ringan", "rules_fired": 2, "emergency": False, "diagnosis_classes": ["Obesitas"]},
+]
+
+
+class StubStore:
+    """Graph Store (/data), query (/query) and update (/update) endpoints over one rdflib graph."""
+
+    def __init__(self):
+        self.graph = rdflib.Graph()
+        self.lock = threading.Lock()
+        self.posts = 0
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body=b"", content_type="text/plain"):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _query(self, query):
+                with store.lock:
+                    result = store.graph.query(query)
+                self._send(200, result.serialize(format="json"), "application/sparql-results+json")
+
+            def _form(self, body, field):
+                if "urlencoded" in self.headers.get("Content-Type", ""):
+                    return urllib.parse.parse_qs(body)[field][0]
+                return body
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path.endswith("/query"):
+                    return self._query(urllib.parse.parse_qs(url.query)["query"][0])
+                self._send(404)
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+                if url.path.endswith("/query"):
+                    return self._query(self._form(body, "query"))
+                with store.lock:
+                    if url.path.endswith("/update"):
+                        store.graph.update(self._form(body, "update"))
+                    elif url.path.endswith("/data"):
+                        store.graph.parse(data=body, format="nt")
+                        store.posts += 1
+                    else:
+                        return self._send(404)
+                self._send(204)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/ds"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def store():
+    stub = StubStore()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "history.ndjson"
+    path.write_text("".join(json.dumps(row) + "\n" for row in ROWS), encoding="utf-8")
+    return str(path)
+
+
+def test_local_name_encodes_only_invalid_ids():
+    assert local_name("Pasien_Budi_1a2b") == "Pasien_Budi_1a2b"
+    assert local_name("legacy id/2> x") == "legacy%20id%2F2%3E%20x"
+
+
+def test_dump_load_and_dump_again_round_trips(store, export, tmp_path):
+    nt_path = str(tmp_path / "history.nt.gz")
+    count = write_dump(ndjson_triples(export), nt_path)
+    dumped = rdflib.Graph().parse(data="".join(ntriples_lines(nt_path)), format="nt")
+    assert len(dumped) == count
+
+    stats = upload(ntriples_lines(nt_path), store.url, chunk_triples=10)
+    assert stats["triples"] == count
+    assert store.posts == stats["requests"] > 1
+    assert isomorphic(store.graph, dumped)
+
+    ttl_path = str(tmp_path / "reload.ttl")
+    assert write_dump(sparql_triples(SparqlService(store.url), page_size=1), ttl_path) == count
+    assert isomorphic(rdflib.Graph().parse(ttl_path, format="turtle"), dumped)
+
+    legacy = rdflib.URIRef(CVD + local_name("legacy id/2> x"))
+    assert (legacy, rdflib.URIRef(CVD + "memilikiNama"), rdflib.Literal("Siti 'S'", datatype=XSD.string)) in store.graph
+
+
+def test_save_diagnosis_writes_the_bulk_triples(store):
+    patient = {"demographics": {"name": "Andi", "age": 55, "gender": "L"}}
+    result = {"patient_id": "Pasien_Andi_9f", "diagnoses": [{"name": "Diabetes Tipe 2", "class": "DiabetesTipe2"}],
+              "medications": [{"name": "Metformin"}], "contraindications": [], "risk_category": "Sedang",
+              "ascvd_score": 9.1, "severity": "Sedang", "rules_fired": 3, "emergency": False}
+    assert SparqlService(store.url).save_diagnosis(patient, result)
+
+    subject = rdflib.URIRef(CVD + "Pasien_Andi_9f")
+    assert (subject, rdflib.URIRef(CVD + "memiliki"), rdflib.URIRef(CVD + "DiabetesTipe2_Instance")) in store.graph
+    assert (subject, rdflib.URIRef(CVD + "hasRecommendedMedication"), rdflib.Literal("Metformin", datatype=XSD.string)) in store.graph
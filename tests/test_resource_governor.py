@@ -0,0 +1,80 @@
+"""
+Reasoner governor admission and deadlines, with in-process functions standing
+in for reasoner runs (no JVM).
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.priority import PRIORITY_CRITICAL, PRIORITY_ROUTINE  # noqa: E402
+from services.resource_governor import ReasonerBusy, ReasonerTimeout, ResourceGovernor  # noqa: E402
+
+
+def test_deadline_stops_the_caller_but_keeps_the_slot_until_the_run_exits():
+    governor = ResourceGovernor(max_concurrent=1, max_queue=1, queue_timeout=5, deadline=0.2)
+    finished = threading.Event()
+
+    def stuck():
+        time.sleep(0.6)
+        finished.set()
+
+    with pytest.raises(ReasonerTimeout):
+        governor.run(stuck)
+    assert governor.stats["timeouts"] == 1
+
+    # The in-process run is still writing to the world: no second run may start
+    with pytest.raises(ReasonerBusy):
+        governor.run(lambda: "second", wait=False)
+    assert governor.run(lambda: "after") == "after"
+    assert finished.is_set()
+
+
+def _queued(governor, count):
+    deadline = time.monotonic() + 5
+    while governor.snapshot()["waiting"] != count:
+        assert time.monotonic() < deadline, "waiter never queued"
+        time.sleep(0.01)
+
+
+def test_critical_patient_displaces_the_routine_waiter_from_a_full_queue():
+    governor = ResourceGovernor(max_concurrent=1, max_queue=1, queue_timeout=5, deadline=5)
+    release = threading.Event()
+    outcomes = {}
+
+    def submit(name, priority, fn):
+        try:
+            outcomes[name] = governor.run(fn, priority=priority)
+        except ReasonerBusy as e:
+            outcomes[name] = e
+
+    running = threading.Thread(target=submit, args=("running", PRIORITY_ROUTINE, release.wait))
+    running.start()
+    while governor.snapshot()["running"] != 1:
+        time.sleep(0.01)
+    routine = threading.Thread(target=submit, args=("routine", PRIORITY_ROUTINE, lambda: "routine"))
+    routine.start()
+    _queued(governor, 1)
+
+    critical = threading.Thread(target=submit, args=("critical", PRIORITY_CRITICAL, lambda: "critical"))
+    critical.start()
+    routine.join(5)
+    assert isinstance(outcomes["routine"], ReasonerBusy)
+    assert "Displaced" in str(outcomes["routine"])
+    _queued(governor, 1)
+
+    # A full queue of higher priority rejects a routine request at once
+    with pytest.raises(ReasonerBusy, match="queue is full"):
+        governor.run(lambda: "late", priority=PRIORITY_ROUTINE)
+
+    release.set()
+    running.join(5)
+    critical.join(5)
+    assert outcomes["critical"] == "critical"
+    assert governor.stats["displaced"] == 1
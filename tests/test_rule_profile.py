@@ -0,0 +1,53 @@
+"""
+Rule firings and per-rule counters of the rule engine replay.
+
+R11 (systolic >= 140) and R13 (diastolic >= 90) both derive Hipertensi Stage 2;
+when both match, R13 fires without adding a fact and must still count.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["REASONER_BACKEND"] = "rules"
+os.environ["RESULT_CACHE"] = "0"
+
+from services.knowledge_service import KnowledgeService  # noqa: E402
+from services.rule_profile import reconcile, replay  # noqa: E402
+
+
+STAGE_2 = {"demographics": {"name": "Rudi", "age": 58, "gender": "Laki-laki"}, "vitals": {"sbp": 165, "dbp": 100}}
+
+
+@pytest.fixture(scope="module")
+def ks():
+    service = KnowledgeService(os.path.join(ROOT, "cvd_sroiq_complete.owl"))
+    yield service
+    service.close()
+
+
+def test_rule_deriving_an_existing_fact_still_fires(ks):
+    result = ks.diagnose(STAGE_2, use_cache=False)
+    inputs, fired, _ = replay(ks.rule_engine, STAGE_2)
+    confirmed, _ = reconcile(inputs, fired, ks.asserted_facts(result["patient_id"]))
+    confirmed = {rule.id: derived for rule, derived in confirmed}
+    assert confirmed["R11"] == confirmed["R13"] == [("memiliki", "HipertensiStage2_Instance")]
+    assert result["rules_fired"] == len(confirmed)
+
+    events = {e["rule"]: e for e in ks.explain(STAGE_2, result["patient_id"]) if e["type"] == "rule"}
+    assert events["R11"]["new_facts"] == 1
+    assert events["R13"]["new_facts"] == 0
+
+
+def test_profile_counts_firings_and_new_fact_firings_apart(ks):
+    ks.rule_profile.reset()
+    ks.diagnose(STAGE_2, use_cache=False)
+    profile = ks.get_rule_profile()
+    by_rule = {r["rule"]: r for r in profile["by_rule"]}
+    assert by_rule["R11"]["firings"] == by_rule["R11"]["new_fact_firings"] == 1
+    assert (by_rule["R13"]["firings"], by_rule["R13"]["new_fact_firings"], by_rule["R13"]["facts"]) == (1, 0, 0)
+    assert "R13" in profile["redundant"]
+    assert "R13" not in profile["never_fired"]
@@ -0,0 +1,40 @@
+"""
+Shadow evaluator candidate lifecycle, with stand-in services (no ontology load).
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.result_cache import file_sha256  # noqa: E402
+from services.shadow import ShadowEvaluator, ShadowReport  # noqa: E402
+
+
+class Candidate:
+    """Stand-in for a KnowledgeService built from the candidate file."""
+
+    def __init__(self, path):
+        self.ontology_version = file_sha256(path)
+        self.retired = False
+
+    def retire(self, on_drained=None):
+        self.retired = True
+
+
+def test_changed_candidate_file_retires_the_previous_service(tmp_path):
+    path = tmp_path / "candidate.owl"
+    path.write_text("<rdf:RDF/>", encoding="utf-8")
+    built = []
+
+    def build(candidate_path):
+        built.append(Candidate(candidate_path))
+        return built[-1]
+
+    shadow = ShadowEvaluator(build, str(path), sample_rate=1, report=ShadowReport(str(tmp_path / "shadow.sqlite3")))
+    assert shadow._candidate_service() is shadow._candidate_service() is built[0]
+
+    path.write_text("<rdf:RDF><!-- edited --></rdf:RDF>", encoding="utf-8")
+    assert shadow._candidate_service() is built[1]
+    assert built[0].retired and not built[1].retired